@@ -1,6 +1,9 @@
+import logging
 import multiprocessing
 import os
 import time
+import zlib
+import psycopg2
 from typing import Dict, Any, List
 from datetime import datetime
 import uuid
@@ -8,21 +11,107 @@ import uuid
 from siirto.configuration import configuration
 from siirto.database_operators.base_database_operator import BaseDataBaseOperator
 from siirto.logger import create_rotating_log
-from siirto.plugins.cdc.cdc_base import CDCBase
-from siirto.plugins.full_load.full_load_base import FullLoadBase
+from siirto.plugins.cdc.cdc_base import CDCBase, DEFAULT_SLOT_NAME, SLOT_NAME_PATTERN
+from siirto.plugins.full_load.full_load_base import FullLoadBase, FULL_LOAD_APPLICATION_NAME
 from siirto.shared.enums import DatabaseOperatorType, LoadType
+from siirto.shared.throttle import Throttle
+
+# lowest fraction of the full load rates, while the source is under load
+MIN_THROTTLE_RATE_FACTOR = 0.05
 
 
 class PostgresOperator(BaseDataBaseOperator):
     """
     Postgres default operator implements BaseDataBaseOperator
+
+    :param max_parallel_full_loads: maximum number of full load processes
+        running at the same time. Tables are scheduled largest first, using
+        their size in the catalog. Default is None, one process per table,
+        all started at once
+    :type max_parallel_full_loads: int
+    :param full_load_pack_size_bytes: tables smaller than this size are
+        packed together into one full load process, up to this size in
+        total per process. The tables of a process are loaded one after
+        the other on a single connection. Default is None, no packing
+    :type full_load_pack_size_bytes: int
+    :param full_load_max_bytes_per_second: maximum bytes per second read
+        by all the full load workers together. Default is None, no limit
+    :type full_load_max_bytes_per_second: float
+    :param full_load_max_rows_per_second: maximum rows per second read
+        by all the full load workers together. Default is None, no limit
+    :type full_load_max_rows_per_second: float
+    :param full_load_throttle_max_active_backends: the full load rates are
+        halved (down to 5%) while the source has more active backends
+        (other than the full loads of siirto, by their application_name)
+        and raised back by 10% steps once it has less. Default is None,
+        not checked
+    :type full_load_throttle_max_active_backends: int
+    :param full_load_throttle_max_replication_lag_bytes: same as
+        `full_load_throttle_max_active_backends`, for the replication lag
+        of the standbys of the source, in bytes. Default is None, not checked
+    :type full_load_throttle_max_replication_lag_bytes: int
+    :param cdc_slot_name: replication slot consumed by the cdc process.
+        Default is `siirto_slot`
+    :type cdc_slot_name: str
+    :param cdc_slot_count: number of replication slots the tables are
+        spread over, `{cdc_slot_name}_{index}`, each consumed by its own
+        cdc process. A table is assigned to a slot by a hash of its name,
+        so it stays on the same slot across the runs. Changing it moves
+        tables to other slots, the changes of a moved table pending in
+        its previous slot are not written. Default is None, all the
+        tables on `cdc_slot_name`
+    :type cdc_slot_count: int
     """
 
     operator_type = DatabaseOperatorType.Postgres
     operator_name = "Postgres-Default"
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self,
+                 *args,
+                 max_parallel_full_loads: int = None,
+                 full_load_pack_size_bytes: int = None,
+                 full_load_max_bytes_per_second: float = None,
+                 full_load_max_rows_per_second: float = None,
+                 full_load_throttle_max_active_backends: int = None,
+                 full_load_throttle_max_replication_lag_bytes: int = None,
+                 cdc_slot_name: str = None,
+                 cdc_slot_count: int = None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
+        if max_parallel_full_loads is not None and max_parallel_full_loads <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"max_parallel_full_loads `{max_parallel_full_loads}`"
+            raise ValueError(ex_msg)
+        if full_load_pack_size_bytes is not None and full_load_pack_size_bytes <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"full_load_pack_size_bytes `{full_load_pack_size_bytes}`"
+            raise ValueError(ex_msg)
+        if cdc_slot_count is not None and cdc_slot_count <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"cdc_slot_count `{cdc_slot_count}`"
+            raise ValueError(ex_msg)
+        self.cdc_slot_name = cdc_slot_name or DEFAULT_SLOT_NAME
+        self.cdc_slot_count = cdc_slot_count
+        for slot_name in self._get_cdc_slot_names():
+            if not SLOT_NAME_PATTERN.match(slot_name):
+                ex_msg = f"Incorrect value provided for " \
+                         f"cdc_slot_name `{self.cdc_slot_name}`"
+                raise ValueError(ex_msg)
+        self.max_parallel_full_loads = max_parallel_full_loads
+        # shared by all the full load processes, created before they start
+        self.full_load_throttle = None
+        if full_load_max_bytes_per_second is not None \
+                or full_load_max_rows_per_second is not None:
+            self.full_load_throttle = Throttle(full_load_max_bytes_per_second,
+                                               full_load_max_rows_per_second)
+        self.full_load_throttle_max_active_backends = full_load_throttle_max_active_backends
+        self.full_load_throttle_max_replication_lag_bytes = \
+            full_load_throttle_max_replication_lag_bytes
+        # connection checking the load of the source, kept between the checks
+        self._throttle_connection = None
+        self.full_load_pack_size_bytes = full_load_pack_size_bytes
+        # table groups waiting for a full load process, largest first
+        self.pending_full_loads = []
         self.full_load_plugin = FullLoadBase.get_object(self.full_load_plugin_name)
         self.cdc_plugin = CDCBase.get_object(self.cdc_plugin_name)
         self._validate_input_parameters()
@@ -34,7 +123,9 @@ class PostgresOperator(BaseDataBaseOperator):
                      f"for cdc plugin `{self.cdc_plugin_name}`"
             raise ValueError(ex_msg)
         if self.full_load_plugin is None \
-                and self.load_type in [LoadType.Full_Load, LoadType.Full_Load_And_CDC]:
+                and self.load_type in [LoadType.Full_Load,
+                                       LoadType.Full_Load_And_CDC,
+                                       LoadType.Incremental]:
             ex_msg = f"Incorrect value provided for " \
                      f"full load plugin `{self.full_load_plugin_name}`"
             raise ValueError(ex_msg)
@@ -55,18 +146,29 @@ class PostgresOperator(BaseDataBaseOperator):
         full_load_jobs = self._process_full_load(full_load_jobs)
 
         # start CDC
-        # this will run on main thread
-        cdc_process = self._process_cdc()
+        # one process per replication slot
+        cdc_processes = self._process_cdc()
 
         while True:
             # sleep for 2 seconds, before next check
             time.sleep(2)
             processes_running = False
+            if not self.terminate_process_signal:
+                # start the waiting full loads in the free slots
+                full_load_jobs = self._start_pending_full_loads(full_load_jobs)
+            if len(self.pending_full_loads) > 0 and not self.terminate_process_signal:
+                processes_running = True
             for full_load_job in full_load_jobs:
                 if full_load_job.is_alive():
                     processes_running = True
-            if cdc_process is not None and cdc_process.is_alive():
-                processes_running = True
+            if processes_running:
+                self._adapt_full_load_throttle()
+            else:
+                # full loads are completed
+                self._close_throttle_connection()
+            for cdc_process in cdc_processes:
+                if cdc_process.is_alive():
+                    processes_running = True
             if not processes_running:
                 break
             # if asked to terminate the process from outside
@@ -74,13 +176,18 @@ class PostgresOperator(BaseDataBaseOperator):
                 for full_load_job in full_load_jobs:
                     if full_load_job.is_alive():
                         full_load_job.terminate()
-                if cdc_process is not None and cdc_process.is_alive():
-                    cdc_process.terminate()
+                for cdc_process in cdc_processes:
+                    if cdc_process.is_alive():
+                        cdc_process.terminate()
 
-    def _process_cdc(self):
+    def _process_cdc(self) -> List[Any]:
         """
-        Process the CDC workloads
+        Process the CDC workloads.
+        One process per replication slot, consuming the changes of
+        the tables of the slot
+        :return: cdc processes
         """
+        cdc_processes = []
         if self.load_type in [LoadType.CDC, LoadType.Full_Load_And_CDC]:
             output_location_for_cdc = os.path.join(self.output_location,
                                                    "cdc")
@@ -88,61 +195,274 @@ class PostgresOperator(BaseDataBaseOperator):
                 os.mkdir(self.output_location)
             if not os.path.exists(output_location_for_cdc):
                 os.mkdir(output_location_for_cdc)
-            cdc_init_params = {
-                "output_folder_location": output_location_for_cdc,
-                "connection_string": self.connection_string,
-                "table_names": self.table_names,
-            }
-            cdc_process = multiprocessing.Process(
-                target=PostgresOperator._run_cdc_process,
-                args=(self.cdc_plugin_name, cdc_init_params))
-            cdc_process.name = "siirto_cdc_" + str(uuid.uuid4())
-            cdc_process.start()
-            return cdc_process
-        return None
+            for slot_name, table_names in self._plan_cdc_slots().items():
+                cdc_init_params = {
+                    "output_folder_location": output_location_for_cdc,
+                    "connection_string": self.connection_string,
+                    "table_names": table_names,
+                    "slot_name": slot_name,
+                }
+                # logs of every slot in a folder of their own, once sharded
+                log_relative_path = "cdc" if self.cdc_slot_count is None \
+                    else f"cdc/{slot_name}"
+                cdc_process = multiprocessing.Process(
+                    target=PostgresOperator._run_cdc_process,
+                    args=(self.cdc_plugin_name, cdc_init_params, log_relative_path))
+                cdc_process.name = "siirto_cdc_" + str(uuid.uuid4())
+                cdc_process.start()
+                cdc_processes.append(cdc_process)
+        return cdc_processes
+
+    def _get_cdc_slot_names(self) -> List[str]:
+        """
+        Replication slots of the cdc processes
+        :return: slot names
+        """
+        if self.cdc_slot_count is None:
+            return [self.cdc_slot_name]
+        return [f"{self.cdc_slot_name}_{slot_index}"
+                for slot_index in range(self.cdc_slot_count)]
+
+    def _plan_cdc_slots(self) -> Dict[str, List[str]]:
+        """
+        Spread the tables over the replication slots. A table is
+        assigned by a hash of its name, so it stays on the same slot
+        across the runs and the tables added later do not move the
+        others. Slots without tables are left out
+        :return: slot name -> table names
+        """
+        slot_names = self._get_cdc_slot_names()
+        if len(slot_names) == 1:
+            return {slot_names[0]: self.table_names}
+        slot_table_names = {}
+        for table_name in self.table_names:
+            slot_name = slot_names[zlib.crc32(table_name.encode()) % len(slot_names)]
+            slot_table_names.setdefault(slot_name, []).append(table_name)
+        return {slot_name: slot_table_names[slot_name]
+                for slot_name in slot_names if slot_name in slot_table_names}
 
     def _process_full_load(self, full_load_jobs: List[Any]):
         """
         Process the full load jobs.
-        One process/job for every table.
+        One process/job for every table (or group of small tables),
+        at most `max_parallel_full_loads` processes at the same time.
+        Incremental load runs the full load plugin in incremental mode.
         :param full_load_jobs: captures the processes
         :type full_load_jobs: List
         :return: full_load_jobs
         """
-        if self.load_type in [LoadType.Full_Load, LoadType.Full_Load_And_CDC]:
+        if self.load_type in [LoadType.Full_Load,
+                              LoadType.Full_Load_And_CDC,
+                              LoadType.Incremental]:
+            if self.max_parallel_full_loads is None and self.full_load_pack_size_bytes is None:
+                self.pending_full_loads = [[table_name] for table_name in self.table_names]
+            else:
+                self.pending_full_loads = self._plan_full_loads(self._get_table_sizes())
+            full_load_jobs = self._start_pending_full_loads(full_load_jobs)
+        return full_load_jobs
+
+    def _get_table_sizes(self) -> Dict[str, int]:
+        """
+        Size of the tables in bytes, from the catalog.
+        Size of a partitioned table is the size of its partitions,
+        size of a table which can not be looked up is 0
+        :return: table name -> size in bytes
+        """
+        table_sizes = {}
+        connection = psycopg2.connect(self.connection_string)
+        try:
+            cursor = connection.cursor()
             for table_name in self.table_names:
-                full_load_output_location_of_table = os.path.join(self.output_location,
-                                                                  "full_load")
-                if not os.path.exists(full_load_output_location_of_table):
-                    os.mkdir(full_load_output_location_of_table)
-                output_location_of_table = os.path.join(full_load_output_location_of_table,
-                                                        table_name.replace(".", "_"))
-                if not os.path.exists(output_location_of_table):
-                    os.mkdir(output_location_of_table)
-
-                full_load_init_params = {
-                    "output_folder_location": output_location_of_table,
-                    "connection_string": self.connection_string,
-                    "table_name": table_name,
-                    "notify_on_completion": self.on_full_load_completed
-                }
-                full_load_process = multiprocessing.Process(
-                    target=PostgresOperator._run_full_load_process_for_table,
-                    args=(self.full_load_plugin_name, full_load_init_params))
-                full_load_process.name = "siirto_full_load_" + str(uuid.uuid4())
-                full_load_jobs.append(full_load_process)
-                full_load_process.start()
+                try:
+                    table_sizes[table_name] = self._get_table_size(cursor, table_name)
+                except psycopg2.Error as exception:
+                    # full load of the table reports the error
+                    self.logger.warning(f"Not able to get the size of {table_name}: {exception}")
+                    connection.rollback()
+                    table_sizes[table_name] = 0
+        finally:
+            connection.close()
+        return table_sizes
+
+    @staticmethod
+    def _get_table_size(cursor, table_name: str) -> int:
+        """
+        Size of a table in bytes, from the catalog
+        :param cursor: cursor to query the catalog
+        :param table_name: table name
+        :type table_name: str
+        :return: size in bytes
+        """
+        # pg_inherits rather than pg_partition_tree (postgres 12+)
+        cursor.execute("WITH RECURSIVE partitions AS ("
+                       "SELECT %s::regclass::oid AS relid "
+                       "UNION ALL "
+                       "SELECT i.inhrelid FROM pg_inherits i "
+                       "JOIN partitions p ON i.inhparent = p.relid "
+                       "JOIN pg_class pc ON pc.oid = p.relid AND pc.relkind = 'p') "
+                       "SELECT coalesce(sum(c.relpages::bigint), 0) "
+                       "* current_setting('block_size')::bigint, "
+                       "coalesce(sum(pg_total_relation_size(c.oid)), 0) "
+                       "FROM partitions AS p "
+                       "JOIN pg_class AS c ON c.oid = p.relid",
+                       (table_name,))
+        estimated_size, current_size = cursor.fetchone()
+        # relpages is 0 till the table is vacuumed/analyzed
+        return max(int(estimated_size), int(current_size))
+
+    def _plan_full_loads(self, table_sizes: Dict[str, int]) -> List[List[str]]:
+        """
+        Group the tables into full load processes, largest first.
+        Tables smaller than `full_load_pack_size_bytes` are packed together
+        :param table_sizes: table name -> size in bytes
+        :type table_sizes: Dict[str, int]
+        :return: table names of every process
+        """
+        table_names = sorted(self.table_names,
+                             key=lambda table_name: table_sizes[table_name],
+                             reverse=True)
+        groups = []
+        pack, pack_size = [], 0
+        for table_name in table_names:
+            table_size = table_sizes[table_name]
+            if self.full_load_pack_size_bytes is None \
+                    or table_size >= self.full_load_pack_size_bytes:
+                groups.append(([table_name], table_size))
+                continue
+            if len(pack) > 0 and pack_size + table_size > self.full_load_pack_size_bytes:
+                groups.append((pack, pack_size))
+                pack, pack_size = [], 0
+            pack.append(table_name)
+            pack_size += table_size
+        if len(pack) > 0:
+            groups.append((pack, pack_size))
+        groups.sort(key=lambda group: group[1], reverse=True)
+        return [group_table_names for group_table_names, _ in groups]
+
+    def _start_pending_full_loads(self, full_load_jobs: List[Any]):
+        """
+        Start the waiting full loads, up to `max_parallel_full_loads`
+        running processes
+        :param full_load_jobs: captures the processes
+        :type full_load_jobs: List
+        :return: full_load_jobs
+        """
+        running_job_count = len([full_load_job for full_load_job in full_load_jobs
+                                 if full_load_job.is_alive()])
+        while len(self.pending_full_loads) > 0 \
+                and (self.max_parallel_full_loads is None
+                     or running_job_count < self.max_parallel_full_loads):
+            table_names = self.pending_full_loads.pop(0)
+            full_load_init_params_list = [self._get_full_load_init_params(table_name)
+                                          for table_name in table_names]
+            full_load_process = multiprocessing.Process(
+                target=PostgresOperator._run_full_load_process_for_tables,
+                args=(self.full_load_plugin_name, full_load_init_params_list))
+            full_load_process.name = "siirto_full_load_" + str(uuid.uuid4())
+            full_load_jobs.append(full_load_process)
+            full_load_process.start()
+            running_job_count += 1
         return full_load_jobs
 
+    def _get_full_load_init_params(self, table_name: str) -> Dict:
+        """
+        Create the output location and the init params of the
+        full load plugin for a table
+        :param table_name: table name
+        :type table_name: str
+        :return: full load init params
+        """
+        incremental = self.load_type == LoadType.Incremental
+        full_load_output_location_of_table = os.path.join(self.output_location,
+                                                          "incremental" if incremental
+                                                          else "full_load")
+        if not os.path.exists(full_load_output_location_of_table):
+            os.makedirs(full_load_output_location_of_table)
+        output_location_of_table = os.path.join(full_load_output_location_of_table,
+                                                table_name.replace(".", "_"))
+        if not os.path.exists(output_location_of_table):
+            os.mkdir(output_location_of_table)
+
+        return {
+            "output_folder_location": output_location_of_table,
+            "connection_string": self.connection_string,
+            "table_name": table_name,
+            "notify_on_completion": self.on_full_load_completed,
+            "incremental": incremental,
+            "throttle": self.full_load_throttle
+        }
+
+    def _adapt_full_load_throttle(self) -> None:
+        """
+        Lower the full load rates while the source is under load
+        (active backends or replication lag above the limits),
+        raise them back once it is not. Backends of the full loads
+        (`FULL_LOAD_APPLICATION_NAME`) are not counted as load.
+        The connection is kept for the next check, reopened on error
+        """
+        if self.full_load_throttle is None \
+                or (self.full_load_throttle_max_active_backends is None
+                    and self.full_load_throttle_max_replication_lag_bytes is None):
+            return
+        source_overloaded = False
+        try:
+            if self._throttle_connection is None or self._throttle_connection.closed:
+                self._throttle_connection = psycopg2.connect(self.connection_string)
+                self._throttle_connection.autocommit = True
+            cursor = self._throttle_connection.cursor()
+            if self.full_load_throttle_max_active_backends is not None:
+                cursor.execute("SELECT count(*) FROM pg_stat_activity "
+                               "WHERE state = 'active' "
+                               "AND backend_type = 'client backend' "
+                               "AND pid <> pg_backend_pid() "
+                               "AND application_name <> %s",
+                               (FULL_LOAD_APPLICATION_NAME,))
+                active_backends = cursor.fetchone()[0]
+                if active_backends > self.full_load_throttle_max_active_backends:
+                    source_overloaded = True
+            if self.full_load_throttle_max_replication_lag_bytes is not None:
+                cursor.execute("SELECT coalesce(max(pg_wal_lsn_diff("
+                               "pg_current_wal_lsn(), replay_lsn)), 0) "
+                               "FROM pg_stat_replication")
+                replication_lag = cursor.fetchone()[0]
+                if replication_lag > self.full_load_throttle_max_replication_lag_bytes:
+                    source_overloaded = True
+        except psycopg2.Error as exception:
+            self.logger.warning(f"Not able to check the load of the source: {exception}")
+            self._close_throttle_connection()
+            return
+        rate_factor = self.full_load_throttle.rate_factor
+        if source_overloaded:
+            rate_factor = max(rate_factor / 2, MIN_THROTTLE_RATE_FACTOR)
+        else:
+            rate_factor = min(rate_factor + 0.1, 1.0)
+        if rate_factor != self.full_load_throttle.rate_factor:
+            self.full_load_throttle.rate_factor = rate_factor
+            self.logger.info(f"Full load rate set to {rate_factor:.0%} of the maximum")
+
+    def _close_throttle_connection(self) -> None:
+        """
+        Close the connection checking the load of the source
+        """
+        if self._throttle_connection is not None:
+            try:
+                self._throttle_connection.close()
+            except psycopg2.Error:
+                pass
+            self._throttle_connection = None
+
     @staticmethod
     def _run_cdc_process(cdc_plugin_name: str,
-                         cdc_init_params: Dict) -> None:
+                         cdc_init_params: Dict,
+                         log_relative_path: str = "cdc") -> None:
         """
         Worker process for cdc process to complete
         :param cdc_plugin_name: plugin to be used
         :type cdc_plugin_name: str
         :param cdc_init_params:
         :type cdc_init_params:
+        :param log_relative_path: relative path of the logs of the process
+        :type log_relative_path: str
         """
 
         cdc_plugin = CDCBase.get_object(cdc_plugin_name)
@@ -152,7 +472,7 @@ class PostgresOperator(BaseDataBaseOperator):
                 cdc_init_params,
                 plugin_parameters
             )
-        create_rotating_log("cdc", "siirto.log", "siirto")
+        create_rotating_log(log_relative_path, "siirto.log", "siirto")
         cdc_object = cdc_plugin(**cdc_init_params)
         cdc_object.setup_graceful_shutdown()
         cdc_object.execute()
@@ -181,6 +501,54 @@ class PostgresOperator(BaseDataBaseOperator):
         full_load_object.setup_graceful_shutdown()
         full_load_object.execute()
 
+    @staticmethod
+    def _run_full_load_process_for_tables(full_load_plugin_name: str,
+                                          full_load_init_params_list: List[Dict]) -> None:
+        """
+        Worker process for the full load of a group of tables.
+        Tables are loaded one after the other, reusing a single connection.
+        A failed table is reported and the next tables are still loaded
+        :param full_load_plugin_name: plugin to be used
+        :type full_load_plugin_name: str
+        :param full_load_init_params_list: init params of every table
+        :type full_load_init_params_list: List[Dict]
+        """
+        if len(full_load_init_params_list) == 1:
+            PostgresOperator._run_full_load_process_for_table(full_load_plugin_name,
+                                                              full_load_init_params_list[0])
+            return
+        logger = logging.getLogger("siirto")
+        connection_string = full_load_init_params_list[0]["connection_string"]
+        connection = psycopg2.connect(connection_string,
+                                      application_name=FULL_LOAD_APPLICATION_NAME)
+        failed_table_names = []
+        try:
+            for full_load_init_params in full_load_init_params_list:
+                if connection.closed:
+                    connection = psycopg2.connect(connection_string,
+                                                  application_name=FULL_LOAD_APPLICATION_NAME)
+                full_load_init_params["connection"] = connection
+                log_handlers = list(logger.handlers)
+                try:
+                    PostgresOperator._run_full_load_process_for_table(full_load_plugin_name,
+                                                                      full_load_init_params)
+                except Exception as exception:
+                    table_name = full_load_init_params["table_name"]
+                    logger.exception(f"Full load failed for {table_name}")
+                    failed_table_names.append(table_name)
+                    if full_load_init_params.get("notify_on_completion") is not None:
+                        full_load_init_params["notify_on_completion"](
+                            status="failed", table_name=table_name, error=str(exception))
+                finally:
+                    # next table logs to its own log file
+                    for log_handler in logger.handlers[len(log_handlers):]:
+                        logger.removeHandler(log_handler)
+                        log_handler.close()
+        finally:
+            connection.close()
+        if len(failed_table_names) > 0:
+            raise RuntimeError(f"Full load failed for {', '.join(failed_table_names)}")
+
     @staticmethod
     def append_plugin_parameter_from_configuration(init_params, plugin_parameters):
         for plugin_parameter in plugin_parameters.keys():
@@ -1,10 +1,16 @@
 import importlib
 import os
+import re
 from typing import List
 
 from siirto.base import Base
 from siirto.shared.enums import PlugInType
 
+# replication slot used when no slot name is given
+DEFAULT_SLOT_NAME = "siirto_slot"
+# postgres replication slot names, lower case letters, numbers and underscores
+SLOT_NAME_PATTERN = re.compile(r"^[a-z0-9_]{1,63}$")
+
 
 class CDCBase(Base):
     """
@@ -24,6 +30,9 @@ class CDCBase(Base):
     :param table_names: table names to be copied. Table name should
         be schema.table_name. for example, public.user_detail
     :type table_names: List[str]
+    :param slot_name: replication slot to consume the changes from,
+        created if missing. Default is `siirto_slot`
+    :type slot_name: str
        """
 
     # plugin type and plugin name
@@ -34,6 +43,7 @@ class CDCBase(Base):
                  output_folder_location: str = None,
                  connection_string: str = None,
                  table_names: List[str] = [],
+                 slot_name: str = DEFAULT_SLOT_NAME,
                  *args,
                  **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -49,11 +59,17 @@ class CDCBase(Base):
                 or not isinstance(table_names, list):
             ex_msg = "Table name is None or Empty"
             raise ValueError(ex_msg)
+        if slot_name is None or not SLOT_NAME_PATTERN.match(slot_name):
+            ex_msg = f"Incorrect value provided for slot_name `{slot_name}`"
+            raise ValueError(ex_msg)
         self.output_folder_location = output_folder_location
         self.connection_string = connection_string
         self.table_names = table_names
+        self.slot_name = slot_name
         self.is_running = True
         self.status = "not started"
+        # metrics of the running plugin, name -> value
+        self.metrics = {}
 
     def execute(self):
         """
@@ -0,0 +1,385 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+
+
+class CDCFileWriter:
+    """
+    Writes the change data of a table to `{table_name}_cdc_{index}.csv`
+    files, one change per line.
+
+    By default every batch of changes is written to a new file.
+    With a rotation policy (`file_size_bytes`, `file_max_records` and/or
+    `file_max_age_seconds`), the current file is kept open and changes
+    are appended to it across the batches. The next file is started
+    once the current file reaches `file_size_bytes` bytes or
+    `file_max_records` changes, or is open for `file_max_age_seconds`
+    seconds. Written changes are flushed at the end of every batch, and
+    are durable once `sync` is called.
+
+    A writer can be resumed from its `state`. The file being written is
+    then truncated to the bytes written as of the state when it is
+    opened again, the changes written after it are sent by the slot
+    again. Every other file is created by the writer, an existing file
+    (written by the writer of another slot) is never written to, the
+    next index is used instead.
+
+    :param cdc_folder_for_table: folder of the table cdc files
+    :type cdc_folder_for_table: str
+    :param table_name: table name, used in the file name
+    :type table_name: str
+    :param file_index: index of the file to write next
+    :type file_index: int
+    :param file_size_bytes: number of bytes after which a new file
+        will be created
+    :type file_size_bytes: int
+    :param file_max_records: number of changes after which a new file
+        will be created
+    :type file_max_records: int
+    :param file_max_age_seconds: seconds after which a new file will
+        be created, the file is closed by `rotate_if_due` even when
+        there are no more changes
+    :type file_max_age_seconds: float
+    :param file_byte_count: bytes written in the file `file_index`,
+        when resumed
+    :type file_byte_count: int
+    :param file_record_count: changes written in the file `file_index`,
+        when resumed
+    :type file_record_count: int
+    :param file_opened_at: time the file `file_index` was opened at,
+        when resumed. None when the file was not opened
+    :type file_opened_at: float
+    """
+
+    def __init__(self,
+                 cdc_folder_for_table: str,
+                 table_name: str,
+                 file_index: int = 1,
+                 file_size_bytes: int = None,
+                 file_max_records: int = None,
+                 file_max_age_seconds: float = None,
+                 file_byte_count: int = 0,
+                 file_record_count: int = 0,
+                 file_opened_at: float = None) -> None:
+        for parameter_name, parameter_value in [("file_size_bytes", file_size_bytes),
+                                                ("file_max_records", file_max_records),
+                                                ("file_max_age_seconds", file_max_age_seconds)]:
+            if parameter_value is not None and parameter_value <= 0:
+                raise ValueError(f"Incorrect value provided for "
+                                 f"{parameter_name} `{parameter_value}`")
+        self.cdc_folder_for_table = cdc_folder_for_table
+        self.table_name = table_name
+        self.file_index = file_index
+        self.file_size_bytes = file_size_bytes
+        self.file_max_records = file_max_records
+        self.file_max_age_seconds = file_max_age_seconds
+        self._current_file = None
+        self._current_file_byte_count = file_byte_count
+        self._current_file_record_count = file_record_count
+        self._current_file_opened_at = file_opened_at
+        # files closed and not synced yet
+        self._unsynced_file_paths = []
+        # whether files were created since the last sync
+        self._has_new_files = False
+        # writes and rotations may come from different threads
+        self._lock = threading.Lock()
+
+    @property
+    def file_to_write(self) -> str:
+        """ file receiving the next changes """
+        return os.path.join(self.cdc_folder_for_table,
+                            f"{self.table_name}_cdc_{self.file_index}.csv")
+
+    @property
+    def state(self) -> Dict:
+        """ file being written, to resume the writer from """
+        with self._lock:
+            return self._state()
+
+    @property
+    def has_rotation_policy(self) -> bool:
+        """ whether the files are kept open across the batches """
+        return self.file_size_bytes is not None \
+            or self.file_max_records is not None \
+            or self.file_max_age_seconds is not None
+
+    def write(self, changes: List[str]) -> None:
+        """
+        Write a batch of changes
+        :param changes: changes, serialized as json
+        :type changes: List[str]
+        """
+        with self._lock:
+            self._rotate_if_due()
+            for change in changes:
+                if self._current_file is None:
+                    self._open()
+                change = change.encode()
+                if self._current_file_byte_count > 0:
+                    change = b"\n" + change
+                self._current_file.write(change)
+                self._current_file_byte_count += len(change)
+                self._current_file_record_count += 1
+                if self._is_full():
+                    self._rotate()
+            if self._current_file is not None:
+                self._current_file.flush()
+            if not self.has_rotation_policy:
+                # a file per batch
+                self._rotate()
+
+    def sync(self, fsync: bool = True) -> Tuple[Dict, bool]:
+        """
+        Flush the files written since the last sync, and fsync them
+        :param fsync: whether to fsync the files, flushed only otherwise
+        :type fsync: bool
+        :return: state of the writer as of the sync and whether files
+            were created in the folder since the last sync
+        """
+        with self._lock:
+            if self._current_file is not None:
+                self._current_file.flush()
+                if fsync:
+                    os.fsync(self._current_file.fileno())
+            if fsync:
+                for file_path in self._unsynced_file_paths:
+                    fsync_path(file_path)
+            self._unsynced_file_paths = []
+            has_new_files = self._has_new_files
+            self._has_new_files = False
+            return self._state(), has_new_files
+
+    def rotate_if_due(self) -> bool:
+        """
+        Close the current file, once it is open for `file_max_age_seconds`
+        :return: True when the file was closed
+        """
+        with self._lock:
+            return self._rotate_if_due()
+
+    def close(self) -> None:
+        """
+        Close the current file, the next changes are written to the next file
+        """
+        with self._lock:
+            self._rotate()
+
+    def _state(self) -> Dict:
+        return {"file_index": self.file_index,
+                "file_byte_count": self._current_file_byte_count,
+                "file_record_count": self._current_file_record_count,
+                "file_opened_at": self._current_file_opened_at}
+
+    def _open(self) -> None:
+        if self._current_file_opened_at is not None and os.path.exists(self.file_to_write):
+            file_size = os.path.getsize(self.file_to_write)
+            if file_size >= self._current_file_byte_count:
+                # file being resumed, drop what was written after the state
+                # the writer was resumed from
+                self._current_file = open(self.file_to_write, "ab")
+                if file_size > self._current_file_byte_count:
+                    self._current_file.truncate(self._current_file_byte_count)
+                return
+            # not synced before a crash, truncate would pad the file with NUL bytes
+            logging.getLogger("siirto").warning(f"{self.file_to_write} has {file_size} bytes, "
+                                                f"less than the {self._current_file_byte_count} "
+                                                f"bytes of the state, writing to the next file")
+            self.file_index += 1
+        self._current_file_byte_count = 0
+        self._current_file_record_count = 0
+        while self._current_file is None:
+            try:
+                self._current_file = open(self.file_to_write, "xb")
+            except FileExistsError:
+                self.file_index += 1
+        self._has_new_files = True
+        self._current_file_opened_at = time.time()
+
+    def _is_full(self) -> bool:
+        return (self.file_size_bytes is not None
+                and self._current_file_byte_count >= self.file_size_bytes) \
+            or (self.file_max_records is not None
+                and self._current_file_record_count >= self.file_max_records)
+
+    def _rotate_if_due(self) -> bool:
+        if self._current_file_opened_at is not None \
+                and self.file_max_age_seconds is not None \
+                and time.time() - self._current_file_opened_at >= self.file_max_age_seconds:
+            self._rotate()
+            return True
+        return False
+
+    def _rotate(self) -> None:
+        if self._current_file_opened_at is None:
+            return
+        if self._current_file is None and os.path.exists(self.file_to_write):
+            # resumed file, not written since
+            self._open()
+        if self._current_file is not None:
+            self._current_file.close()
+            self._unsynced_file_paths.append(self.file_to_write)
+            self._current_file = None
+        self._current_file_byte_count = 0
+        self._current_file_record_count = 0
+        self._current_file_opened_at = None
+        self.file_index += 1
+
+
+def fsync_path(path: str) -> None:
+    """
+    fsync a file or a folder
+    :param path: path of the file or folder
+    :type path: str
+    """
+    file_descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+
+
+def sync_cdc_file_writers(table_cdc_file_writers: Dict[str, CDCFileWriter],
+                          fsync: bool = True) -> Dict[str, Dict]:
+    """
+    Group commit of the cdc files. Syncs every file written since the
+    last sync, then the folders having new files, in one pass, so the
+    changes written are durable before the slot is advanced
+    :param table_cdc_file_writers: cdc file writer per table name
+    :type table_cdc_file_writers: Dict[str, CDCFileWriter]
+    :param fsync: whether to fsync the files and folders, flushed only otherwise
+    :type fsync: bool
+    :return: state of the writers as of the sync, per table name
+    """
+    table_states = {}
+    folders_to_sync: Set[str] = set()
+    for table_name, table_cdc_file_writer in table_cdc_file_writers.items():
+        table_states[table_name], has_new_files = table_cdc_file_writer.sync(fsync)
+        if has_new_files:
+            folders_to_sync.add(table_cdc_file_writer.cdc_folder_for_table)
+    if fsync:
+        for folder in folders_to_sync:
+            fsync_path(folder)
+    return table_states
+
+
+def create_cdc_file_writer(output_folder_location: str,
+                           table_name: str,
+                           file_size_bytes: int = None,
+                           file_max_records: int = None,
+                           file_max_age_seconds: float = None,
+                           table_state: Dict = None) -> CDCFileWriter:
+    """
+    Create the cdc file writer of a table, resumed from the state of the
+    table when given, writing after the cdc files already in the folder
+    of the table otherwise. The folder is listed only when there is no
+    state, or when the file after the state exists: the files were
+    written by the writer of another slot since (the table was moved
+    to another slot and back) and the state is not used. The folder is
+    created if missing
+    :param output_folder_location: cdc output folder
+    :type output_folder_location: str
+    :param table_name: table name, schema.table_name
+    :type table_name: str
+    :param file_size_bytes: number of bytes after which a new file
+        will be created
+    :type file_size_bytes: int
+    :param file_max_records: number of changes after which a new file
+        will be created
+    :type file_max_records: int
+    :param file_max_age_seconds: seconds after which a new file will
+        be created
+    :type file_max_age_seconds: float
+    :param table_state: state of the table, as in `CDCFileWriter.state`
+    :type table_state: Dict
+    :return: cdc file writer of the table
+    """
+    table_name_in_folder = table_name.replace(".", "_")
+    cdc_folder_for_table = os.path.join(output_folder_location,
+                                        table_name_in_folder)
+    if not os.path.exists(cdc_folder_for_table):
+        os.mkdir(cdc_folder_for_table)
+
+    if table_state is not None:
+        # the file of the state itself, if written by another writer, is
+        # never written to, the writer moves to the next index
+        next_file = os.path.join(cdc_folder_for_table,
+                                 f"{table_name}_cdc_{table_state['file_index'] + 1}.csv")
+        if not os.path.exists(next_file):
+            return CDCFileWriter(cdc_folder_for_table,
+                                 table_name,
+                                 table_state["file_index"],
+                                 file_size_bytes,
+                                 file_max_records,
+                                 file_max_age_seconds,
+                                 table_state["file_byte_count"],
+                                 table_state["file_record_count"],
+                                 table_state["file_opened_at"])
+        logging.getLogger("siirto").warning(f"cdc files of {table_name} were written after "
+                                            f"file {table_state['file_index']} of its state, "
+                                            f"writing after them")
+
+    file_name_pattern = re.compile(f"^{re.escape(table_name)}_cdc_([0-9]+)\\.csv$")
+    file_indexes = [int(match.group(1))
+                    for match in map(file_name_pattern.match,
+                                     os.listdir(cdc_folder_for_table))
+                    if match]
+
+    file_index = 1
+    if len(file_indexes) > 0:
+        file_index = max(file_indexes) + 1
+
+    return CDCFileWriter(cdc_folder_for_table,
+                         table_name,
+                         file_index,
+                         file_size_bytes,
+                         file_max_records,
+                         file_max_age_seconds)
+
+
+def create_cdc_file_writers(output_folder_location: str,
+                            table_names: List[str],
+                            table_settings: Dict = None,
+                            file_size_bytes: int = None,
+                            file_max_records: int = None,
+                            file_max_age_seconds: float = None,
+                            table_states: Dict[str, Dict] = None) -> Dict[str, CDCFileWriter]:
+    """
+    Create the cdc file writers of the tables. The rotation policy of a
+    table is taken from its `cdc_file_size_bytes`, `cdc_file_max_records`
+    and `cdc_file_max_age_seconds` table settings, the policy given here
+    otherwise
+    :param output_folder_location: cdc output folder
+    :type output_folder_location: str
+    :param table_names: table names, schema.table_name
+    :type table_names: List[str]
+    :param table_settings: settings per table name
+    :type table_settings: Dict
+    :param file_size_bytes: number of bytes after which a new file
+        will be created
+    :type file_size_bytes: int
+    :param file_max_records: number of changes after which a new file
+        will be created
+    :type file_max_records: int
+    :param file_max_age_seconds: seconds after which a new file will
+        be created
+    :type file_max_age_seconds: float
+    :param table_states: state per table name, the writers of the
+        tables without a state write after the files in their folder
+    :type table_states: Dict[str, Dict]
+    :return: cdc file writer per table name
+    """
+    table_cdc_file_writers = {}
+    for table_name in table_names:
+        settings = (table_settings or {}).get(table_name, {})
+        table_cdc_file_writers[table_name] = \
+            create_cdc_file_writer(output_folder_location,
+                                   table_name,
+                                   settings.get("cdc_file_size_bytes", file_size_bytes),
+                                   settings.get("cdc_file_max_records", file_max_records),
+                                   settings.get("cdc_file_max_age_seconds",
+                                                file_max_age_seconds),
+                                   (table_states or {}).get(table_name))
+    return table_cdc_file_writers
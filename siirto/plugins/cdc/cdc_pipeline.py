@@ -0,0 +1,278 @@
+import collections
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from siirto.plugins.cdc.wal2json_decoder import decode_changes
+
+# marks the end of the batches in the stage queues
+_STOP = object()
+
+
+class _Batch:
+    """
+    Batch of changes going through the pipeline
+
+    :param sequence: position of the batch in the pipeline
+    :type sequence: int
+    :param rows: changes, as sent by wal2json
+    :type rows: List[str]
+    :param lsn: position acknowledged once the batch is written,
+        None for a batch ending inside a transaction
+    :type lsn: str
+    """
+
+    def __init__(self, sequence: int, rows: List[str], lsn: Optional[str]) -> None:
+        self.sequence = sequence
+        self.rows = rows
+        self.lsn = lsn
+
+
+class CDCPipeline:
+    """
+    Pipeline of the cdc stages.
+
+    Batches of changes fetched from the slot are submitted to the
+    pipeline, decoded (in a thread, or in a pool of processes keeping
+    the order of the batches) and written by a writer thread per table.
+    A batch is acknowledged once all the writers of its tables have
+    written it, and `acknowledged_lsn` moves up to the last batch
+    acknowledged along with all the batches before it. The slot must
+    not be advanced past `acknowledged_lsn`.
+    Stage queues are bounded, so a slow writer holds the decoding and
+    then the fetching of the changes.
+
+    :param write_changes: writes the changes of a table, called with
+        the table name and the changes, from the writer thread of the
+        table
+    :type write_changes: Callable[[str, List[str]], None]
+    :param format_version: wal2json format-version of the changes, `1|2`
+    :type format_version: int
+    :param decode_processes: number of processes decoding the batches.
+        Default is `0`, batches are decoded in a thread
+    :type decode_processes: int
+    :param queue_size: batches waiting between two stages. Default is `4`
+    :type queue_size: int
+    """
+
+    def __init__(self,
+                 write_changes: Callable[[str, List[str]], None],
+                 format_version: int = 1,
+                 decode_processes: int = 0,
+                 queue_size: int = 4) -> None:
+        if decode_processes is None or decode_processes < 0:
+            raise ValueError(f"Incorrect value provided for "
+                             f"cdc_decode_processes `{decode_processes}`")
+        if queue_size is None or queue_size <= 0:
+            raise ValueError(f"Incorrect value provided for "
+                             f"cdc_pipeline_queue_size `{queue_size}`")
+        self.write_changes = write_changes
+        self.format_version = format_version
+        self.decode_processes = decode_processes
+        self.queue_size = queue_size
+        self.acknowledged_lsn = None
+        self.error = None
+        self._next_sequence = 0
+        self._fetch_queue = queue.Queue(maxsize=queue_size)
+        self._writer_queues: Dict[str, queue.Queue] = {}
+        self._writer_threads: List[threading.Thread] = []
+        # sequence -> [tables not written yet, lsn, dispatched to the writers],
+        # in the order of the batches
+        self._unacknowledged = collections.OrderedDict()
+        self._acknowledged = threading.Condition()
+        self._decode_executor = None
+        self._decode_thread = None
+
+    def start(self) -> None:
+        """
+        Start the decode stage, writer threads are started with the
+        first change of their table
+        """
+        if self.decode_processes > 0:
+            self._decode_executor = ProcessPoolExecutor(max_workers=self.decode_processes)
+        self._decode_thread = threading.Thread(target=self._decode_stage,
+                                               name="siirto_cdc_decode",
+                                               daemon=True)
+        self._decode_thread.start()
+
+    def submit(self, rows: List[str], lsn: Optional[str]) -> None:
+        """
+        Submit a batch of changes fetched from the slot. Waits while
+        the decode stage is behind
+        :param rows: changes, as sent by wal2json
+        :type rows: List[str]
+        :param lsn: position acknowledged once the batch is written,
+            None for a batch ending inside a transaction
+        :type lsn: str
+        """
+        self.raise_error()
+        batch = _Batch(self._next_sequence, rows, lsn)
+        self._next_sequence += 1
+        with self._acknowledged:
+            self._unacknowledged[batch.sequence] = [set(), batch.lsn, False]
+        while True:
+            try:
+                self._fetch_queue.put(batch, timeout=1)
+                return
+            except queue.Full:
+                self.raise_error()
+
+    def wait_acknowledged(self) -> Optional[str]:
+        """
+        Wait till all the batches submitted are acknowledged
+        :return: acknowledged lsn
+        """
+        with self._acknowledged:
+            while len(self._unacknowledged) > 0 and self.error is None:
+                self._acknowledged.wait(timeout=1)
+        self.raise_error()
+        return self.acknowledged_lsn
+
+    def raise_error(self) -> None:
+        """
+        Raise the error of a stage, once a stage failed
+        """
+        if self.error is not None:
+            raise RuntimeError("cdc pipeline stopped") from self.error
+
+    def stop(self) -> None:
+        """
+        Write the batches submitted and stop the stages
+        """
+        if self._decode_thread is not None:
+            while self._decode_thread.is_alive():
+                try:
+                    self._fetch_queue.put(_STOP, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+            self._decode_thread.join()
+        for writer_thread in self._writer_threads:
+            writer_thread.join()
+        if self._decode_executor is not None:
+            self._decode_executor.shutdown()
+
+    def _decode_stage(self) -> None:
+        """
+        Decode the batches and send the changes to the writers of their
+        tables, in the order of the batches
+        """
+        in_flight = collections.deque()
+        try:
+            while True:
+                try:
+                    # do not wait for the next batch while batches are decoded
+                    batch = self._fetch_queue.get(block=len(in_flight) == 0)
+                except queue.Empty:
+                    batch = None
+                if batch is _STOP:
+                    while len(in_flight) > 0:
+                        self._dispatch(*in_flight.popleft())
+                    break
+                if batch is not None:
+                    if self._decode_executor is None:
+                        self._dispatch(batch, decode_changes(batch.rows, self.format_version))
+                        continue
+                    in_flight.append((batch, self._decode_executor.submit(decode_changes,
+                                                                          batch.rows,
+                                                                          self.format_version)))
+                while len(in_flight) > 0 \
+                        and (batch is None
+                             or len(in_flight) >= self.decode_processes
+                             or in_flight[0][1].done()):
+                    self._dispatch(*in_flight.popleft())
+        except Exception as ex:
+            self._set_error(ex)
+        finally:
+            for writer_queue in self._writer_queues.values():
+                writer_queue.put(_STOP)
+
+    def _dispatch(self, batch: _Batch, rows_collected) -> None:
+        """
+        Send the decoded changes of a batch to the writers of their tables
+        :param batch: batch
+        :type batch: _Batch
+        :param rows_collected: changes per table name, or the future of them
+        :type rows_collected: Dict[str, List[str]]
+        """
+        if not isinstance(rows_collected, dict):
+            rows_collected = rows_collected.result()
+        with self._acknowledged:
+            self._unacknowledged[batch.sequence][0].update(rows_collected.keys())
+            self._unacknowledged[batch.sequence][2] = True
+        if len(rows_collected) == 0:
+            self._acknowledge(batch.sequence, None)
+        for table_name, changes in rows_collected.items():
+            if table_name not in self._writer_queues:
+                self._start_writer(table_name)
+            while True:
+                try:
+                    self._writer_queues[table_name].put((batch.sequence, changes), timeout=1)
+                    break
+                except queue.Full:
+                    self.raise_error()
+
+    def _start_writer(self, table_name: str) -> None:
+        """
+        Start the writer thread of a table
+        :param table_name: table name
+        :type table_name: str
+        """
+        writer_queue = queue.Queue(maxsize=self.queue_size)
+        self._writer_queues[table_name] = writer_queue
+        writer_thread = threading.Thread(target=self._write_stage,
+                                         args=(table_name, writer_queue),
+                                         name=f"siirto_cdc_writer_{table_name}",
+                                         daemon=True)
+        self._writer_threads.append(writer_thread)
+        writer_thread.start()
+
+    def _write_stage(self, table_name: str, writer_queue: queue.Queue) -> None:
+        """
+        Write the changes of a table, in the order of the batches
+        :param table_name: table name
+        :type table_name: str
+        :param writer_queue: changes of the table, per batch
+        :type writer_queue: queue.Queue
+        """
+        while True:
+            item = writer_queue.get()
+            if item is _STOP:
+                return
+            if self.error is not None:
+                # nothing is written after a failed batch
+                continue
+            sequence, changes = item
+            try:
+                self.write_changes(table_name, changes)
+            except Exception as ex:
+                self._set_error(ex)
+                continue
+            self._acknowledge(sequence, table_name)
+
+    def _acknowledge(self, sequence: int, table_name: Optional[str]) -> None:
+        """
+        Acknowledge the write of the changes of a table of a batch
+        :param sequence: sequence of the batch
+        :type sequence: int
+        :param table_name: table name, None for a batch without changes
+        :type table_name: str
+        """
+        with self._acknowledged:
+            self._unacknowledged[sequence][0].discard(table_name)
+            # move up to the last batch written along with all the batches before it
+            while len(self._unacknowledged) > 0:
+                tables_not_written, lsn, dispatched = next(iter(self._unacknowledged.values()))
+                if len(tables_not_written) > 0 or not dispatched:
+                    break
+                self._unacknowledged.popitem(last=False)
+                if lsn is not None:
+                    self.acknowledged_lsn = lsn
+            self._acknowledged.notify_all()
+
+    def _set_error(self, ex: Exception) -> None:
+        with self._acknowledged:
+            if self.error is None:
+                self.error = ex
+            self._acknowledged.notify_all()
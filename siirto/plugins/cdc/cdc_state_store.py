@@ -0,0 +1,95 @@
+import sqlite3
+from typing import Dict, Optional
+
+# state store database of a replication slot, in the cdc output folder
+CDC_STATE_FILE_NAME = "_cdc_state_{slot_name}.db"
+
+
+def cdc_state_file_name(slot_name: str) -> str:
+    """
+    File name of the state store database of a replication slot
+    :param slot_name: replication slot name
+    :type slot_name: str
+    :return: file name
+    """
+    return CDC_STATE_FILE_NAME.format(slot_name=slot_name)
+
+
+class CDCStateStore:
+    """
+    Durable state of the cdc files, in a SQLite database.
+
+    There is a state store per replication slot. Records per table
+    of the slot the cdc file being written (index, bytes and
+    changes written in it, and when it was opened) and the lsn of the
+    last changes written, as of the last save. The cdc file writers
+    are resumed from it on startup, without listing the cdc folders.
+
+    :param database_path: path of the SQLite database, created if missing
+    :type database_path: str
+    """
+
+    def __init__(self, database_path: str) -> None:
+        self.database_path = database_path
+        self._connection = sqlite3.connect(database_path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS table_state ("
+                                 "table_name TEXT PRIMARY KEY, "
+                                 "file_index INTEGER NOT NULL, "
+                                 "file_byte_count INTEGER NOT NULL, "
+                                 "file_record_count INTEGER NOT NULL, "
+                                 "file_opened_at REAL, "
+                                 "last_lsn TEXT)")
+        self._connection.commit()
+
+    def get_table_states(self) -> Dict[str, Dict]:
+        """
+        State of the tables
+        :return: table name -> file_index, file_byte_count,
+            file_record_count, file_opened_at and last_lsn
+        """
+        cursor = self._connection.execute("SELECT table_name, file_index, file_byte_count, "
+                                          "file_record_count, file_opened_at, last_lsn "
+                                          "FROM table_state")
+        return {table_name: {"file_index": file_index,
+                             "file_byte_count": file_byte_count,
+                             "file_record_count": file_record_count,
+                             "file_opened_at": file_opened_at,
+                             "last_lsn": last_lsn}
+                for table_name, file_index, file_byte_count,
+                file_record_count, file_opened_at, last_lsn in cursor.fetchall()}
+
+    def save_table_states(self,
+                          table_states: Dict[str, Dict],
+                          lsn: Optional[str] = None,
+                          written_table_names=()) -> None:
+        """
+        Save the state of the tables, in one transaction
+        :param table_states: table name -> file_index, file_byte_count,
+            file_record_count and file_opened_at
+        :type table_states: Dict[str, Dict]
+        :param lsn: lsn of the changes written, None to keep the last lsn
+        :type lsn: str
+        :param written_table_names: tables having changes up to `lsn`
+        :type written_table_names: Iterable[str]
+        """
+        with self._connection:
+            for table_name, table_state in table_states.items():
+                last_lsn = lsn if lsn is not None and table_name in written_table_names else None
+                self._connection.execute(
+                    "INSERT INTO table_state (table_name, file_index, file_byte_count, "
+                    "file_record_count, file_opened_at, last_lsn) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (table_name) DO UPDATE SET "
+                    "file_index = excluded.file_index, "
+                    "file_byte_count = excluded.file_byte_count, "
+                    "file_record_count = excluded.file_record_count, "
+                    "file_opened_at = excluded.file_opened_at, "
+                    "last_lsn = COALESCE(excluded.last_lsn, table_state.last_lsn)",
+                    (table_name, table_state["file_index"], table_state["file_byte_count"],
+                     table_state["file_record_count"], table_state["file_opened_at"],
+                     last_lsn))
+
+    def close(self) -> None:
+        """
+        Close the database
+        """
+        self._connection.close()
@@ -86,7 +86,7 @@ class PgCDCPluginToEventHub(CDCBase):
         self.logger.info("in progress - started")
         connection = psycopg2.connect(self.connection_string)
         cursor = connection.cursor()
-        slot_name = "siirto_slot"
+        slot_name = self.slot_name
 
         # create the slot, if doesn't already exists
         cursor.execute(f"SELECT 1 FROM pg_replication_slots WHERE slot_name = '{slot_name}';")
@@ -1,16 +1,24 @@
-import glob
 import json
 import os
 import time
-import re
 import signal
-import multiprocessing
+from typing import Dict
 
 import psycopg2
 
 from siirto.plugins.cdc.cdc_base import CDCBase
+from siirto.plugins.cdc.cdc_file_writer import create_cdc_file_writers, \
+    sync_cdc_file_writers
+from siirto.plugins.cdc.cdc_pipeline import CDCPipeline
+from siirto.plugins.cdc.cdc_state_store import CDCStateStore, cdc_state_file_name
+from siirto.plugins.cdc.poll_scheduler import AdaptivePollScheduler
+from siirto.plugins.cdc.wal2json_decoder import decode_changes, \
+    is_transaction_end, wal2json_options
 from siirto.shared.enums import PlugInType
 
+# rows fetched at a time from the server side cursor of a batch
+BATCH_FETCH_SIZE = 100
+
 
 class PgDefaultCDCPlugin(CDCBase):
     """
@@ -19,6 +27,66 @@ class PgDefaultCDCPlugin(CDCBase):
     :param poll_frequency: frequency at which Postresql database
         should be polled. Default is `1` seconds.
     :type poll_frequency: int
+    :param poll_max_interval: maximum seconds between the polls
+        while there are no changes. The interval doubles (by
+        `poll_backoff_factor`) on every poll without changes, from
+        `poll_frequency` up to it. Default is `poll_frequency`, no
+        back off. Full batches are polled again immediately.
+    :type poll_max_interval: float
+    :param poll_backoff_factor: factor the poll interval grows by on
+        every poll without changes. Default is `2`.
+    :type poll_backoff_factor: float
+    :param cdc_file_size_bytes: number of bytes after which a new cdc
+        file will be created for a table. Changes are appended to the
+        current file across the polls till then. Default is None,
+        a new file for every poll having changes (when no other
+        rotation policy is given).
+    :type cdc_file_size_bytes: int
+    :param cdc_file_max_records: number of changes after which a new
+        cdc file will be created for a table. Default is None.
+    :type cdc_file_max_records: int
+    :param cdc_file_max_age_seconds: seconds after which a new cdc file
+        will be created for a table, the current file is closed once it
+        is open for that long. Default is None.
+    :type cdc_file_max_age_seconds: float
+    :param table_settings: settings per table, as json. The
+        `cdc_file_size_bytes`, `cdc_file_max_records` and
+        `cdc_file_max_age_seconds` of a table take precedence over the
+        parameters. Default is None.
+    :type table_settings: Dict
+    :param cdc_batch_max_changes: maximum number of rows (wal2json
+        transactions) decoded in a batch (`upto_nchanges`).
+        Default is `10000`.
+    :type cdc_batch_max_changes: int
+    :param cdc_batch_max_bytes: maximum bytes of change data read in
+        a batch. The batch ends after the row reaching it. Default is
+        `67108864` (64 MB).
+    :type cdc_batch_max_bytes: int
+    :param wal2json_format_version: wal2json format-version, `1|2`.
+        With `1` every transaction is parsed and its changes are
+        written serialized again. With `2` only the table of every
+        change is read and changes are written as sent by wal2json.
+        Default is `1`.
+    :type wal2json_format_version: int
+    :param cdc_pipeline: decode the batches and write the changes of
+        every table in stages of a `CDCPipeline`, decoding in a thread
+        (or `cdc_decode_processes` processes) and writing in a thread per
+        table. The slot is consumed once all the tables are written.
+        Default is False.
+    :type cdc_pipeline: bool
+    :param cdc_decode_processes: number of processes decoding the
+        batches of the pipeline. Default is `0`, decoded in a thread.
+    :type cdc_decode_processes: int
+    :param cdc_pipeline_queue_size: batches waiting between two stages
+        of the pipeline. Default is `4`.
+    :type cdc_pipeline_queue_size: int
+    :param cdc_fsync: fsync the cdc files written in a poll (and the
+        folders having new files) in one group commit, before the
+        committed lsn is recorded and the slot is consumed up to it.
+        The slot is peeked from its position, so every poll is
+        committed, `poll_frequency` and the batch sizes set how many
+        changes a commit covers. Default is True.
+    :type cdc_fsync: bool
     """
 
     # plugin type and plugin name
@@ -27,15 +95,98 @@ class PgDefaultCDCPlugin(CDCBase):
     plugin_parameters = {
         "poll_frequency": {
             "type": float
+        },
+        "poll_max_interval": {
+            "type": float
+        },
+        "poll_backoff_factor": {
+            "type": float
+        },
+        "cdc_file_size_bytes": {
+            "type": int
+        },
+        "cdc_file_max_records": {
+            "type": int
+        },
+        "cdc_file_max_age_seconds": {
+            "type": float
+        },
+        "table_settings": {
+            "type": json.loads
+        },
+        "cdc_batch_max_changes": {
+            "type": int
+        },
+        "cdc_batch_max_bytes": {
+            "type": int
+        },
+        "wal2json_format_version": {
+            "type": int
+        },
+        "cdc_pipeline": {
+            "type": lambda value: value == "True"
+        },
+        "cdc_decode_processes": {
+            "type": int
+        },
+        "cdc_pipeline_queue_size": {
+            "type": int
+        },
+        "cdc_fsync": {
+            "type": lambda value: value == "True"
         }
     }
 
     def __init__(self,
                  poll_frequency: int = 1,
+                 poll_max_interval: float = None,
+                 poll_backoff_factor: float = 2,
+                 cdc_file_size_bytes: int = None,
+                 cdc_file_max_records: int = None,
+                 cdc_file_max_age_seconds: float = None,
+                 table_settings: Dict = None,
+                 cdc_batch_max_changes: int = 10000,
+                 cdc_batch_max_bytes: int = 67108864,
+                 wal2json_format_version: int = 1,
+                 cdc_pipeline: bool = False,
+                 cdc_decode_processes: int = 0,
+                 cdc_pipeline_queue_size: int = 4,
+                 cdc_fsync: bool = True,
                  *args,
                  **kwargs) -> None:
         super().__init__(*args, **kwargs)
+        if cdc_batch_max_changes is None or cdc_batch_max_changes <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"cdc_batch_max_changes `{cdc_batch_max_changes}`"
+            raise ValueError(ex_msg)
+        if cdc_batch_max_bytes is None or cdc_batch_max_bytes <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"cdc_batch_max_bytes `{cdc_batch_max_bytes}`"
+            raise ValueError(ex_msg)
         self.poll_frequency = poll_frequency
+        self.poll_scheduler = AdaptivePollScheduler(poll_frequency,
+                                                    poll_max_interval,
+                                                    poll_backoff_factor)
+        self.metrics["poll_interval"] = self.poll_scheduler.interval
+        self.cdc_file_size_bytes = cdc_file_size_bytes
+        self.cdc_file_max_records = cdc_file_max_records
+        self.cdc_file_max_age_seconds = cdc_file_max_age_seconds
+        self.table_settings = table_settings or {}
+        # state of the cdc files, opened when started
+        self.state_store = None
+        # tables written since the state was last saved
+        self._written_table_names = set()
+        self.cdc_batch_max_changes = cdc_batch_max_changes
+        self.cdc_batch_max_bytes = cdc_batch_max_bytes
+        self.wal2json_format_version = wal2json_format_version
+        self.wal2json_options = wal2json_options(wal2json_format_version,
+                                                 self.table_names)
+        self.table_cdc_file_writers = {}
+        self.cdc_fsync = cdc_fsync
+        self.pipeline = CDCPipeline(self._write_table_changes,
+                                    wal2json_format_version,
+                                    cdc_decode_processes,
+                                    cdc_pipeline_queue_size) if cdc_pipeline else None
 
     def _set_status(self, status: str):
         """
@@ -46,11 +197,134 @@ class PgDefaultCDCPlugin(CDCBase):
         self.status = status
         self.logger.info(status)
 
+    def _wait_for_next_poll(self, has_changes: bool, batch_full: bool) -> None:
+        """
+        Wait for the next poll, as long as the plugin is running
+        :param has_changes: whether the last poll read any change
+        :type has_changes: bool
+        :param batch_full: whether the batch of the last poll was full
+        :type batch_full: bool
+        """
+        poll_at = time.monotonic() + self.poll_scheduler.next_interval(has_changes,
+                                                                       batch_full)
+        self.metrics["poll_interval"] = self.poll_scheduler.interval
+        while self.is_running and time.monotonic() < poll_at:
+            time.sleep(min(poll_at - time.monotonic(), 1))
+
+    @property
+    def _slot_changes_options(self) -> str:
+        """ wal2json options, as arguments of the slot changes functions """
+        return ", ".join(f"'{option_name}', '{option_value}'"
+                         for option_name, option_value in self.wal2json_options.items())
+
+    def _commit(self, lsn: str = None) -> None:
+        """
+        Group commit of the changes written: sync the cdc files, then
+        save their state along with the lsn of the changes written.
+        Must be called before the slot is advanced
+        :param lsn: lsn of the changes written, None when the changes
+            written since the last commit are not up to an lsn yet
+        :type lsn: str
+        """
+        if self.state_store is None:
+            return
+        written_table_names = self._written_table_names
+        self._written_table_names = set()
+        table_states = sync_cdc_file_writers(self.table_cdc_file_writers, self.cdc_fsync)
+        self.state_store.save_table_states(table_states, lsn, written_table_names)
+        if lsn is not None:
+            self.metrics["committed_lsn"] = lsn
+
+    def _rotate_due_files(self) -> None:
+        """
+        Close the cdc files open for longer than their maximum age
+        """
+        rotated = False
+        for table_cdc_file_writer in self.table_cdc_file_writers.values():
+            rotated = table_cdc_file_writer.rotate_if_due() or rotated
+        if rotated:
+            self._commit()
+
+    def _close_files(self) -> None:
+        """
+        Close the open cdc files and the state store
+        """
+        for table_cdc_file_writer in self.table_cdc_file_writers.values():
+            table_cdc_file_writer.close()
+        if self.state_store is not None:
+            self._commit()
+            self.state_store.close()
+            self.state_store = None
+
+    def _write_table_changes(self, table_name: str, changes) -> None:
+        """
+        Write the changes of a table to its cdc files
+        :param table_name: table name
+        :type table_name: str
+        :param changes: changes of the table
+        :type changes: List[str]
+        """
+        self.table_cdc_file_writers[table_name].write(changes)
+        self._written_table_names.add(table_name)
+
+    def _read_batch(self, connection, slot_name: str):
+        """
+        Read the next batch of changes from the slot and decode them
+        :param connection: connection to the source database
+        :param slot_name: replication slot name
+        :type slot_name: str
+        :return: changes per table, lsn of the last row read (None when
+            there are no changes) and whether the batch is full (more
+            changes may be pending)
+        """
+        rows, max_lsn, batch_full = self._fetch_batch(connection, slot_name)
+        return decode_changes(rows, self.wal2json_format_version), max_lsn, batch_full
+
+    def _fetch_batch(self, connection, slot_name: str):
+        """
+        Fetch the next batch of changes from the slot, without consuming
+        them. The batch has at most `cdc_batch_max_changes` rows and ends
+        after the row reaching `cdc_batch_max_bytes`, so the memory used
+        does not depend on the changes pending in the slot.
+        With wal2json format-version 2 the batch ends on transaction ends
+        only, so the slot is consumed up to whole transactions
+        :param connection: connection to the source database
+        :param slot_name: replication slot name
+        :type slot_name: str
+        :return: rows, as sent by wal2json, lsn of the last row read
+            (None when there are no changes) and whether the batch is
+            full (more changes may be pending)
+        """
+        batch_cursor = connection.cursor(name="siirto_cdc_batch")
+        batch_cursor.itersize = BATCH_FETCH_SIZE
+        batch_cursor.execute(f"SELECT lsn, data FROM  pg_logical_slot_peek_changes('{slot_name}', "
+                             f"NULL, {self.cdc_batch_max_changes}, "
+                             f"{self._slot_changes_options});")
+        rows = []
+        max_lsn = None
+        row_count = 0
+        batch_byte_count = 0
+        batch_full = False
+        for lsn, data in batch_cursor:
+            rows.append(data)
+            row_count += 1
+            batch_byte_count += len(data)
+            if self.wal2json_format_version == 2 and not is_transaction_end(data):
+                continue
+            max_lsn = lsn
+            if batch_byte_count >= self.cdc_batch_max_bytes:
+                batch_full = True
+                break
+        batch_cursor.close()
+        if row_count >= self.cdc_batch_max_changes:
+            batch_full = True
+        return rows, max_lsn, batch_full
+
     def execute(self):
         self.logger.info("in progress - started")
         connection = psycopg2.connect(self.connection_string)
         cursor = connection.cursor()
-        slot_name = "siirto_slot"
+        slot_name = self.slot_name
 
         # create the slot, if doesn't already exists
         cursor.execute(f"SELECT 1 FROM pg_replication_slots WHERE slot_name = '{slot_name}';")
@@ -62,82 +336,61 @@ class PgDefaultCDCPlugin(CDCBase):
             cursor.execute(f"SELECT 'init' FROM "
                            f"pg_create_logical_replication_slot('{slot_name}', 'wal2json');")
 
-        current_table_cdc_file_name = {}
-        for table_name in self.table_names:
-            table_name_in_folder = table_name.replace(".", "_")
-            cdc_folder_for_table = os.path.join(self.output_folder_location,
-                                                table_name_in_folder)
-            file_indexes = []
-            if os.path.exists(cdc_folder_for_table):
-                file_indexes = [int(file_name.replace(f"{table_name}_cdc_", "").replace(".csv", ""))
-                                for file_name in list(os.listdir(cdc_folder_for_table))
-                                if re.search(f"^{table_name}_cdc_.*.csv$", file_name)]
-
-            file_index = 1
-            if len(file_indexes) > 0:
-                file_index = max(file_indexes) + 1
-
-            if not os.path.exists(cdc_folder_for_table):
-                os.mkdir(cdc_folder_for_table)
-
-            file_to_write = os.path.join(self.output_folder_location,
-                                         table_name_in_folder,
-                                         f"{table_name}_cdc_{file_index}.csv")
-            current_table_cdc_file_name[table_name] = {
-                'file_to_write': file_to_write,
-                'index': file_index
-            }
-
-        tables_string = ",".join(self.table_names)
-        while self.is_running:
-            self.logger.info("running cdc pull iteration")
-            cursor.execute(f"SELECT lsn, data FROM  pg_logical_slot_peek_changes('{slot_name}', "
-                           f"NULL, NULL, 'pretty-print', '1', "
-                           f"'add-tables', '{tables_string}');")
-            rows = cursor.fetchall()
-            rows_collected = {}
-            max_lsn = None
-            # read the WALs
-            for row in rows:
-                max_lsn = row[0]
-                change_set = json.loads(row[1])
-                change_set_entries = change_set["change"] if 'change' in change_set else []
-                for change_set_entry in change_set_entries:
-                    table_name = f"{change_set_entry['schema']}.{change_set_entry['table']}" \
-                        if 'table' in change_set_entry else None
-                    if table_name:
-                        if table_name in rows_collected:
-                            rows_collected[table_name].append(json.dumps(change_set_entry))
-                        else:
-                            rows_collected[table_name] = [json.dumps(change_set_entry)]
-
-            # persist the WALs
-            if len(rows_collected.keys()) > 0:
-                cdc_captured_details = {}
-                # write the data to files
-                for table_name in rows_collected.keys():
-                    name_and_index = current_table_cdc_file_name[table_name]
-                    cdc_captured_details[table_name] = len(rows_collected[table_name])
-                    with open(name_and_index["file_to_write"], "w+") as output_file:
-                        output_file.write("\n".join(rows_collected[table_name]))
-                        new_file_index = name_and_index['index'] + 1
-                        new_file_to_write = os.path.join(self.output_folder_location,
-                                                         table_name.replace(".", "_"),
-                                                         f"{table_name}_cdc_{new_file_index}.csv")
-                        current_table_cdc_file_name[table_name] = {
-                            'file_to_write': new_file_to_write,
-                            'index': new_file_index
-                        }
-
-                self.logger.info(f"Following tables has change data: {cdc_captured_details}")
-
-            # remove the WALs
-            if max_lsn:
-                cursor.execute(f"SELECT 1 FROM  pg_logical_slot_get_changes('{slot_name}', "
-                               f"'{max_lsn}', NULL, 'pretty-print', '1', "
-                               f"'add-tables', '{tables_string}');")
-            # sleep for one second, before next pool
-            time.sleep(self.poll_frequency)
+        # cdc file writers resume from the state store, without listing the folders
+        self.state_store = CDCStateStore(os.path.join(self.output_folder_location,
+                                                      cdc_state_file_name(slot_name)))
+        self.table_cdc_file_writers = \
+            create_cdc_file_writers(self.output_folder_location,
+                                    self.table_names,
+                                    self.table_settings,
+                                    self.cdc_file_size_bytes,
+                                    self.cdc_file_max_records,
+                                    self.cdc_file_max_age_seconds,
+                                    self.state_store.get_table_states())
+
+        if self.pipeline is not None:
+            self.pipeline.start()
+        try:
+            while self.is_running:
+                self.logger.info(f"running cdc pull iteration on {slot_name}, "
+                                 f"metrics: {self.metrics}")
+                if self.pipeline is None:
+                    # read the WALs
+                    rows_collected, max_lsn, batch_full = self._read_batch(connection, slot_name)
+
+                    # persist the WALs
+                    if len(rows_collected.keys()) > 0:
+                        cdc_captured_details = {}
+                        # write the data to files
+                        for table_name in rows_collected.keys():
+                            cdc_captured_details[table_name] = len(rows_collected[table_name])
+                            self._write_table_changes(table_name, rows_collected[table_name])
+
+                        self.logger.info(f"Following tables has change data: "
+                                         f"{cdc_captured_details}")
+                else:
+                    # decoded and written by the pipeline stages, the slot is
+                    # peeked from its position so the next batch is fetched
+                    # once this one is written
+                    rows, max_lsn, batch_full = self._fetch_batch(connection, slot_name)
+                    if max_lsn:
+                        self.pipeline.submit(rows, max_lsn)
+                        self.pipeline.wait_acknowledged()
+
+                # remove the WALs
+                if max_lsn:
+                    self._commit(max_lsn)
+                    cursor.execute(f"SELECT 1 FROM  pg_logical_slot_get_changes('{slot_name}', "
+                                   f"'{max_lsn}', NULL, {self._slot_changes_options});")
+                connection.commit()
+                self._rotate_due_files()
+                # drain the pending changes batch after batch,
+                # back off while there are no changes
+                self._wait_for_next_poll(max_lsn is not None, batch_full)
+        finally:
+            if self.pipeline is not None:
+                self.pipeline.stop()
+            self._close_files()
 
         print(f'cleaning the {slot_name}')
         cursor.execute(f"SELECT 'stop' FROM pg_drop_replication_slot('{slot_name}');")
@@ -0,0 +1,467 @@
+import json
+import os
+import select
+import signal
+import time
+from typing import Dict, List
+
+import psycopg2
+import psycopg2.errors
+from psycopg2.extras import LogicalReplicationConnection
+
+from siirto.plugins.cdc.cdc_base import CDCBase
+from siirto.plugins.cdc.cdc_file_writer import CDCFileWriter, create_cdc_file_writers, \
+    sync_cdc_file_writers
+from siirto.plugins.cdc.cdc_pipeline import CDCPipeline
+from siirto.plugins.cdc.cdc_state_store import CDCStateStore, cdc_state_file_name
+from siirto.plugins.cdc.wal2json_decoder import collect_table_change, \
+    collect_table_changes, is_transaction_end, wal2json_options
+from siirto.shared.enums import PlugInType
+
+# seconds to wait for the walsender to release the slot, before it is dropped
+SLOT_RELEASE_TIMEOUT = 10
+
+
+class PgStreamingCDCPlugin(CDCBase):
+    """
+    Postgres CDC plugin using the streaming replication protocol.
+
+    Changes are pushed by the server as the transactions commit, so the
+    WAL is decoded once and there is no poll delay. Received changes are
+    written to the cdc files every `stream_flush_interval` seconds, and
+    the flush position is reported to the server only after they are
+    written. The server keeps the WAL of the changes not reported yet,
+    they are sent again when the plugin is restarted.
+
+    The written changes are made durable by a group commit: every cdc
+    file written since the last commit (and the folders having new
+    files) is synced in one pass, the committed lsn is recorded in the
+    state store and only then reported to the server. Commits happen at
+    most every `cdc_commit_interval` seconds, covering all the changes
+    written since the last one.
+
+    :param stream_flush_interval: seconds the received changes are kept
+        in memory before they are written. Default is `0.5` seconds.
+    :type stream_flush_interval: float
+    :param cdc_file_size_bytes: number of bytes after which a new cdc
+        file will be created for a table. Changes are appended to the
+        current file across the writes till then. Default is None,
+        a new file for every write having changes (when no other
+        rotation policy is given).
+    :type cdc_file_size_bytes: int
+    :param cdc_file_max_records: number of changes after which a new
+        cdc file will be created for a table. Default is None.
+    :type cdc_file_max_records: int
+    :param cdc_file_max_age_seconds: seconds after which a new cdc file
+        will be created for a table, the current file is closed once it
+        is open for that long. Default is None.
+    :type cdc_file_max_age_seconds: float
+    :param table_settings: settings per table, as json. The
+        `cdc_file_size_bytes`, `cdc_file_max_records` and
+        `cdc_file_max_age_seconds` of a table take precedence over the
+        parameters. Default is None.
+    :type table_settings: Dict
+    :param cdc_batch_max_bytes: maximum bytes of change data kept in
+        memory. The pending changes are written as soon as they reach
+        it, and no more changes are read till then. Default is
+        `67108864` (64 MB).
+    :type cdc_batch_max_bytes: int
+    :param wal2json_format_version: wal2json format-version, `1|2`.
+        With `1` every transaction is parsed and its changes are
+        written serialized again. With `2` only the table of every
+        change is read and changes are written as sent by wal2json.
+        Default is `1`.
+    :type wal2json_format_version: int
+    :param cdc_pipeline: decode and write the received changes in stages
+        of a `CDCPipeline`, decoding in a thread (or `cdc_decode_processes`
+        processes) and writing in a thread per table, while the next
+        changes are received. The flush position is reported once all
+        the tables are written. Default is False.
+    :type cdc_pipeline: bool
+    :param cdc_decode_processes: number of processes decoding the
+        batches of the pipeline. Default is `0`, decoded in a thread.
+    :type cdc_decode_processes: int
+    :param cdc_pipeline_queue_size: batches waiting between two stages
+        of the pipeline. Default is `4`.
+    :type cdc_pipeline_queue_size: int
+    :param cdc_fsync: fsync the cdc files and folders in the group
+        commits, flushed only otherwise. Default is True.
+    :type cdc_fsync: bool
+    :param cdc_commit_interval: minimum seconds between two group
+        commits. A longer interval makes fewer fsyncs for more changes
+        each, while the server keeps the WAL of the changes not
+        committed. Default is `0`, committed on every write.
+    :type cdc_commit_interval: float
+    """
+
+    # plugin type and plugin name
+    plugin_type = PlugInType.CDC
+    plugin_name = "PgStreamingCDCPlugin"
+    plugin_parameters = {
+        "stream_flush_interval": {
+            "type": float
+        },
+        "cdc_file_size_bytes": {
+            "type": int
+        },
+        "cdc_file_max_records": {
+            "type": int
+        },
+        "cdc_file_max_age_seconds": {
+            "type": float
+        },
+        "table_settings": {
+            "type": json.loads
+        },
+        "cdc_batch_max_bytes": {
+            "type": int
+        },
+        "wal2json_format_version": {
+            "type": int
+        },
+        "cdc_pipeline": {
+            "type": lambda value: value == "True"
+        },
+        "cdc_decode_processes": {
+            "type": int
+        },
+        "cdc_pipeline_queue_size": {
+            "type": int
+        },
+        "cdc_fsync": {
+            "type": lambda value: value == "True"
+        },
+        "cdc_commit_interval": {
+            "type": float
+        }
+    }
+
+    def __init__(self,
+                 stream_flush_interval: float = 0.5,
+                 cdc_file_size_bytes: int = None,
+                 cdc_file_max_records: int = None,
+                 cdc_file_max_age_seconds: float = None,
+                 table_settings: Dict = None,
+                 cdc_batch_max_bytes: int = 67108864,
+                 wal2json_format_version: int = 1,
+                 cdc_pipeline: bool = False,
+                 cdc_decode_processes: int = 0,
+                 cdc_pipeline_queue_size: int = 4,
+                 cdc_fsync: bool = True,
+                 cdc_commit_interval: float = 0,
+                 *args,
+                 **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if stream_flush_interval is None or stream_flush_interval <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"stream_flush_interval `{stream_flush_interval}`"
+            raise ValueError(ex_msg)
+        if cdc_batch_max_bytes is None or cdc_batch_max_bytes <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"cdc_batch_max_bytes `{cdc_batch_max_bytes}`"
+            raise ValueError(ex_msg)
+        if cdc_commit_interval is None or cdc_commit_interval < 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"cdc_commit_interval `{cdc_commit_interval}`"
+            raise ValueError(ex_msg)
+        self.stream_flush_interval = stream_flush_interval
+        self.cdc_file_size_bytes = cdc_file_size_bytes
+        self.cdc_file_max_records = cdc_file_max_records
+        self.cdc_file_max_age_seconds = cdc_file_max_age_seconds
+        self.table_settings = table_settings or {}
+        # state of the cdc files, opened when started
+        self.state_store = None
+        # tables written since the state was last saved
+        self._written_table_names = set()
+        self.cdc_batch_max_bytes = cdc_batch_max_bytes
+        self.wal2json_format_version = wal2json_format_version
+        self.wal2json_options = wal2json_options(wal2json_format_version,
+                                                 self.table_names)
+        # changes received and not written yet, per table
+        self.pending_changes: Dict[str, List[str]] = {}
+        # changes received and not submitted to the pipeline yet, as sent by wal2json
+        self.pending_rows: List[str] = []
+        self.pending_byte_count = 0
+        # position of the last message received and not written yet
+        self.pending_lsn = None
+        self.table_cdc_file_writers: Dict[str, CDCFileWriter] = {}
+        self.pipeline = CDCPipeline(self._write_table_changes,
+                                    wal2json_format_version,
+                                    cdc_decode_processes,
+                                    cdc_pipeline_queue_size) if cdc_pipeline else None
+        # position of the last changes written and not committed yet
+        self.written_lsn = None
+        # flush position last reported to the server
+        self.feedback_lsn = None
+        self.cdc_fsync = cdc_fsync
+        self.cdc_commit_interval = cdc_commit_interval
+        self._next_commit_at = 0
+
+    def _set_status(self, status: str):
+        """
+        Set the status of the running plugin
+        :param status: status
+        """
+        status = f"CDC - {status}"
+        self.status = status
+        self.logger.info(status)
+
+    def _receive(self, message) -> None:
+        """
+        Keep the changes of a replication message till they are written
+        :param message: replication message, a wal2json transaction
+            (format-version 1) or change (format-version 2)
+        :type message: psycopg2.extras.ReplicationMessage
+        """
+        self.pending_byte_count += len(message.payload)
+        if self.pipeline is not None:
+            # decoded by the pipeline
+            self.pending_rows.append(message.payload)
+            if self.wal2json_format_version == 2 and not is_transaction_end(message.payload):
+                return
+        elif self.wal2json_format_version == 1:
+            collect_table_changes(message.payload, self.pending_changes)
+        elif collect_table_change(message.payload, self.pending_changes) != "C":
+            # position is acknowledged on the transaction ends only
+            return
+        # transactions without changes of the tables are acknowledged too
+        self.pending_lsn = message.data_start
+
+    def _commit(self, lsn: str = None) -> None:
+        """
+        Group commit of the changes written: sync the cdc files, then
+        save their state along with the lsn of the changes written.
+        Must be called before the position is reported to the server
+        :param lsn: lsn of the changes written, None when the changes
+            written since the last commit are not up to an lsn yet
+        :type lsn: str
+        """
+        if self.state_store is None:
+            return
+        written_table_names = self._written_table_names
+        self._written_table_names = set()
+        table_states = sync_cdc_file_writers(self.table_cdc_file_writers, self.cdc_fsync)
+        self.state_store.save_table_states(table_states, lsn, written_table_names)
+        if lsn is not None:
+            self.metrics["committed_lsn"] = lsn
+
+    def _report_committed(self, replication_cursor, lsn: str, force: bool = False) -> None:
+        """
+        Commit the changes written up to a position and report it as
+        flushed to the server, at most every `cdc_commit_interval` seconds
+        :param replication_cursor: replication cursor
+        :type replication_cursor: psycopg2.extras.ReplicationCursor
+        :param lsn: position of the changes written
+        :type lsn: str
+        :param force: commit even when the commit interval is not over
+        :type force: bool
+        """
+        if lsn is None or lsn == self.feedback_lsn:
+            return
+        if not force and time.monotonic() < self._next_commit_at:
+            return
+        self._commit(lsn)
+        replication_cursor.send_feedback(flush_lsn=lsn)
+        self.feedback_lsn = lsn
+        self._next_commit_at = time.monotonic() + self.cdc_commit_interval
+
+    def _rotate_due_files(self) -> None:
+        """
+        Close the cdc files open for longer than their maximum age
+        """
+        rotated = False
+        for table_cdc_file_writer in self.table_cdc_file_writers.values():
+            rotated = table_cdc_file_writer.rotate_if_due() or rotated
+        if rotated:
+            self._commit()
+
+    def _close_files(self) -> None:
+        """
+        Close the open cdc files and the state store
+        """
+        for table_cdc_file_writer in self.table_cdc_file_writers.values():
+            table_cdc_file_writer.close()
+        if self.state_store is not None:
+            self._commit()
+            self.state_store.close()
+            self.state_store = None
+
+    def _write_table_changes(self, table_name: str, changes: List[str]) -> None:
+        """
+        Write the changes of a table to its cdc files
+        :param table_name: table name
+        :type table_name: str
+        :param changes: changes of the table
+        :type changes: List[str]
+        """
+        self.table_cdc_file_writers[table_name].write(changes)
+        self._written_table_names.add(table_name)
+
+    def _submit(self) -> None:
+        """
+        Submit the pending changes to the pipeline
+        """
+        if self.pending_lsn is None and len(self.pending_rows) == 0:
+            return
+        self.pipeline.submit(self.pending_rows, self.pending_lsn)
+        self.pending_rows = []
+        self.pending_byte_count = 0
+        self.pending_lsn = None
+
+    def _report_acknowledged(self, replication_cursor, force: bool = False) -> None:
+        """
+        Commit the position written by all the writers of the
+        pipeline and report it as flushed to the server
+        :param replication_cursor: replication cursor
+        :type replication_cursor: psycopg2.extras.ReplicationCursor
+        :param force: commit even when the commit interval is not over
+        :type force: bool
+        """
+        self.pipeline.raise_error()
+        self._report_committed(replication_cursor, self.pipeline.acknowledged_lsn, force)
+
+    def _persist(self, replication_cursor, force: bool = False) -> None:
+        """
+        Write the pending changes to the cdc files, then commit
+        their position and report it as flushed to the server
+        :param replication_cursor: replication cursor
+        :type replication_cursor: psycopg2.extras.ReplicationCursor
+        :param force: commit even when the commit interval is not over
+        :type force: bool
+        """
+        if self.pending_lsn is None and len(self.pending_changes.keys()) == 0:
+            self._report_committed(replication_cursor, self.written_lsn, force)
+            return
+        if len(self.pending_changes.keys()) > 0:
+            cdc_captured_details = {}
+            for table_name in self.pending_changes.keys():
+                cdc_captured_details[table_name] = len(self.pending_changes[table_name])
+                self._write_table_changes(table_name, self.pending_changes[table_name])
+            self.logger.info(f"Following tables has change data: {cdc_captured_details}")
+        if self.pending_lsn is not None:
+            self.written_lsn = self.pending_lsn
+        self.pending_changes = {}
+        self.pending_byte_count = 0
+        self.pending_lsn = None
+        self._report_committed(replication_cursor, self.written_lsn, force)
+
+    def execute(self):
+        self.logger.info("in progress - started")
+        connection = psycopg2.connect(self.connection_string)
+        connection.autocommit = True
+        cursor = connection.cursor()
+        slot_name = self.slot_name
+
+        # create the slot, if doesn't already exists
+        cursor.execute(f"SELECT 1 FROM pg_replication_slots WHERE slot_name = '{slot_name}';")
+        if len(cursor.fetchall()) == 0:
+            cursor.execute(f"SELECT 'init' FROM "
+                           f"pg_create_logical_replication_slot('{slot_name}', 'wal2json');")
+
+        # cdc file writers resume from the state store, without listing the folders
+        self.state_store = CDCStateStore(os.path.join(self.output_folder_location,
+                                                      cdc_state_file_name(slot_name)))
+        self.table_cdc_file_writers = \
+            create_cdc_file_writers(self.output_folder_location,
+                                    self.table_names,
+                                    self.table_settings,
+                                    self.cdc_file_size_bytes,
+                                    self.cdc_file_max_records,
+                                    self.cdc_file_max_age_seconds,
+                                    self.state_store.get_table_states())
+
+        replication_connection = psycopg2.connect(self.connection_string,
+                                                  connection_factory=LogicalReplicationConnection)
+        replication_cursor = replication_connection.cursor()
+        replication_cursor.start_replication(slot_name=slot_name,
+                                             decode=True,
+                                             options=self.wal2json_options)
+        self._set_status(f"streaming from {slot_name}")
+        if self.pipeline is not None:
+            self.pipeline.start()
+        flush_at = None
+        try:
+            while self.is_running:
+                message = replication_cursor.read_message()
+                if message is not None:
+                    self._receive(message)
+                    if flush_at is None:
+                        flush_at = time.monotonic() + self.stream_flush_interval
+                if flush_at is not None \
+                        and (time.monotonic() >= flush_at
+                             or self.pending_byte_count >= self.cdc_batch_max_bytes):
+                    if self.pipeline is None:
+                        self._persist(replication_cursor)
+                    else:
+                        self._submit()
+                    flush_at = None
+                if self.pipeline is not None:
+                    self._report_acknowledged(replication_cursor)
+                elif flush_at is None:
+                    # changes written and not committed, once the commit interval is over
+                    self._report_committed(replication_cursor, self.written_lsn)
+                if message is None:
+                    self._rotate_due_files()
+                    # wait for the next message, or till the pending changes are due
+                    timeout = self.stream_flush_interval if flush_at is None \
+                        else max(flush_at - time.monotonic(), 0)
+                    select.select([replication_connection], [], [], timeout)
+            if self.pipeline is None:
+                self._persist(replication_cursor, force=True)
+            else:
+                self._submit()
+                self.pipeline.stop()
+                self._report_acknowledged(replication_cursor, force=True)
+        finally:
+            replication_connection.close()
+            self._close_files()
+
+        try:
+            self._drop_slot(cursor, slot_name)
+        finally:
+            connection.close()
+        self.logger.info("stopped")
+
+    def _drop_slot(self, cursor, slot_name: str) -> None:
+        """
+        Drop the replication slot, once the walsender of the closed
+        replication connection released it
+        :param cursor: cursor of an autocommit connection
+        :param slot_name: replication slot name
+        :type slot_name: str
+        """
+        self.logger.info(f"cleaning the {slot_name}")
+        release_wait = 0.1
+        give_up_at = time.monotonic() + SLOT_RELEASE_TIMEOUT
+        while True:
+            cursor.execute("SELECT active FROM pg_replication_slots WHERE slot_name = %s;",
+                           (slot_name,))
+            row = cursor.fetchone()
+            if row is None:
+                return
+            if not row[0]:
+                try:
+                    cursor.execute("SELECT pg_drop_replication_slot(%s);", (slot_name,))
+                    self.logger.info(f"cleared the {slot_name}")
+                    return
+                except psycopg2.errors.ObjectInUse:
+                    # acquired again since
+                    pass
+            if time.monotonic() >= give_up_at:
+                self.logger.error(f"{slot_name} is still active, it is not dropped")
+                return
+            time.sleep(release_wait)
+            release_wait = min(release_wait * 2, 1)
+
+    def setup_graceful_shutdown(self) -> None:
+        """
+        Handles the graceful shutdown of the process.
+        Cleans the slot from pg, if already created
+        :return:
+        """
+        def signal_handler(sig, frame):
+            self.logger.info("stopping, the slot is cleaned once stopped")
+            self.is_running = False
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
@@ -0,0 +1,55 @@
+class AdaptivePollScheduler:
+    """
+    Interval between the polls of the source database for changes.
+
+    The next poll is immediate while the batches come back full
+    (more changes are pending), after `min_interval` seconds when the
+    last poll had changes, and the interval grows by `backoff_factor`
+    on every poll without changes, up to `max_interval` seconds.
+
+    :param min_interval: seconds between the polls having changes
+    :type min_interval: float
+    :param max_interval: maximum seconds between the polls without
+        changes. Default is `min_interval`, no back off
+    :type max_interval: float
+    :param backoff_factor: factor the interval is multiplied by on
+        every poll without changes. Default is `2`
+    :type backoff_factor: float
+    """
+
+    def __init__(self,
+                 min_interval: float,
+                 max_interval: float = None,
+                 backoff_factor: float = 2) -> None:
+        if min_interval is None or min_interval < 0:
+            raise ValueError(f"Incorrect value provided for poll_frequency `{min_interval}`")
+        if max_interval is None:
+            max_interval = min_interval
+        if max_interval < min_interval:
+            raise ValueError(f"Incorrect value provided for poll_max_interval `{max_interval}`")
+        if backoff_factor is None or backoff_factor < 1:
+            raise ValueError(f"Incorrect value provided for "
+                             f"poll_backoff_factor `{backoff_factor}`")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        # current interval, seconds till the next poll
+        self.interval = min_interval
+
+    def next_interval(self, has_changes: bool, batch_full: bool) -> float:
+        """
+        Seconds to wait before the next poll
+        :param has_changes: whether the last poll read any change
+        :type has_changes: bool
+        :param batch_full: whether the batch of the last poll was full
+        :type batch_full: bool
+        :return: seconds to wait
+        """
+        if batch_full:
+            self.interval = 0
+        elif has_changes or self.interval < self.min_interval:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(max(self.interval, 0.001) * self.backoff_factor,
+                                self.max_interval)
+        return self.interval
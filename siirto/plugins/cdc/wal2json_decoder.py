@@ -0,0 +1,159 @@
+"""
+Decoding of the changes sent by the wal2json output plugin.
+
+With format-version 1 every transaction is a json document, which is
+parsed and every change of it is serialized again.
+With format-version 2 every change is a json document of its own,
+only its action, schema and table are read and the change is kept
+as sent by wal2json. `orjson` is used to read them when installed
+(format-version 1 changes are parsed with `json`, orjson turns the
+integers out of the 64 bit range into floats).
+"""
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WAL2JSON_FORMAT_VERSIONS = [1, 2]
+
+# start of a format-version 2 change of a table, as sent by wal2json
+_CHANGE_HEADER_PATTERN = re.compile(r'\{"action":"(\w)",'
+                                    r'"schema":"((?:[^"\\]|\\.)*)",'
+                                    r'"table":"((?:[^"\\]|\\.)*)"')
+
+
+def _json_loads(data: str):
+    """
+    Parse json, using orjson when installed
+    :param data: json
+    :type data: str
+    :return: parsed json
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_string(value: str) -> str:
+    """
+    Unescape the content of a json string
+    :param value: content of the json string, without the quotes
+    :type value: str
+    :return: string
+    """
+    return _json_loads(f'"{value}"') if "\\" in value else value
+
+
+def wal2json_options(format_version: int, table_names: List[str]) -> Dict[str, str]:
+    """
+    Options of the wal2json output plugin
+    :param format_version: wal2json format-version, `1|2`
+    :type format_version: int
+    :param table_names: tables to send the changes of, schema.table_name
+    :type table_names: List[str]
+    :return: option name -> value
+    """
+    if format_version not in WAL2JSON_FORMAT_VERSIONS:
+        raise ValueError(f"Incorrect value provided for "
+                         f"wal2json_format_version `{format_version}`")
+    options = {"add-tables": ",".join(table_names)}
+    if format_version == 2:
+        options["format-version"] = "2"
+    return options
+
+
+def is_transaction_end(data: str) -> bool:
+    """
+    Whether a wal2json change (format-version 2) ends a transaction
+    :param data: change, as sent by wal2json
+    :type data: str
+    :return: True for the commit of a transaction
+    """
+    return data.startswith('{"action":"C"')
+
+
+def collect_table_changes(data: str,
+                          rows_collected: Dict[str, List[str]]) -> int:
+    """
+    Collect the changes of a wal2json transaction (format-version 1)
+    per table
+    :param data: transaction, as sent by wal2json
+    :type data: str
+    :param rows_collected: changes per table name, serialized as json.
+        Changes of the transaction are appended to it
+    :type rows_collected: Dict[str, List[str]]
+    :return: number of changes collected
+    """
+    change_set = json.loads(data)
+    change_set_entries = change_set["change"] if 'change' in change_set else []
+    change_count = 0
+    for change_set_entry in change_set_entries:
+        table_name = f"{change_set_entry['schema']}.{change_set_entry['table']}" \
+            if 'table' in change_set_entry else None
+        if table_name:
+            if table_name in rows_collected:
+                rows_collected[table_name].append(json.dumps(change_set_entry))
+            else:
+                rows_collected[table_name] = [json.dumps(change_set_entry)]
+            change_count += 1
+    return change_count
+
+
+def decode_change_routing(data: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Action and table of a wal2json change (format-version 2).
+    Only the start of the change is read, the whole change is parsed
+    only when it is not in the format sent by wal2json
+    :param data: change, as sent by wal2json
+    :type data: str
+    :return: action (`B|C|I|U|D|T|M`) and table name (schema.table_name),
+        None for the changes not of a table
+    """
+    match = _CHANGE_HEADER_PATTERN.match(data)
+    if match:
+        return match.group(1), f"{_json_string(match.group(2))}.{_json_string(match.group(3))}"
+    change = _json_loads(data)
+    table_name = f"{change['schema']}.{change['table']}" if 'table' in change else None
+    return change.get("action"), table_name
+
+
+def collect_table_change(data: str,
+                         rows_collected: Dict[str, List[str]]) -> Optional[str]:
+    """
+    Collect a wal2json change (format-version 2) under its table
+    :param data: change, as sent by wal2json
+    :type data: str
+    :param rows_collected: changes per table name, as sent by wal2json.
+        The change is appended to it, when it is a change of a table
+    :type rows_collected: Dict[str, List[str]]
+    :return: action of the change, `C` for the end of a transaction
+    """
+    action, table_name = decode_change_routing(data)
+    if table_name:
+        if table_name in rows_collected:
+            rows_collected[table_name].append(data)
+        else:
+            rows_collected[table_name] = [data]
+    return action
+
+
+def decode_changes(rows: List[str], format_version: int) -> Dict[str, List[str]]:
+    """
+    Decode a batch of wal2json rows into the changes per table
+    :param rows: rows, as sent by wal2json
+    :type rows: List[str]
+    :param format_version: wal2json format-version of the rows, `1|2`
+    :type format_version: int
+    :return: changes per table name
+    """
+    rows_collected = {}
+    for data in rows:
+        if format_version == 1:
+            collect_table_changes(data, rows_collected)
+        else:
+            collect_table_change(data, rows_collected)
+    return rows_collected
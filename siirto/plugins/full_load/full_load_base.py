@@ -1,10 +1,13 @@
 import importlib
 import os
-from typing import Callable
+from typing import Any, Callable
 
 from siirto.base import Base
 from siirto.shared.enums import PlugInType
 
+# application_name of the full load connections, tells them apart from
+# the workload of the source
+FULL_LOAD_APPLICATION_NAME = "siirto_full_load"
 
 class FullLoadBase(Base):
     """
@@ -23,6 +26,16 @@ class FullLoadBase(Base):
     :type table_name: str
     :param notify_on_completion: callback on completion of full load process
     :type notify_on_completion: Callable[[Any], None]
+    :param connection: open database connection to use instead of
+        connecting with `connection_string`. Lets a worker reuse one
+        connection for many tables, the plugin does not close it
+    :type connection: Any
+    :param incremental: export only the rows newer than the watermark
+        persisted by the previous run (LoadType.Incremental)
+    :type incremental: bool
+    :param throttle: byte/row rate throttle shared by all the full load
+        workers of the operator run, None for no throttling
+    :type throttle: siirto.shared.throttle.Throttle
     """
 
     # plugin type and plugin name
@@ -34,6 +47,9 @@ class FullLoadBase(Base):
                  connection_string: str = None,
                  table_name: str = None,
                  notify_on_completion: Callable[[str, str, str], None] = None,
+                 connection: Any = None,
+                 incremental: bool = False,
+                 throttle: Any = None,
                  *args,
                  **kwargs):
         super().__init__(*args, **kwargs)
@@ -55,6 +71,9 @@ class FullLoadBase(Base):
         self.status = "not started"
         self.connection_string = connection_string
         self.table_name = table_name
+        self.connection = connection
+        self.incremental = incremental
+        self.throttle = throttle
 
     def execute(self):
         """
@@ -1,20 +1,148 @@
+import hashlib
+import json
 import os
 import psycopg2
+import shlex
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import signal
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
 
-from siirto.plugins.full_load.full_load_base import FullLoadBase
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ, quote_ident
+
+from siirto.plugins.full_load.full_load_base import FullLoadBase, FULL_LOAD_APPLICATION_NAME
+from siirto.plugins.full_load.split_file_writer import BinarySplitFileWriter, \
+    ColumnarSplitFileWriter, SplitFileWriter
+from siirto.shared.columnar import arrow_schema, validate_output_format
+from siirto.shared.compression import COMPRESSIONS, compression_of_file, file_extension, \
+    open_file, validate_compression
 from siirto.shared.enums import PlugInType
+from siirto.shared.pg_text_copy import decode_copy_text_line, record_text
+
+# hash of a row, first 60 bits of the md5 of its record text.
+# hash of a chunk is the sum of the hashes of its rows
+ROW_HASH_SQL = "('x' || substr(md5(ROW({select_list})::text), 1, 15))::bit(60)::bigint"
+
+# commands used by the server side COPY to compress the part files
+SERVER_COMPRESSION_COMMANDS = {
+    "gzip": "gzip -{level}",
+    "zstd": "zstd -q -{level}",
+    "lz4": "lz4 -q -{level}",
+}
 
 
 class PgDefaultFullLoadPlugin(FullLoadBase):
     """
     Postgres full load default plugin.
 
+    The export is planned in chunks and the plan is persisted in
+    `_manifest.json` of the output folder, along with the row count,
+    byte size and part files of every completed chunk. Once the export
+    is completed, the manifest gets the total row count and byte size
+    and `parts`, the row count, byte size, file size and sha256 of
+    every part file (computed while it is written), before `_success`
+    is created. On restart,
+    completed chunks are skipped and only the missing chunks are
+    exported again (under a new snapshot). Tables having `_success`
+    are not exported again.
+
+    Incremental load exports the rows having `watermark_column` (see
+    `table_settings`) newer than the watermark of the previous run and
+    up to the maximum value seen in the snapshot of the current run.
+    Every run is written to a `run_{index}` folder of the output folder,
+    with the same layout as the full load. The watermark and the index
+    of the last completed run are persisted in `_watermark.json`.
+
+    Reconciliation (`reconcile`) compares every completed chunk of the
+    manifest with the source: row count and sum of the row hashes are
+    computed on the source (by `parallel_workers` workers, under one
+    snapshot) and from the part files. Only the chunks which differ are
+    exported again, in the same snapshot.
+
+    Server side COPY (`server_side_copy`) lets the postgres server write
+    the part files, when it mounts the output folder too. With the
+    privilege to run programs, `COPY ... TO PROGRAM 'split ...'` writes
+    the part files (compressed by the command of the compression, on
+    the server). `split` rolls the part files over on one limit only,
+    `split_file_size_bytes` when it is set (whole lines), otherwise
+    `split_file_size_limit`. With the privilege to write files only,
+    every chunk is written by `COPY ... TO 'file'` to a single part
+    file, without compression. Otherwise the COPY stream is received as usual.
+    Parts of server side COPY have the file size only in the manifest.
+
+    Columnar output (`output_format`) writes typed Parquet or Arrow IPC
+    part files directly from the COPY stream, using the column types of
+    the catalog. Requires the optional `pyarrow` package.
+
     :param split_file_size_limit: number of lines after which a
         new file will be created. Default is `1000000` lines.
+        The COPY stream is split while it is received, no intermediate
+        file is written.
     :type split_file_size_limit: int
+    :param split_file_size_bytes: number of bytes (before compression)
+        after which a new file will be created. Default is None, files
+        are rolled over only on `split_file_size_limit`. When both are
+        set, the limit reached first rolls the file over, except for the
+        server side COPY which uses only `split_file_size_bytes`.
+    :type split_file_size_bytes: int
+    :param parallel_workers: number of workers exporting the table.
+        Default is `1`. Chunks of the table are exported by the workers
+        under the same exported snapshot.
+        Leaf partitions of a partitioned table are exported by the
+        workers under one snapshot, in a folder per partition.
+    :type parallel_workers: int
+    :param chunk_count: number of chunks the table is split in.
+        Default is `parallel_workers`. Table is split in primary key
+        ranges (ctid page ranges, if table has no single column
+        integer primary key). A chunk is the unit of restart.
+    :type chunk_count: int
+    :param compression: compression of the part files, `gzip|zstd|lz4`.
+        COPY stream is compressed while it is written, part files keep
+        the same boundaries. Default is None, no compression.
+        `zstd` and `lz4` require `zstandard` and `lz4` packages.
+    :type compression: str
+    :param compression_level: compression level. Default is the
+        default level of the compression.
+    :type compression_level: int
+    :param copy_format: format of the COPY stream, `text|binary`.
+        Default is `text`. `binary` streams `COPY ... (FORMAT binary)`
+        to `.bin` part files split on tuple boundaries, each a complete
+        binary COPY file, readable with `siirto.shared.pg_binary_copy`.
+    :type copy_format: str
+    :param table_settings: settings per table, table name -> settings.
+        `columns` (list of columns to export) and `where` (condition on
+        the rows to export) turn the export into
+        `COPY (SELECT columns FROM table WHERE condition) TO STDOUT`.
+        `watermark_column` (e.g. `updated_at` or a serial id) is
+        required by the incremental load.
+        For example, `{"public.employee": {"columns": ["id", "name"],
+        "where": "active", "watermark_column": "id"}}`.
+        Default is None, all columns and rows.
+    :type table_settings: Dict
+    :param reconcile: reconcile the part files of the previous run with
+        the source and export again only the chunks which differ.
+        Requires `text` copy format. Default is False.
+    :type reconcile: bool
+    :param server_side_copy: let the server write the part files, see
+        above. Requires `text` copy format. Default is False.
+    :type server_side_copy: bool
+    :param server_path_mapping: path prefix seen by siirto -> path prefix
+        seen by the postgres server, for the output folder. For example,
+        `{"/mnt/share": "/shared"}`. Default is None, same paths.
+    :type server_path_mapping: Dict
+    :param output_format: format of the part files, `copy|parquet|arrow`.
+        Default is `copy`, part files as received from the COPY stream
+        (`copy_format`). `parquet` and `arrow` (Arrow IPC file) write
+        typed `.parquet`/`.arrow` part files, compressed by the format
+        (`compression`), and require `text` copy format.
+    :type output_format: str
+    :param row_group_size: number of rows of a row group of the columnar
+        part files, rows are held in memory till a row group is written.
+        Default is `100000`.
+    :type row_group_size: int
 
     """
 
@@ -24,15 +152,118 @@ class PgDefaultFullLoadPlugin(FullLoadBase):
     plugin_parameters = {
         "split_file_size_limit": {
             "type": int
+        },
+        "split_file_size_bytes": {
+            "type": int
+        },
+        "parallel_workers": {
+            "type": int
+        },
+        "chunk_count": {
+            "type": int
+        },
+        "compression": {
+            "type": str
+        },
+        "compression_level": {
+            "type": int
+        },
+        "copy_format": {
+            "type": str
+        },
+        "table_settings": {
+            "type": json.loads
+        },
+        "reconcile": {
+            "type": lambda value: value == "True"
+        },
+        "server_side_copy": {
+            "type": lambda value: value == "True"
+        },
+        "server_path_mapping": {
+            "type": json.loads
+        },
+        "output_format": {
+            "type": str
+        },
+        "row_group_size": {
+            "type": int
         }
     }
 
     def __init__(self,
                  split_file_size_limit: int = 1000000,
+                 split_file_size_bytes: int = None,
+                 parallel_workers: int = 1,
+                 chunk_count: int = None,
+                 compression: str = None,
+                 compression_level: int = None,
+                 copy_format: str = "text",
+                 table_settings: Dict = None,
+                 reconcile: bool = False,
+                 server_side_copy: bool = False,
+                 server_path_mapping: Dict = None,
+                 output_format: str = "copy",
+                 row_group_size: int = 100000,
                  *args,
                  **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.split_file_size_limit = split_file_size_limit
+        self.split_file_size_bytes = split_file_size_bytes
+        self.parallel_workers = parallel_workers
+        self.chunk_count = chunk_count or parallel_workers
+        self.compression = compression or None
+        self.compression_level = compression_level
+        self.copy_format = copy_format
+        if table_settings is not None and not isinstance(table_settings, dict):
+            ex_msg = f"Incorrect value provided for table_settings `{table_settings}`"
+            raise ValueError(ex_msg)
+        settings_of_table = (table_settings or {}).get(self.table_name, {})
+        self.columns = settings_of_table.get("columns")
+        self.where = settings_of_table.get("where")
+        self.watermark_column = settings_of_table.get("watermark_column")
+        if self.incremental and self.watermark_column is None:
+            ex_msg = f"watermark_column is not provided for table `{self.table_name}`"
+            raise ValueError(ex_msg)
+        # condition on the watermark column of the current incremental run
+        self.watermark_condition = None
+        if self.columns is not None \
+                and (not isinstance(self.columns, list) or len(self.columns) == 0):
+            ex_msg = f"Incorrect value provided for columns `{self.columns}` " \
+                     f"of table `{self.table_name}`"
+            raise ValueError(ex_msg)
+        self.reconcile = reconcile
+        self.server_side_copy = server_side_copy
+        self.server_path_mapping = server_path_mapping or {}
+        self.output_format = output_format or "copy"
+        self.row_group_size = row_group_size
+        # `program`, `file` or None, decided by the privileges of the role
+        self._server_side_copy_mode = None
+        validate_compression(self.compression)
+        if self.copy_format not in ["text", "binary"]:
+            ex_msg = f"Incorrect value provided for copy_format `{copy_format}`"
+            raise ValueError(ex_msg)
+        if self.reconcile and self.copy_format != "text":
+            ex_msg = f"Reconciliation is not supported for copy_format `{copy_format}`"
+            raise ValueError(ex_msg)
+        if self.server_side_copy and self.copy_format != "text":
+            ex_msg = f"Server side COPY is not supported for copy_format `{copy_format}`"
+            raise ValueError(ex_msg)
+        if self.output_format != "copy":
+            validate_output_format(self.output_format, self.compression)
+            if self.copy_format != "text" or self.reconcile or self.server_side_copy:
+                ex_msg = f"output_format `{self.output_format}` requires text copy_format, " \
+                         f"without reconcile and server_side_copy"
+                raise ValueError(ex_msg)
+        if self.parallel_workers is None or self.parallel_workers < 1:
+            ex_msg = f"Incorrect value provided for parallel_workers `{parallel_workers}`"
+            raise ValueError(ex_msg)
+        if self.chunk_count < 1:
+            ex_msg = f"Incorrect value provided for chunk_count `{chunk_count}`"
+            raise ValueError(ex_msg)
+        self.manifest_file = os.path.join(self.output_folder_location, "_manifest.json")
+        self.watermark_file = os.path.join(self.output_folder_location, "_watermark.json")
+        self._manifest_lock = threading.Lock()
 
     def _set_status(self, status):
         self.status = status
@@ -40,66 +271,792 @@ class PgDefaultFullLoadPlugin(FullLoadBase):
 
     def execute(self):
         self.logger.info("in progress - started")
+        watermark = None
+        if self.incremental:
+            watermark = self._start_incremental_run()
         success_file = os.path.join(self.output_folder_location, f"_success")
-        if os.path.exists(success_file):
-            self.logger.info("Process already completed successfully before.")
-        connection = psycopg2.connect(self.connection_string)
-        cursor = connection.cursor()
-        # copy_query = f"\\COPY {self.table_name} TO program 'split -dl 1000000 " \
-        #              f"--a _{self.table_name}.csv' (format csv)"
-        shutil.rmtree(self.output_folder_location)
-        os.makedirs(self.output_folder_location)
-        file_to_write = os.path.join(self.output_folder_location, f"{self.table_name}_full.csv")
-        with open(file_to_write, "w") as output_file:
-            cursor.copy_to(output_file, self.table_name)
-        self._set_status("in progress - bulk file created")
-        if os.stat(file_to_write).st_size == 0:
-            self._set_status("completed - no records found")
-            self._rename_file(file_to_write)
-            if self.notify_on_completion is not None:
-                self.notify_on_completion(
-                    **{
-                        'status': 'success',
-                        'table_name': self.table_name,
-                        'error': "Table was empty"
-                    }
-                )
-            Path(success_file).touch()
+        if os.path.exists(success_file) and not self.reconcile:
+            if self.incremental:
+                with open(self.manifest_file, "r") as manifest_file:
+                    self._save_watermark(watermark, json.load(manifest_file))
+            self._set_status("completed - process already completed successfully before")
+            self._notify_completion()
             return
+        manifest = self._load_manifest()
+        if manifest is None:
+            # nothing to resume, remove the leftovers
+            shutil.rmtree(self.output_folder_location)
+            os.makedirs(self.output_folder_location)
+        connection = self.connection \
+            or psycopg2.connect(self.connection_string,
+                                application_name=FULL_LOAD_APPLICATION_NAME)
+        try:
+            connection.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ,
+                                   readonly=True)
+            cursor = connection.cursor()
+            if manifest is None:
+                manifest = {
+                    "table_name": self.table_name,
+                    "compression": self.compression,
+                    "copy_format": self.copy_format,
+                    "output_format": self.output_format,
+                    "columns": self.columns,
+                    "where": self.where,
+                    "chunks": self._plan_chunks(cursor),
+                    "completed_chunks": {}
+                }
+                if self.incremental:
+                    manifest.update(self._plan_watermark(cursor, watermark["watermark"]))
+                self._save_manifest(manifest)
+            self.watermark_condition = manifest.get("watermark_condition")
+            if self.server_side_copy:
+                self._server_side_copy_mode = self._get_server_side_copy_mode(cursor)
+            if self.reconcile and self._reconcile_chunks(cursor, manifest) > 0 \
+                    and os.path.exists(success_file):
+                os.remove(success_file)
+            pending_chunks = [chunk for chunk in manifest["chunks"]
+                              if str(chunk["index"]) not in manifest["completed_chunks"]]
+            self._set_status(f"in progress - {len(pending_chunks)} of "
+                             f"{len(manifest['chunks'])} chunks to export")
+            for chunk in pending_chunks:
+                self._clean_chunk(chunk)
+            if len(pending_chunks) == 1:
+                # COPY stream is split into the part files while it is received
+                self._complete_chunk(manifest,
+                                     pending_chunks[0],
+                                     self._export_chunk(cursor, pending_chunks[0]))
+            elif len(pending_chunks) > 1:
+                self._export_chunks_in_parallel(cursor, manifest, pending_chunks)
+            connection.commit()
+        finally:
+            if self.connection is None:
+                connection.close()
+            else:
+                # connection is reused for the next table
+                connection.rollback()
+        row_count, part_file_count = self._publish_manifest(manifest)
+        self.logger.info(f"file written with records: {row_count}")
+        if row_count == 0:
+            self._set_status("completed - no records found")
+            self._notify_completion("Table was empty")
+        else:
+            self._set_status(f"completed - {part_file_count} files created")
+            self._notify_completion()
+        Path(success_file).touch()
+        if self.incremental:
+            self._save_watermark(watermark, manifest)
+
+    def _start_incremental_run(self) -> Dict:
+        """
+        Load the watermark of the previous run and
+        point the output to the folder of the current run
+        :return: watermark of the previous run
+        """
+        watermark = {"watermark": None, "run": 0}
+        if os.path.exists(self.watermark_file):
+            with open(self.watermark_file, "r") as watermark_file:
+                watermark = json.load(watermark_file)
+        self.output_folder_location = os.path.join(os.path.dirname(self.watermark_file),
+                                                   f"run_{watermark['run'] + 1:06d}")
+        if not os.path.exists(self.output_folder_location):
+            os.makedirs(self.output_folder_location)
+        self.manifest_file = os.path.join(self.output_folder_location, "_manifest.json")
+        self.logger.info(f"incremental run {watermark['run'] + 1} "
+                         f"from watermark `{watermark['watermark']}`")
+        return watermark
 
-        line_count = PgDefaultFullLoadPlugin.file_len(file_to_write)
+    def _plan_watermark(self, cursor, low_watermark: str) -> Dict:
+        """
+        Find the watermark of the current run (maximum value of the
+        watermark column in the snapshot) and the condition of the rows
+        to export
+        :param cursor: cursor of the snapshot
+        :param low_watermark: watermark of the previous run, None for first run
+        :type low_watermark: str
+        :return: low_watermark, high_watermark and watermark_condition
+        """
+        watermark_column = quote_ident(self.watermark_column, cursor)
+        query = f"SELECT max({watermark_column})::text FROM {self.table_name}"
+        if self.where is not None:
+            query = f"{query} WHERE {self.where}"
+        cursor.execute(query)
+        high_watermark = cursor.fetchone()[0]
+        if high_watermark is None:
+            # nothing to export, keep the previous watermark
+            high_watermark = low_watermark
+        conditions = []
+        if low_watermark is not None:
+            conditions.append(cursor.mogrify(f"{watermark_column} > %s",
+                                             (low_watermark,)).decode())
+        if high_watermark is not None:
+            conditions.append(cursor.mogrify(f"{watermark_column} <= %s",
+                                             (high_watermark,)).decode())
+        return {
+            "low_watermark": low_watermark,
+            "high_watermark": high_watermark,
+            "watermark_condition": " AND ".join(conditions) if conditions else "FALSE"
+        }
+
+    def _save_watermark(self, watermark: Dict, manifest: Dict) -> None:
+        """
+        Persist the watermark of the completed run, file is replaced atomically
+        :param watermark: watermark of the previous run
+        :type watermark: Dict
+        :param manifest: manifest of the completed run
+        :type manifest: Dict
+        """
+        watermark_file_to_write = f"{self.watermark_file}.tmp"
+        with open(watermark_file_to_write, "w") as watermark_file:
+            json.dump({
+                "watermark": manifest["high_watermark"],
+                "run": watermark["run"] + 1
+            }, watermark_file, indent=2)
+            watermark_file.flush()
+            os.fsync(watermark_file.fileno())
+        os.replace(watermark_file_to_write, self.watermark_file)
 
-        self.logger.info(f"file written with records: {line_count}")
-        split_command = f'cd {self.output_folder_location} && split ' \
-                        f'-dl {self.split_file_size_limit} {file_to_write} ' \
-                        f'--a _{self.table_name}.csv'
-        os.system(split_command)
-        self._set_status("in progress - smaller files created")
-        self._rename_file(file_to_write)
-        self._set_status("completed")
+    def _publish_manifest(self, manifest: Dict) -> Tuple[int, int]:
+        """
+        Add the totals and the parts, in the order of the data, to the
+        manifest of the completed export. Consumers can verify and plan
+        their work using the manifest, without reading the part files
+        :param manifest: manifest of the table
+        :type manifest: Dict
+        :return: row count and part file count
+        """
+        completed_chunks = [manifest["completed_chunks"][str(chunk["index"])]
+                            for chunk in manifest["chunks"]]
+        manifest["parts"] = [part for completed_chunk in completed_chunks
+                             for part in completed_chunk.get("parts", [])]
+        manifest["row_count"] = sum(completed_chunk["row_count"]
+                                    for completed_chunk in completed_chunks)
+        byte_sizes = [completed_chunk["byte_size"] for completed_chunk in completed_chunks]
+        # byte size is not known for compressed parts written on the server
+        manifest["byte_size"] = sum(byte_sizes) if None not in byte_sizes else None
+        self._save_manifest(manifest)
+        return manifest["row_count"], sum(len(completed_chunk["part_files"])
+                                          for completed_chunk in completed_chunks)
+
+    def _notify_completion(self, error: str = None) -> None:
         if self.notify_on_completion is not None:
             self.notify_on_completion(
                 **{
                     'status': 'success',
                     'table_name': self.table_name,
-                    'error': None
+                    'error': error
                 }
             )
-        Path(success_file).touch()
 
-    def _rename_file(self, file_to_write):
-        if len(os.listdir(self.output_folder_location)) == 1:
-            new_file_name = os.path.join(self.output_folder_location, f"x00_{self.table_name}.csv")
-            os.rename(file_to_write, new_file_name)
+    def _load_manifest(self) -> Dict:
+        """
+        Load the manifest of the previous run. The run is resumed with
+        the same output parameters only, part files of a table share them
+        :return: manifest, None if not available
+        """
+        if not os.path.exists(self.manifest_file):
+            return None
+        with open(self.manifest_file, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        for output_parameter in ["compression", "copy_format", "output_format",
+                                 "columns", "where"]:
+            if output_parameter == "output_format" and output_parameter not in manifest:
+                # manifest written before the columnar output formats
+                manifest[output_parameter] = "copy"
+            if manifest.get(output_parameter) != getattr(self, output_parameter):
+                ex_msg = f"Incorrect value provided for {output_parameter} " \
+                         f"`{getattr(self, output_parameter)}`, the full load was " \
+                         f"started with `{manifest.get(output_parameter)}`. Clear " \
+                         f"the output folder {self.output_folder_location} to start " \
+                         f"the full load again"
+                raise ValueError(ex_msg)
+        self.logger.info(f"resuming the full load, "
+                         f"{len(manifest['completed_chunks'])} of "
+                         f"{len(manifest['chunks'])} chunks already completed")
+        return manifest
+
+    def _save_manifest(self, manifest: Dict) -> None:
+        """
+        Persist the manifest, file is replaced atomically
+        :param manifest: manifest to persist
+        :type manifest: Dict
+        """
+        manifest_file_to_write = f"{self.manifest_file}.tmp"
+        with open(manifest_file_to_write, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(manifest_file_to_write, self.manifest_file)
+
+    def _complete_chunk(self,
+                        manifest: Dict,
+                        chunk: Dict,
+                        output_file: SplitFileWriter) -> None:
+        """
+        Record the completed chunk in the manifest
+        :param manifest: manifest of the table
+        :type manifest: Dict
+        :param chunk: completed chunk
+        :type chunk: Dict
+        :param output_file: writer used to write the part files of the chunk
+        :type output_file: SplitFileWriter
+        """
+        with self._manifest_lock:
+            manifest["completed_chunks"][str(chunk["index"])] = {
+                "row_count": output_file.row_count,
+                "byte_size": output_file.byte_count,
+                "part_files": [os.path.relpath(part_file, self.output_folder_location)
+                               for part_file in output_file.part_files],
+                "parts": [dict(part, part_file=os.path.relpath(part["part_file"],
+                                                               self.output_folder_location))
+                          for part in output_file.parts]
+            }
+            self._save_manifest(manifest)
+        self.logger.info(f"chunk {chunk['index']} written with records: "
+                         f"{output_file.row_count}")
+
+    def _chunk(self,
+               index: int,
+               predicate: str = None,
+               relation: str = None,
+               foreign: bool = False) -> Dict:
+        """
+        Create a chunk to export
+        :param index: index of the chunk
+        :type index: int
+        :param predicate: condition on the rows of the chunk,
+            None for all the rows
+        :type predicate: str
+        :param relation: relation to export, a leaf partition of the table.
+            None for the table itself
+        :type relation: str
+        :param foreign: whether the relation is a foreign table, exported
+            by a query as COPY does not read foreign tables
+        :type foreign: bool
+        :return: chunk
+        """
+        if relation is not None:
+            # one folder per partition, named as the table folders
+            folder = relation.replace(".", "_")
+            file_name_prefix = "x"
         else:
-            os.remove(file_to_write)
+            folder = ""
+            file_name_prefix = "x" if self.chunk_count == 1 else f"x{index:04d}_"
+        return {
+            "index": index,
+            "relation": relation or self.table_name,
+            "predicate": predicate,
+            "foreign": foreign,
+            "folder": folder,
+            "file_name_prefix": file_name_prefix
+        }
 
-    @staticmethod
-    def file_len(file_name):
-        with open(file_name) as f:
-            for i, l in enumerate(f):
-                pass
-        return i + 1
+    def _clean_chunk(self, chunk: Dict) -> None:
+        """
+        Remove the part files written by an incomplete export of the chunk
+        :param chunk: chunk to clean
+        :type chunk: Dict
+        """
+        chunk_folder = os.path.join(self.output_folder_location, chunk["folder"])
+        if not os.path.exists(chunk_folder):
+            return
+        for file_name in os.listdir(chunk_folder):
+            if file_name.startswith(chunk["file_name_prefix"]) \
+                    and f"_{chunk['relation']}." in file_name:
+                os.remove(os.path.join(chunk_folder, file_name))
+
+    def _chunk_conditions(self, chunk: Dict) -> List[str]:
+        """
+        Conditions on the rows of a chunk
+        :param chunk: chunk, created by `_chunk`
+        :type chunk: Dict
+        :return: conditions to combine with AND, empty for all the rows
+        """
+        return [f"({condition})"
+                for condition in [self.where, self.watermark_condition, chunk["predicate"]]
+                if condition is not None]
+
+    def _get_columns(self,
+                     cursor,
+                     relation: str,
+                     include_generated: bool = False) -> List[Tuple[str, str, int]]:
+        """
+        Columns of the relation. Generated columns (postgres 12+) are left
+        out, as by the COPY of the relation
+        :param cursor: cursor to query the catalog
+        :param relation: relation, schema.table_name
+        :type relation: str
+        :param include_generated: include the generated columns
+        :type include_generated: bool
+        :return: name, type name and type modifier of the columns, in the column order
+        """
+        generated_condition = ""
+        if not include_generated and cursor.connection.server_version >= 120000:
+            generated_condition = "AND a.attgenerated = '' "
+        cursor.execute("SELECT a.attname, t.typname, a.atttypmod "
+                       "FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid "
+                       "WHERE a.attrelid = %s::regclass AND a.attnum > 0 "
+                       f"AND NOT a.attisdropped {generated_condition}ORDER BY a.attnum;",
+                       (relation,))
+        return cursor.fetchall()
+
+    def _select_list(self, cursor, relation: str) -> str:
+        """
+        Columns to export, the columns of the COPY of the relation
+        when no columns are configured
+        :param cursor: cursor, used to quote the column names
+        :param relation: relation to export, schema.table_name
+        :type relation: str
+        :return: select list
+        """
+        columns = self.columns
+        if columns is None:
+            columns = [column_name for column_name, _, _ in self._get_columns(cursor, relation)]
+        return ", ".join(quote_ident(column, cursor) for column in columns)
+
+    def _export_chunk(self, cursor, chunk: Dict) -> SplitFileWriter:
+        """
+        Export a chunk of the table to the part files
+        :param cursor: cursor to run the COPY command
+        :param chunk: chunk to export, created by `_chunk`
+        :type chunk: Dict
+        :return: writer used to write the part files of the chunk
+        """
+        conditions = self._chunk_conditions(chunk)
+        if len(conditions) == 0 and self.columns is None and not chunk.get("foreign"):
+            copy_source = chunk['relation']
+        else:
+            select_query = f"SELECT {self._select_list(cursor, chunk['relation'])} " \
+                           f"FROM {chunk['relation']}"
+            if len(conditions) > 0:
+                select_query = f"{select_query} WHERE {' AND '.join(conditions)}"
+            copy_source = f"({select_query})"
+        chunk_folder = os.path.join(self.output_folder_location, chunk["folder"])
+        if not os.path.exists(chunk_folder):
+            os.makedirs(chunk_folder)
+        if self._server_side_copy_mode is not None:
+            return self._export_chunk_on_server(cursor, chunk, copy_source, chunk_folder)
+        copy_query = f"COPY {copy_source} TO STDOUT"
+        if self.output_format != "copy":
+            return self._export_chunk_to_columnar(cursor, chunk, copy_query, chunk_folder)
+        if self.copy_format == "binary":
+            copy_query = f"{copy_query} (FORMAT binary)"
+            writer_class = BinarySplitFileWriter
+        else:
+            writer_class = SplitFileWriter
+        with writer_class(chunk_folder,
+                          chunk["relation"],
+                          self.split_file_size_limit,
+                          chunk["file_name_prefix"],
+                          self.compression,
+                          self.compression_level,
+                          self.split_file_size_bytes,
+                          self.throttle) as output_file:
+            cursor.copy_expert(copy_query, output_file)
+        return output_file
+
+    def _export_chunk_to_columnar(self,
+                                  cursor,
+                                  chunk: Dict,
+                                  copy_query: str,
+                                  chunk_folder: str) -> ColumnarSplitFileWriter:
+        """
+        Export a chunk of the table to columnar part files
+        :param cursor: cursor to run the COPY command
+        :param chunk: chunk to export, created by `_chunk`
+        :type chunk: Dict
+        :param copy_query: COPY command of the chunk, text format
+        :type copy_query: str
+        :param chunk_folder: folder of the part files of the chunk
+        :type chunk_folder: str
+        :return: writer used to write the part files of the chunk
+        """
+        if self.columns is None:
+            columns = self._get_columns(cursor, chunk["relation"])
+        else:
+            # configured columns are selected, generated columns too
+            column_by_name = {column[0]: column
+                              for column in self._get_columns(cursor, chunk["relation"],
+                                                              include_generated=True)}
+            for column_name in self.columns:
+                if column_name not in column_by_name:
+                    ex_msg = f"Incorrect value provided for columns `{self.columns}`, " \
+                             f"column `{column_name}` not found in {chunk['relation']}"
+                    raise ValueError(ex_msg)
+            columns = [column_by_name[column_name] for column_name in self.columns]
+        # text output of the values, as expected by the arrow conversion
+        cursor.execute("SET LOCAL DateStyle TO 'ISO'; "
+                       "SET LOCAL TimeZone TO 'UTC'; "
+                       "SET LOCAL bytea_output TO 'hex';")
+        with ColumnarSplitFileWriter(chunk_folder,
+                                     chunk["relation"],
+                                     self.split_file_size_limit,
+                                     chunk["file_name_prefix"],
+                                     self.compression,
+                                     self.compression_level,
+                                     self.split_file_size_bytes,
+                                     self.throttle,
+                                     schema=arrow_schema(columns),
+                                     output_format=self.output_format,
+                                     row_group_size=self.row_group_size) as output_file:
+            cursor.copy_expert(copy_query, output_file)
+        return output_file
+
+    def _get_server_side_copy_mode(self, cursor) -> Optional[str]:
+        """
+        Find the server side COPY allowed by the privileges of the role
+        :param cursor: cursor of the coordinator connection
+        :return: `program` (COPY TO PROGRAM), `file` (COPY TO file)
+            or None to receive the COPY stream
+        """
+        if cursor.connection.server_version >= 110000:
+            cursor.execute("SELECT pg_has_role(current_user, 'pg_execute_server_program', "
+                           "'USAGE'), "
+                           "pg_has_role(current_user, 'pg_write_server_files', 'USAGE');")
+        else:
+            # roles are created by postgres 11, only superusers COPY on the server before
+            cursor.execute("SELECT rolsuper, rolsuper FROM pg_roles "
+                           "WHERE rolname = current_user;")
+        execute_server_program, write_server_files = cursor.fetchone()
+        if execute_server_program:
+            if self.split_file_size_bytes is not None:
+                self.logger.warning("split_file_size_limit is not used by the server side "
+                                    "COPY, part files are split on split_file_size_bytes")
+            return "program"
+        if write_server_files and self.compression is None:
+            self.logger.warning("role can not run programs on the server, "
+                                "every chunk is written to a single part file")
+            return "file"
+        self.logger.warning("role is not allowed to write the part files on the server, "
+                            "receiving the COPY stream instead")
+        return None
+
+    def _server_path(self, path: str) -> str:
+        """
+        Path seen by the postgres server, using `server_path_mapping`
+        :param path: path seen by siirto
+        :type path: str
+        :return: path seen by the server
+        """
+        path = os.path.abspath(path)
+        if not self.server_path_mapping:
+            return path
+        for siirto_prefix in sorted(self.server_path_mapping, key=len, reverse=True):
+            siirto_prefix_path = os.path.abspath(siirto_prefix)
+            if path == siirto_prefix_path or path.startswith(siirto_prefix_path + os.sep):
+                return self.server_path_mapping[siirto_prefix] + path[len(siirto_prefix_path):]
+        ex_msg = f"server_path_mapping has no mapping for `{path}`"
+        raise ValueError(ex_msg)
+
+    def _export_chunk_on_server(self,
+                                cursor,
+                                chunk: Dict,
+                                copy_source: str,
+                                chunk_folder: str) -> SimpleNamespace:
+        """
+        Export a chunk of the table by a server side COPY,
+        the server writes the part files
+        :param cursor: cursor to run the COPY command
+        :param chunk: chunk to export, created by `_chunk`
+        :type chunk: Dict
+        :param copy_source: relation or query to COPY
+        :type copy_source: str
+        :param chunk_folder: folder of the part files of the chunk
+        :type chunk_folder: str
+        :return: row_count, byte_count, part_files and parts of the chunk
+        """
+        server_chunk_folder = self._server_path(chunk_folder)
+        file_name_suffix = f"_{chunk['relation']}{SplitFileWriter.part_file_extension}"
+        if self._server_side_copy_mode == "program":
+            # split names the part files the same way as SplitFileWriter
+            split_command = ["split", "-d"]
+            if self.split_file_size_bytes is not None:
+                split_command.append(f"--line-bytes={self.split_file_size_bytes}")
+            else:
+                split_command.append(f"--lines={self.split_file_size_limit}")
+            split_command.append(f"--additional-suffix={file_name_suffix}")
+            if self.compression is not None:
+                compression_level = self.compression_level
+                if compression_level is None:
+                    compression_level = COMPRESSIONS[self.compression][1]
+                compression_command = SERVER_COMPRESSION_COMMANDS[self.compression]\
+                    .format(level=compression_level)
+                split_command.append(f"--filter={compression_command} > "
+                                     f"$FILE{file_extension(self.compression)}")
+            split_command += ["-", os.path.join(server_chunk_folder, chunk["file_name_prefix"])]
+            cursor.execute(f"COPY {copy_source} TO PROGRAM %s",
+                           (" ".join(shlex.quote(argument) for argument in split_command),))
+        else:
+            file_name = f"{chunk['file_name_prefix']}{SplitFileWriter.part_suffix(0)}" \
+                        f"{file_name_suffix}"
+            cursor.execute(f"COPY {copy_source} TO %s",
+                           (os.path.join(server_chunk_folder, file_name),))
+        row_count = cursor.rowcount
+        part_files = sorted(os.path.join(chunk_folder, file_name)
+                            for file_name in os.listdir(chunk_folder)
+                            if file_name.startswith(chunk["file_name_prefix"])
+                            and f"_{chunk['relation']}." in file_name)
+        if len(part_files) == 0:
+            # split does not create a file for an empty chunk
+            part_files.append(os.path.join(chunk_folder,
+                                           f"{chunk['file_name_prefix']}"
+                                           f"{SplitFileWriter.part_suffix(0)}{file_name_suffix}"
+                                           f"{file_extension(self.compression)}"))
+            open_file(part_files[0], "wb", self.compression, self.compression_level).close()
+        parts = [{"part_file": part_file, "file_size": os.path.getsize(part_file)}
+                 for part_file in part_files]
+        return SimpleNamespace(
+            row_count=row_count,
+            byte_count=sum(part["file_size"] for part in parts)
+            if self.compression is None else None,
+            part_files=part_files,
+            parts=parts)
+
+    def _export_chunk_in_snapshot(self,
+                                  manifest: Dict,
+                                  chunk: Dict,
+                                  snapshot_id: str) -> None:
+        """
+        Export a chunk of the table on a new connection,
+        using the snapshot exported by the coordinator connection
+        :param manifest: manifest of the table
+        :type manifest: Dict
+        :param chunk: chunk to export
+        :type chunk: Dict
+        :param snapshot_id: exported snapshot id
+        :type snapshot_id: str
+        """
+        connection = psycopg2.connect(self.connection_string,
+                                      application_name=FULL_LOAD_APPLICATION_NAME)
+        try:
+            connection.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ,
+                                   readonly=True)
+            cursor = connection.cursor()
+            cursor.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot_id,))
+            output_file = self._export_chunk(cursor, chunk)
+            connection.commit()
+        finally:
+            connection.close()
+        self._complete_chunk(manifest, chunk, output_file)
+
+    def _export_chunks_in_parallel(self,
+                                   cursor,
+                                   manifest: Dict,
+                                   chunks: List[Dict]) -> None:
+        """
+        Export the chunks using `parallel_workers` workers.
+        Snapshot is exported once and every worker imports it,
+        so the part files form one consistent image of the table.
+        :param cursor: cursor of the coordinator connection, holds the
+            snapshot till all the workers are done
+        :param manifest: manifest of the table
+        :type manifest: Dict
+        :param chunks: chunks to export
+        :type chunks: List[Dict]
+        """
+        cursor.execute("SELECT pg_export_snapshot();")
+        snapshot_id = cursor.fetchone()[0]
+        self._set_status(f"in progress - exporting {len(chunks)} chunks "
+                         f"using snapshot {snapshot_id}")
+        with ThreadPoolExecutor(max_workers=self.parallel_workers) as executor:
+            # list() raises the first error of the workers, if any
+            list(executor.map(
+                lambda chunk: self._export_chunk_in_snapshot(manifest, chunk, snapshot_id),
+                chunks))
+
+    def _reconcile_chunks(self, cursor, manifest: Dict) -> int:
+        """
+        Compare the completed chunks with the source and mark the chunks
+        which differ as pending. The source is read by `parallel_workers`
+        workers, under the snapshot of the coordinator connection
+        :param cursor: cursor of the coordinator connection
+        :param manifest: manifest of the table
+        :type manifest: Dict
+        :return: number of chunks to export again
+        """
+        if self.copy_format != "text":
+            ex_msg = f"Reconciliation is not supported for copy_format `{self.copy_format}`"
+            raise ValueError(ex_msg)
+        completed_chunks = [chunk for chunk in manifest["chunks"]
+                            if str(chunk["index"]) in manifest["completed_chunks"]]
+        self._set_status(f"in progress - reconciling {len(completed_chunks)} chunks")
+        if self.parallel_workers == 1 or len(completed_chunks) <= 1:
+            chunk_hashes = [self._source_chunk_hash(cursor, chunk) for chunk in completed_chunks]
+        else:
+            cursor.execute("SELECT pg_export_snapshot();")
+            snapshot_id = cursor.fetchone()[0]
+            with ThreadPoolExecutor(max_workers=self.parallel_workers) as executor:
+                chunk_hashes = list(executor.map(
+                    lambda chunk: self._source_chunk_hash_in_snapshot(chunk, snapshot_id),
+                    completed_chunks))
+        mismatched_chunk_count = 0
+        for chunk, source_chunk_hash in zip(completed_chunks, chunk_hashes):
+            completed_chunk = manifest["completed_chunks"][str(chunk["index"])]
+            file_chunk_hash = self._file_chunk_hash(completed_chunk)
+            if source_chunk_hash == file_chunk_hash:
+                continue
+            self.logger.warning(f"chunk {chunk['index']} differs from the source, "
+                                f"rows and hash of source {source_chunk_hash}, "
+                                f"of part files {file_chunk_hash}")
+            del manifest["completed_chunks"][str(chunk["index"])]
+            mismatched_chunk_count += 1
+        self._save_manifest(manifest)
+        self.logger.info(f"reconciliation completed, {mismatched_chunk_count} of "
+                         f"{len(completed_chunks)} chunks differ")
+        return mismatched_chunk_count
+
+    def _source_chunk_hash(self, cursor, chunk: Dict) -> Tuple[int, int]:
+        """
+        Row count and hash of a chunk, computed on the source
+        :param cursor: cursor in the snapshot transaction
+        :param chunk: chunk to hash
+        :type chunk: Dict
+        :return: row count and sum of the row hashes
+        """
+        row_hash = ROW_HASH_SQL.format(select_list=self._select_list(cursor, chunk['relation']))
+        query = f"SELECT count(*), coalesce(sum({row_hash}), 0) FROM {chunk['relation']} AS t"
+        conditions = self._chunk_conditions(chunk)
+        if len(conditions) > 0:
+            query = f"{query} WHERE {' AND '.join(conditions)}"
+        cursor.execute(query)
+        row_count, chunk_hash = cursor.fetchone()
+        return int(row_count), int(chunk_hash)
+
+    def _source_chunk_hash_in_snapshot(self, chunk: Dict, snapshot_id: str) -> Tuple[int, int]:
+        """
+        Row count and hash of a chunk, computed on a new connection
+        using the snapshot exported by the coordinator connection
+        :param chunk: chunk to hash
+        :type chunk: Dict
+        :param snapshot_id: exported snapshot id
+        :type snapshot_id: str
+        :return: row count and sum of the row hashes
+        """
+        connection = psycopg2.connect(self.connection_string,
+                                      application_name=FULL_LOAD_APPLICATION_NAME)
+        try:
+            connection.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ,
+                                   readonly=True)
+            cursor = connection.cursor()
+            cursor.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot_id,))
+            chunk_hash = self._source_chunk_hash(cursor, chunk)
+            connection.commit()
+        finally:
+            connection.close()
+        return chunk_hash
+
+    def _file_chunk_hash(self, completed_chunk: Dict) -> Tuple[int, int]:
+        """
+        Row count and hash of a chunk, computed from its part files
+        :param completed_chunk: completed chunk of the manifest
+        :type completed_chunk: Dict
+        :return: row count and sum of the row hashes, None if
+            a part file is missing
+        """
+        row_count, chunk_hash = 0, 0
+        for part_file in completed_chunk["part_files"]:
+            part_file = os.path.join(self.output_folder_location, part_file)
+            if not os.path.exists(part_file):
+                return None
+            with open_file(part_file, "rb", compression_of_file(part_file)) as binary_file:
+                for line in binary_file:
+                    row_text = record_text(decode_copy_text_line(line.decode()))
+                    chunk_hash += int(hashlib.md5(row_text.encode()).hexdigest()[:15], 16)
+                    row_count += 1
+        return row_count, chunk_hash
+
+    def _get_leaf_partitions(self, cursor) -> Optional[List[Tuple[str, str]]]:
+        """
+        Get the leaf partitions of the table, if table is partitioned
+        :param cursor: cursor in the snapshot transaction
+        :return: leaf partitions as quoted schema.table_name and relkind
+            (`f` for the foreign tables), None if table is not partitioned
+        """
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass;",
+                       (self.table_name,))
+        if cursor.fetchone()[0] != 'p':
+            return None
+        cursor.execute("WITH RECURSIVE partitions AS ("
+                       "SELECT inhrelid FROM pg_inherits "
+                       "WHERE inhparent = %s::regclass "
+                       "UNION ALL "
+                       "SELECT i.inhrelid FROM pg_inherits i "
+                       "JOIN partitions p ON i.inhparent = p.inhrelid) "
+                       "SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname), "
+                       "c.relkind "
+                       "FROM partitions p "
+                       "JOIN pg_class c ON c.oid = p.inhrelid "
+                       "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                       "WHERE c.relkind NOT IN ('p', 'I') "
+                       "ORDER BY 1;",
+                       (self.table_name,))
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+
+    def _plan_chunks(self, cursor) -> List[Dict]:
+        """
+        Split the table in chunks.
+        Leaf partitions are the chunks of a partitioned table, a partitioned
+        table without partitions has no chunks and is exported empty.
+        Otherwise table is split in `chunk_count` chunks, using primary key
+        ranges for single column integer primary keys, ctid page ranges otherwise.
+        ctid ranges are scanned as TID ranges from postgres 14 only, every
+        chunk would read the whole table before, so the table is exported
+        as a single chunk on older servers.
+        :param cursor: cursor in the snapshot transaction
+        :return: chunks
+        """
+        partitions = self._get_leaf_partitions(cursor)
+        if partitions is not None:
+            return [self._chunk(index, relation=partition, foreign=relkind == 'f')
+                    for index, (partition, relkind) in enumerate(partitions)]
+        if self.chunk_count == 1:
+            return [self._chunk(0)]
+        cursor.execute("SELECT a.attname "
+                       "FROM pg_index i "
+                       "JOIN pg_attribute a ON a.attrelid = i.indrelid "
+                       "AND a.attnum = i.indkey[0] "
+                       "WHERE i.indrelid = %s::regclass AND i.indisprimary "
+                       "AND i.indnatts = 1 "
+                       "AND a.atttypid IN ('int2'::regtype, 'int4'::regtype, 'int8'::regtype);",
+                       (self.table_name,))
+        row = cursor.fetchone()
+        if row is not None:
+            key_column = quote_ident(row[0], cursor)
+            cursor.execute(f"SELECT min({key_column}), max({key_column}) "
+                           f"FROM {self.table_name};")
+            low, high = cursor.fetchone()
+            if low is None:
+                return [self._chunk(0)]
+            boundaries = [low + (high - low + 1) * index // self.chunk_count
+                          for index in range(1, self.chunk_count)]
+
+            def condition(operator, boundary):
+                return f"{key_column} {operator} {boundary}"
+        else:
+            if cursor.connection.server_version < 140000:
+                self.logger.warning("TID range scans need postgres 14, table without "
+                                    "a single column integer primary key is exported "
+                                    "as a single chunk")
+                return [self._chunk(0)]
+            cursor.execute("SELECT pg_relation_size(%s::regclass) "
+                           "/ current_setting('block_size')::int;",
+                           (self.table_name,))
+            page_count = cursor.fetchone()[0]
+            boundaries = [page_count * index // self.chunk_count
+                          for index in range(1, self.chunk_count)]
+
+            def condition(operator, boundary):
+                return f"ctid {operator} '({boundary},0)'::tid"
+        boundaries = sorted(set(boundaries))
+        chunks = []
+        for index in range(len(boundaries) + 1):
+            conditions = []
+            if index > 0:
+                conditions.append(condition(">=", boundaries[index - 1]))
+            if index < len(boundaries):
+                conditions.append(condition("<", boundaries[index]))
+            chunks.append(self._chunk(index,
+                                      " AND ".join(conditions) if conditions else None))
+        return chunks
 
     def setup_graceful_shutdown(self) -> None:
         """
@@ -116,5 +1073,3 @@ class PgDefaultFullLoadPlugin(FullLoadBase):
 
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
-
-
@@ -0,0 +1,484 @@
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ, quote_ident
+
+from siirto.plugins.full_load.full_load_base import FullLoadBase, FULL_LOAD_APPLICATION_NAME
+from siirto.shared.enums import PlugInType
+
+
+class EventHubSender:
+    """
+    Sends batches of events to the event hub, one sender per worker.
+    Requires `azure-eventhub` package.
+
+    :param event_hub_address: event hub address
+    :type event_hub_address: str
+    :param event_hub_user: event hub user
+    :type event_hub_user: str
+    :param event_hub_key: event hub key
+    :type event_hub_key: str
+    :param event_hub_partition: event hub partition to send to
+    :type event_hub_partition: str
+    """
+
+    def __init__(self,
+                 event_hub_address: str,
+                 event_hub_user: str,
+                 event_hub_key: str,
+                 event_hub_partition: str) -> None:
+        from azure.eventhub import EventHubClient
+        self.client = EventHubClient(event_hub_address,
+                                     debug=False,
+                                     username=event_hub_user,
+                                     password=event_hub_key)
+        self.sender = self.client.add_sender(partition=event_hub_partition)
+        self.client.run()
+
+    def send(self, events: List[str]) -> None:
+        """
+        Send a batch of events, as one message
+        :param events: events, serialized as json
+        :type events: List[str]
+        """
+        from azure.eventhub import EventData
+        self.sender.send(EventData(batch=events))
+
+    def close(self) -> None:
+        self.client.stop()
+
+
+def _json_default(value: Any) -> str:
+    """ json serialization of the values not supported by json """
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+class PgFullLoadPluginToEventHub(FullLoadBase):
+    """
+    Postgres full load plugin to send the rows of a table to event hub,
+    to bootstrap the consumers of `PgCDCPluginToEventHub`.
+
+    Every row is sent as an insert event, in the same shape as the
+    changes sent by the cdc plugin, to the same partition. Rows are read in primary key order
+    by a server side cursor and sent in batches of at most
+    `event_hub_batch_size_bytes` bytes by `event_hub_concurrency`
+    workers. At most `event_hub_max_pending_batches` batches wait for
+    the workers, so the memory is bounded.
+
+    Primary key of the last row of the sent batches (all batches before
+    it are sent too) is checkpointed in `_checkpoint.json` of the output
+    folder, as the text of the key columns. On restart, rows after the
+    checkpoint are sent, under a new snapshot. Tables without primary
+    key are sent again from the start. `_success` is created once all
+    the rows are sent.
+
+    :param event_hub_address: event hub address
+    :type event_hub_address: str
+    :param event_hub_user: event hub user
+    :type event_hub_user: str
+    :param event_hub_key: event hub key
+    :type event_hub_key: str
+    :param event_hub_partition: event hub partition to send to.
+        Default is `0`, the partition of `PgCDCPluginToEventHub`.
+    :type event_hub_partition: str
+    :param event_hub_batch_size_bytes: maximum size of a batch of events.
+        Default is `250000` bytes.
+    :type event_hub_batch_size_bytes: int
+    :param event_hub_concurrency: number of workers sending the batches.
+        Default is `4`.
+    :type event_hub_concurrency: int
+    :param event_hub_max_pending_batches: maximum number of batches
+        waiting for the workers. Default is twice `event_hub_concurrency`.
+    :type event_hub_max_pending_batches: int
+    :param checkpoint_interval: minimum number of seconds (float) between
+        two checkpoints. Default is `1` second.
+    :type checkpoint_interval: float
+    :param event_hub_sender_factory: creates the sender of a worker, an
+        object having `send(events: List[str])` and `close()`.
+        Default creates an `EventHubSender`. Used to test with a stand-in
+        for the event hub client.
+    :type event_hub_sender_factory: Callable[[], Any]
+    """
+
+    # plugin type and plugin name
+    plugin_type = PlugInType.Full_Load
+    plugin_name = "PgFullLoadPluginToEventHub"
+    plugin_parameters = {
+        "event_hub_address": {
+            "type": str
+        },
+        "event_hub_user": {
+            "type": str
+        },
+        "event_hub_key": {
+            "type": str
+        },
+        "event_hub_partition": {
+            "type": str
+        },
+        "event_hub_batch_size_bytes": {
+            "type": int
+        },
+        "event_hub_concurrency": {
+            "type": int
+        },
+        "event_hub_max_pending_batches": {
+            "type": int
+        },
+        "checkpoint_interval": {
+            "type": float
+        }
+    }
+
+    def __init__(self,
+                 event_hub_address: str = None,
+                 event_hub_user: str = None,
+                 event_hub_key: str = None,
+                 event_hub_partition: str = "0",
+                 event_hub_batch_size_bytes: int = 250000,
+                 event_hub_concurrency: int = 4,
+                 event_hub_max_pending_batches: int = None,
+                 checkpoint_interval: float = 1,
+                 event_hub_sender_factory: Callable[[], Any] = None,
+                 *args,
+                 **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.event_hub_address = event_hub_address
+        self.event_hub_user = event_hub_user
+        self.event_hub_key = event_hub_key
+        self.event_hub_partition = event_hub_partition
+        self.event_hub_batch_size_bytes = event_hub_batch_size_bytes
+        self.event_hub_concurrency = event_hub_concurrency
+        self.event_hub_max_pending_batches = \
+            event_hub_max_pending_batches or 2 * (event_hub_concurrency or 1)
+        self.checkpoint_interval = checkpoint_interval
+        self.event_hub_sender_factory = event_hub_sender_factory
+        self._validate_parameters()
+        if self.event_hub_sender_factory is None:
+            self.event_hub_sender_factory = lambda: EventHubSender(self.event_hub_address,
+                                                                   self.event_hub_user,
+                                                                   self.event_hub_key,
+                                                                   self.event_hub_partition)
+        self.checkpoint_file = os.path.join(self.output_folder_location, "_checkpoint.json")
+        self._checkpoint_lock = threading.Lock()
+
+    def _validate_parameters(self):
+        """
+        Validate the parameters
+        """
+        if self.event_hub_sender_factory is None and (
+                self.event_hub_address is None
+                or len(self.event_hub_address.strip()) == 0
+                or self.event_hub_user is None
+                or len(self.event_hub_user.strip()) == 0
+                or self.event_hub_key is None
+                or len(self.event_hub_key.strip()) == 0):
+            raise ValueError("Check event hub configuration")
+        if self.event_hub_partition is None or len(self.event_hub_partition.strip()) == 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"event_hub_partition `{self.event_hub_partition}`"
+            raise ValueError(ex_msg)
+        if self.event_hub_batch_size_bytes is None or self.event_hub_batch_size_bytes <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"event_hub_batch_size_bytes `{self.event_hub_batch_size_bytes}`"
+            raise ValueError(ex_msg)
+        if self.event_hub_concurrency is None or self.event_hub_concurrency <= 0:
+            ex_msg = f"Incorrect value provided for " \
+                     f"event_hub_concurrency `{self.event_hub_concurrency}`"
+            raise ValueError(ex_msg)
+        if self.incremental:
+            raise ValueError("Incremental load is not supported by PgFullLoadPluginToEventHub")
+
+    def _set_status(self, status):
+        self.status = status
+        self.logger.info(status)
+
+    def execute(self):
+        self.logger.info("in progress - started")
+        success_file = os.path.join(self.output_folder_location, f"_success")
+        if os.path.exists(success_file):
+            self._set_status("completed - process already completed successfully before")
+            self._notify_completion()
+            return
+        checkpoint = self._load_checkpoint()
+        connection = self.connection \
+            or psycopg2.connect(self.connection_string,
+                                application_name=FULL_LOAD_APPLICATION_NAME)
+        try:
+            connection.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ,
+                                   readonly=True)
+            row_count = self._send_rows(connection, checkpoint)
+            connection.commit()
+        finally:
+            if self.connection is None:
+                connection.close()
+            else:
+                # connection is reused for the next table
+                connection.rollback()
+        self.logger.info(f"events sent for records: {row_count}")
+        if row_count == 0:
+            self._set_status("completed - no records found")
+            self._notify_completion("Table was empty")
+        else:
+            self._set_status(f"completed - {row_count} records sent")
+            self._notify_completion()
+        Path(success_file).touch()
+
+    def _notify_completion(self, error: str = None) -> None:
+        if self.notify_on_completion is not None:
+            self.notify_on_completion(
+                **{
+                    'status': 'success',
+                    'table_name': self.table_name,
+                    'error': error
+                }
+            )
+
+    def _load_checkpoint(self) -> Dict:
+        """
+        Load the checkpoint of the previous run
+        :return: checkpoint, `last_key` and `row_count` sent
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return {"last_key": None, "row_count": 0}
+        with open(self.checkpoint_file, "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.logger.info(f"resuming after key {checkpoint['last_key']}, "
+                         f"{checkpoint['row_count']} records already sent")
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint: Dict) -> None:
+        """
+        Persist the checkpoint, file is replaced atomically
+        :param checkpoint: checkpoint to persist
+        :type checkpoint: Dict
+        """
+        checkpoint_file_to_write = f"{self.checkpoint_file}.tmp"
+        with open(checkpoint_file_to_write, "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(checkpoint_file_to_write, self.checkpoint_file)
+
+    def _get_key_columns(self, cursor) -> List[str]:
+        """
+        Get the primary key columns of the table
+        :param cursor: cursor in the snapshot transaction
+        :return: key columns in the key order, empty if table has no primary key
+        """
+        cursor.execute("SELECT a.attname FROM pg_index i "
+                       "JOIN pg_attribute a ON a.attrelid = i.indrelid "
+                       "AND a.attnum = ANY(i.indkey) "
+                       "WHERE i.indrelid = %s::regclass AND i.indisprimary "
+                       "ORDER BY array_position(i.indkey::int2[], a.attnum);",
+                       (self.table_name,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def _get_columns(self, cursor) -> List[Tuple[str, str]]:
+        """
+        Get the columns of the table, with their types as named by wal2json
+        :param cursor: cursor in the snapshot transaction
+        :return: column names and types in the column order
+        """
+        cursor.execute("SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+                       "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped "
+                       "ORDER BY attnum;",
+                       (self.table_name,))
+        return cursor.fetchall()
+
+    def _send_rows(self, connection, checkpoint: Dict) -> int:
+        """
+        Read the rows after the checkpoint and send them in batches
+        :param connection: connection in the snapshot transaction
+        :param checkpoint: checkpoint of the previous run
+        :type checkpoint: Dict
+        :return: number of rows sent, including the rows of the previous runs
+        """
+        cursor = connection.cursor()
+        key_columns = self._get_key_columns(cursor)
+        columns = self._get_columns(cursor)
+        column_names = [column_name for column_name, _ in columns]
+        column_types = [column_type for _, column_type in columns]
+        schema_name, _, table_name = self.table_name.rpartition(".")
+        # key is read as text too, to be checkpointed as is
+        quoted_key_columns = ", ".join(quote_ident(key_column, cursor)
+                                       for key_column in key_columns)
+        selected_columns = [quote_ident(column_name, cursor) for column_name in column_names]
+        selected_columns += [f"{quote_ident(key_column, cursor)}::text AS siirto_key_{index}"
+                             for index, key_column in enumerate(key_columns)]
+        query = f"SELECT {', '.join(selected_columns)} FROM {self.table_name}"
+        query_parameters = None
+        if len(key_columns) == 0:
+            self.logger.warning("table has no primary key, "
+                                "rows are sent again from the start on restart")
+            checkpoint = {"last_key": None, "row_count": 0}
+        else:
+            if checkpoint["last_key"] is not None:
+                # key text is cast back to the key types, to compare as the key is ordered
+                key_types = [column_types[column_names.index(key_column)]
+                             for key_column in key_columns]
+                key_values = ", ".join(f"%s::{key_type}" for key_type in key_types)
+                query = f"{query} WHERE ({quoted_key_columns}) > ({key_values})"
+                query_parameters = tuple(checkpoint["last_key"])
+            query = f"{query} ORDER BY {quoted_key_columns}"
+        batches = queue.Queue(maxsize=self.event_hub_max_pending_batches)
+        progress = {
+            "checkpoint": checkpoint,
+            "sent_batches": {},
+            "next_batch": 0,
+            "checkpointed_at": time.monotonic(),
+            "error": None
+        }
+        workers = [threading.Thread(target=self._send_batches, args=(batches, progress))
+                   for _ in range(self.event_hub_concurrency)]
+        for worker in workers:
+            worker.start()
+        try:
+            # rows are read by a server side cursor, a batch at a time
+            row_cursor = connection.cursor(name=f"siirto_full_load_{os.getpid()}")
+            row_cursor.itersize = 10000
+            row_cursor.execute(query, query_parameters)
+            column_count = len(column_names)
+            batch, batch_size, batch_index, last_row = [], 0, 0, None
+            for row in row_cursor:
+                event = json.dumps({
+                    "kind": "insert",
+                    "schema": schema_name,
+                    "table": table_name,
+                    "columnnames": column_names,
+                    "columntypes": column_types,
+                    "columnvalues": list(row[:column_count])
+                }, default=_json_default)
+                if len(batch) > 0 \
+                        and batch_size + len(event) + 1 > self.event_hub_batch_size_bytes:
+                    self._put_batch(batches, progress, batch_index, batch, batch_size,
+                                    list(last_row[column_count:]))
+                    batch, batch_size, batch_index = [], 0, batch_index + 1
+                batch.append(event)
+                batch_size += len(event) + 1
+                last_row = row
+            if len(batch) > 0:
+                self._put_batch(batches, progress, batch_index, batch, batch_size,
+                                list(last_row[column_count:]))
+            row_cursor.close()
+        finally:
+            for _ in workers:
+                batches.put(None)
+            for worker in workers:
+                worker.join()
+            # batches sent without a gap are checkpointed, even on error
+            self._save_checkpoint(progress["checkpoint"])
+        if progress["error"] is not None:
+            raise progress["error"]
+        return progress["checkpoint"]["row_count"]
+
+    def _put_batch(self,
+                   batches: queue.Queue,
+                   progress: Dict,
+                   batch_index: int,
+                   batch: List[str],
+                   batch_size: int,
+                   last_key: List[str]) -> None:
+        """
+        Queue a batch for the workers, waits while the queue is full
+        :param batches: queue of the batches
+        :type batches: queue.Queue
+        :param progress: progress shared with the workers
+        :type progress: Dict
+        :param batch_index: sequence number of the batch
+        :type batch_index: int
+        :param batch: events of the batch
+        :type batch: List[str]
+        :param batch_size: size of the events in bytes
+        :type batch_size: int
+        :param last_key: primary key of the last row of the batch, as text
+        :type last_key: List[str]
+        """
+        if progress["error"] is not None:
+            raise progress["error"]
+        if self.throttle is not None:
+            self.throttle.consume(batch_size, len(batch))
+        batches.put((batch_index, batch, last_key))
+
+    def _send_batches(self, batches: queue.Queue, progress: Dict) -> None:
+        """
+        Worker, sends the queued batches and checkpoints the progress
+        :param batches: queue of the batches, None to stop
+        :type batches: queue.Queue
+        :param progress: progress shared with the workers
+        :type progress: Dict
+        """
+        sender = None
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            if progress["error"] is not None:
+                # drain the queue, the reader stops on the error
+                continue
+            batch_index, batch, last_key = item
+            try:
+                if sender is None:
+                    sender = self.event_hub_sender_factory()
+                sender.send(batch)
+            except Exception as exception:
+                self.logger.error(f"sending batch {batch_index} failed: {exception}")
+                progress["error"] = exception
+                continue
+            self._complete_batch(progress, batch_index, len(batch), last_key)
+        if sender is not None:
+            sender.close()
+
+    def _complete_batch(self,
+                        progress: Dict,
+                        batch_index: int,
+                        row_count: int,
+                        last_key: List[str]) -> None:
+        """
+        Record a sent batch. Checkpoint moves over the batches sent
+        without a gap, at most every `checkpoint_interval` seconds
+        :param progress: progress shared with the workers
+        :type progress: Dict
+        :param batch_index: sequence number of the batch
+        :type batch_index: int
+        :param row_count: number of rows of the batch
+        :type row_count: int
+        :param last_key: primary key of the last row of the batch, as text
+        :type last_key: List[str]
+        """
+        with self._checkpoint_lock:
+            progress["sent_batches"][batch_index] = (row_count, last_key)
+            checkpoint = progress["checkpoint"]
+            while progress["next_batch"] in progress["sent_batches"]:
+                row_count, last_key = progress["sent_batches"].pop(progress["next_batch"])
+                checkpoint["row_count"] += row_count
+                if len(last_key) > 0:
+                    checkpoint["last_key"] = last_key
+                progress["next_batch"] += 1
+            if time.monotonic() - progress["checkpointed_at"] >= self.checkpoint_interval:
+                self._save_checkpoint(checkpoint)
+                progress["checkpointed_at"] = time.monotonic()
+
+    def setup_graceful_shutdown(self) -> None:
+        """
+        Handles the graceful shutdown of the process.
+        :return:
+        """
+        def signal_handler(sig, frame):
+            success_file = os.path.join(self.output_folder_location, f"_success")
+            if not os.path.exists(success_file):
+                # process is still running
+                self.logger.error("Process not yet completed. It will run again.")
+                exit(0)
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
@@ -0,0 +1,413 @@
+import hashlib
+import os
+
+from siirto.shared.columnar import COLUMNAR_FORMATS, arrow_array, arrow_ipc_compression
+from siirto.shared.compression import COMPRESSIONS, compressed_writer, file_extension
+from siirto.shared.pg_text_copy import decode_copy_text_line
+from siirto.shared.pg_binary_copy import BINARY_COPY_TRAILER, TRAILER, header_end, tuple_end
+from siirto.shared.throttle import Throttle
+
+
+class _ChecksumFile:
+    """
+    Binary file being written, computes the sha256 checksum
+    and the size of the file while it is written
+    :param file_name: file to write
+    :type file_name: str
+    """
+
+    def __init__(self, file_name: str) -> None:
+        self._file = open(file_name, "wb")
+        self._checksum = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def checksum(self) -> str:
+        """ sha256 of the data written so far, hex """
+        return self._checksum.hexdigest()
+
+    def write(self, data) -> int:
+        self._checksum.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+
+class SplitFileWriter:
+    """
+    File like object to receive the COPY stream of a table.
+    Writes the stream to part files and rolls over to the next
+    part file as soon as `split_file_size_limit` lines (or
+    `split_file_size_bytes` bytes) are written, so the export is
+    written only once and never re-read.
+
+    Part files are named as the `split -d` linux command named them,
+    i.e. `x00_{table_name}.csv`, `x01_{table_name}.csv`, ... `x89_`,
+    `x9000_`, ... so the lexical order of the files is the order
+    of the data.
+
+    Row count, byte size (before compression), file size and sha256
+    checksum of the file (as stored) of every part are computed while
+    the part is written, see `parts`.
+
+    :param output_folder_location: folder to write the part files
+    :type output_folder_location: str
+    :param table_name: table name, used in the part file name
+    :type table_name: str
+    :param split_file_size_limit: number of lines after which a
+        new file will be created
+    :type split_file_size_limit: int
+    :param file_name_prefix: prefix of the part file name
+    :type file_name_prefix: str
+    :param compression: compression of the part files, `gzip|zstd|lz4`.
+        Part files are compressed while they are written. None for
+        no compression
+    :type compression: str
+    :param compression_level: compression level, None for the
+        default level of the compression
+    :type compression_level: int
+    :param split_file_size_bytes: number of bytes (before compression)
+        after which a new file will be created. File is rolled over at
+        the end of the line reaching the size. None to roll over only on
+        `split_file_size_limit`
+    :type split_file_size_bytes: int
+    :param throttle: throttle shared by the full load workers, the writes
+        wait to keep its byte and row rates. None for no throttling
+    :type throttle: Throttle
+    """
+
+    # extension of the part files
+    part_file_extension = ".csv"
+
+    def __init__(self,
+                 output_folder_location: str,
+                 table_name: str,
+                 split_file_size_limit: int,
+                 file_name_prefix: str = "x",
+                 compression: str = None,
+                 compression_level: int = None,
+                 split_file_size_bytes: int = None,
+                 throttle: Throttle = None) -> None:
+        if split_file_size_limit is None or split_file_size_limit <= 0:
+            raise ValueError(f"Incorrect value provided for "
+                             f"split_file_size_limit `{split_file_size_limit}`")
+        if split_file_size_bytes is not None and split_file_size_bytes <= 0:
+            raise ValueError(f"Incorrect value provided for "
+                             f"split_file_size_bytes `{split_file_size_bytes}`")
+        self.output_folder_location = output_folder_location
+        self.table_name = table_name
+        self.split_file_size_limit = split_file_size_limit
+        self.split_file_size_bytes = split_file_size_bytes
+        self.file_name_prefix = file_name_prefix
+        self.compression = compression
+        self.compression_level = compression_level
+        self.throttle = throttle
+        self.row_count = 0
+        self.byte_count = 0
+        self.part_files = []
+        # part file, row_count, byte_size, file_size and sha256 of every part
+        self.parts = []
+        self._current_file = None
+        self._current_raw_file = None
+        self._current_file_row_count = 0
+        self._current_file_byte_count = 0
+        # incomplete line received at the end of the last write
+        self._pending = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def part_suffix(index: int) -> str:
+        """
+        Suffix of the part file at `index`, same as `split -d`
+        generates it: 00..89, 9000..9899, 990000..998999, ...
+        :param index: zero based index of the part file
+        :type index: int
+        :return: suffix
+        """
+        level = 0
+        while True:
+            capacity = 9 * 10 ** (level + 1)
+            if index < capacity:
+                return "9" * level + str(index).zfill(level + 2)
+            index -= capacity
+            level += 1
+
+    def write(self, data) -> None:
+        """
+        Write the data received from the COPY stream.
+        Data is not required to be aligned to the lines.
+        :param data: data received from the COPY stream
+        :type data: bytes
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        if self._pending:
+            data = self._pending + data
+            self._pending = b""
+        while data:
+            lines_in_data = data.count(b"\n")
+            lines_left_in_file = self.split_file_size_limit - self._current_file_row_count
+            rollover_end = None
+            if lines_in_data >= lines_left_in_file:
+                line_end = -1
+                for _ in range(lines_left_in_file):
+                    line_end = data.index(b"\n", line_end + 1)
+                rollover_end = line_end + 1
+            if self.split_file_size_bytes is not None:
+                bytes_left_in_file = self.split_file_size_bytes - self._current_file_byte_count
+                line_end = data.find(b"\n", max(bytes_left_in_file, 1) - 1)
+                if line_end != -1 and (rollover_end is None or line_end + 1 < rollover_end):
+                    rollover_end = line_end + 1
+            if rollover_end is None:
+                line_end = data.rfind(b"\n") + 1
+                self._write_to_part(data[:line_end], lines_in_data)
+                self._pending = data[line_end:]
+                return
+            # current part file gets full in this data
+            self._write_to_part(data[:rollover_end], data.count(b"\n", 0, rollover_end))
+            self._close_part()
+            data = data[rollover_end:]
+
+    def close(self) -> None:
+        """
+        Write any incomplete line and close the current part file.
+        An empty part file is created, if nothing was written.
+        """
+        if self._pending:
+            self._write_to_part(self._pending, 1)
+            self._pending = b""
+        if not self.part_files:
+            self._open_part()
+        self._close_part()
+
+    def _write_to_part(self, data: bytes, line_count: int) -> None:
+        if not data:
+            return
+        if self._current_file is None:
+            self._open_part()
+        self._write_data(data)
+        self._current_file_row_count += line_count
+        self._current_file_byte_count += len(data)
+        self.row_count += line_count
+        self.byte_count += len(data)
+        if self.throttle is not None:
+            # slows down the reading of the COPY stream
+            self.throttle.consume(len(data), line_count)
+
+    def _open_part(self) -> None:
+        file_name = f"{self.file_name_prefix}" \
+                    f"{SplitFileWriter.part_suffix(len(self.part_files))}" \
+                    f"_{self.table_name}{self.part_file_extension}" \
+                    f"{file_extension(self.compression)}"
+        file_to_write = os.path.join(self.output_folder_location, file_name)
+        self._current_raw_file = _ChecksumFile(file_to_write)
+        self._current_file = self._open_writer(self._current_raw_file)
+        self._current_file_row_count = 0
+        self._current_file_byte_count = 0
+        self.part_files.append(file_to_write)
+
+    def _open_writer(self, raw_file):
+        """
+        Writer of the current part file
+        :param raw_file: part file, receives the bytes to store
+        :return: file object
+        """
+        return compressed_writer(raw_file, self.compression, self.compression_level)
+
+    def _write_data(self, data: bytes) -> None:
+        """
+        Write complete lines of the COPY stream to the current part file
+        :param data: lines
+        :type data: bytes
+        """
+        self._current_file.write(data)
+
+    def _close_part(self) -> None:
+        if self._current_file is not None:
+            self._current_file.close()
+            self._current_raw_file.close()
+            self.parts.append({
+                "part_file": self.part_files[-1],
+                "row_count": self._current_file_row_count,
+                "byte_size": self._current_file_byte_count,
+                "file_size": self._current_raw_file.size,
+                "sha256": self._current_raw_file.checksum
+            })
+            self._current_file = None
+            self._current_raw_file = None
+        self._current_file_row_count = 0
+        self._current_file_byte_count = 0
+
+
+class BinarySplitFileWriter(SplitFileWriter):
+    """
+    File like object to receive the binary COPY stream of a table
+    (`COPY ... TO STDOUT (FORMAT binary)`).
+    Stream is split on the tuple boundaries and every part file is a
+    complete binary COPY file, having the header and the trailer.
+    Part files can be read using `siirto.shared.pg_binary_copy`.
+
+    Parameters are same as `SplitFileWriter`,
+    `split_file_size_limit` is the number of tuples and
+    `split_file_size_bytes` is checked at the end of every tuple.
+    """
+
+    part_file_extension = ".bin"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._pending = bytearray()
+        self._header = None
+
+    def write(self, data) -> None:
+        """
+        Write the data received from the binary COPY stream.
+        Data is not required to be aligned to the tuples.
+        :param data: data received from the COPY stream
+        :type data: bytes
+        """
+        self._pending += data
+        position = 0
+        if self._header is None:
+            position = header_end(self._pending)
+            if position is None:
+                return
+            self._header = bytes(self._pending[:position])
+        tuples_start = position
+        tuple_count = 0
+        while True:
+            end = tuple_end(self._pending, position)
+            if end is None:
+                break
+            if end == TRAILER:
+                # trailer is written at the end of every part file
+                position += len(BINARY_COPY_TRAILER)
+                break
+            position = end
+            tuple_count += 1
+            if self._current_file_row_count + tuple_count == self.split_file_size_limit \
+                    or (self.split_file_size_bytes is not None
+                        and self._current_file_byte_count + position - tuples_start
+                        >= self.split_file_size_bytes):
+                self._write_to_part(bytes(self._pending[tuples_start:position]), tuple_count)
+                self._close_part()
+                tuples_start = position
+                tuple_count = 0
+        self._write_to_part(bytes(self._pending[tuples_start:position]), tuple_count)
+        del self._pending[:position]
+
+    def close(self) -> None:
+        """
+        Close the current part file.
+        An empty part file is created, if nothing was written.
+        """
+        self._pending = bytearray()
+        super().close()
+
+    def _open_part(self) -> None:
+        super()._open_part()
+        if self._header is not None:
+            self._current_file.write(self._header)
+
+    def _close_part(self) -> None:
+        if self._current_file is not None and self._header is not None:
+            self._current_file.write(BINARY_COPY_TRAILER)
+        super()._close_part()
+
+
+class ColumnarSplitFileWriter(SplitFileWriter):
+    """
+    File like object to receive the text COPY stream of a table and
+    write it to typed columnar part files, Parquet or Arrow IPC
+    (requires `pyarrow`). Values are converted to the types of
+    `schema` and written in row groups (record batches) of
+    `row_group_size` rows, so at most one row group is held in memory.
+
+    Parameters are same as `SplitFileWriter`, `compression` is the
+    compression of the columnar format, plus
+
+    :param schema: arrow schema of the columns of the COPY stream
+    :type schema: pyarrow.Schema
+    :param output_format: `parquet|arrow`
+    :type output_format: str
+    :param row_group_size: number of rows of a row group
+    :type row_group_size: int
+    """
+
+    def __init__(self,
+                 *args,
+                 schema=None,
+                 output_format: str = "parquet",
+                 row_group_size: int = 100000,
+                 **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if row_group_size is None or row_group_size <= 0:
+            raise ValueError(f"Incorrect value provided for "
+                             f"row_group_size `{row_group_size}`")
+        self.schema = schema
+        self.output_format = output_format
+        self.row_group_size = row_group_size
+        self.part_file_extension = COLUMNAR_FORMATS[output_format]
+        # compression is done by the columnar format, not on the file
+        self.columnar_compression = self.compression
+        self.compression = None
+        self._columns = [[] for _ in schema]
+
+    def _open_writer(self, raw_file):
+        if self.output_format == "parquet":
+            import pyarrow.parquet
+            compression_level = self.compression_level
+            if compression_level is None and self.columnar_compression is not None:
+                compression_level = COMPRESSIONS[self.columnar_compression][1] or None
+            return pyarrow.parquet.ParquetWriter(raw_file,
+                                                 self.schema,
+                                                 compression=self.columnar_compression or "none",
+                                                 compression_level=compression_level)
+        import pyarrow.ipc
+        return pyarrow.ipc.new_file(raw_file,
+                                    self.schema,
+                                    options=pyarrow.ipc.IpcWriteOptions(
+                                        compression=arrow_ipc_compression(
+                                            self.columnar_compression)))
+
+    def _write_data(self, data: bytes) -> None:
+        lines = data.decode().split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        for line in lines:
+            for column, value in zip(self._columns, decode_copy_text_line(line)):
+                column.append(value)
+            if len(self._columns[0]) >= self.row_group_size:
+                self._write_row_group()
+
+    def _write_row_group(self) -> None:
+        import pyarrow
+        if len(self._columns) == 0 or len(self._columns[0]) == 0:
+            return
+        record_batch = pyarrow.record_batch([arrow_array(values, field.type, field.name)
+                                             for values, field in zip(self._columns, self.schema)],
+                                            schema=self.schema)
+        self._current_file.write_batch(record_batch)
+        self._columns = [[] for _ in self.schema]
+
+    def _close_part(self) -> None:
+        if self._current_file is not None:
+            self._write_row_group()
+        super()._close_part()
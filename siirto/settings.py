@@ -58,6 +58,19 @@ def initialize():
         "output_location": output_location,
     }
 
+    # optional parameters of the database operator
+    for parameter_name, parameter_type in [("max_parallel_full_loads", int),
+                                           ("full_load_pack_size_bytes", int),
+                                           ("full_load_max_bytes_per_second", float),
+                                           ("full_load_max_rows_per_second", float),
+                                           ("full_load_throttle_max_active_backends", int),
+                                           ("full_load_throttle_max_replication_lag_bytes", int),
+                                           ("cdc_slot_name", str),
+                                           ("cdc_slot_count", int)]:
+        parameter_value = configuration.get("conf", parameter_name)
+        if parameter_value:
+            database_operator_params[parameter_name] = parameter_type(parameter_value)
+
     retry_times = int(configuration.get("conf", "retry_times", 0))
     run_database_operator(database_operator,
                           database_operator_params,
@@ -0,0 +1,173 @@
+"""
+Columnar (Parquet/Arrow IPC) output of the full load.
+Requires the optional `pyarrow` package.
+Column types come from the catalog, values are read from the
+text COPY stream and converted to the arrow type of the column.
+Infinite dates and timestamps are written as the latest/earliest
+value, other values out of range of the arrow type (NaN numerics,
+BC dates) fail the export.
+"""
+import importlib
+from typing import List, Optional, Tuple
+
+# output format -> part file extension
+COLUMNAR_FORMATS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+# postgres type name -> arrow type name, other types are written as string
+_ARROW_TYPES = {
+    "bool": "bool_",
+    "int2": "int16",
+    "int4": "int32",
+    "int8": "int64",
+    "oid": "int64",
+    "float4": "float32",
+    "float8": "float64",
+    "date": "date32",
+    "bytea": "binary",
+}
+# text of the infinite dates and timestamps -> latest/earliest value kept in
+# their place, by arrow type id (date, timestamp and timestamp with time zone)
+_INFINITE_VALUES = {
+    "date": {"infinity": "9999-12-31", "-infinity": "0001-01-01"},
+    "timestamp": {"infinity": "9999-12-31 23:59:59.999999",
+                  "-infinity": "0001-01-01 00:00:00"},
+    "timestamptz": {"infinity": "9999-12-31 23:59:59.999999+00",
+                    "-infinity": "0001-01-01 00:00:00+00"},
+}
+# compressions supported by the arrow IPC format
+_ARROW_IPC_COMPRESSIONS = {
+    "zstd": "zstd",
+    "lz4": "lz4_frame",
+}
+
+
+def validate_output_format(output_format: str, compression: str = None) -> None:
+    """
+    Validate the columnar output format, its compression and
+    the availability of pyarrow
+    :param output_format: `parquet|arrow`
+    :type output_format: str
+    :param compression: compression name, `gzip|zstd|lz4` or None
+    :type compression: str
+    """
+    if output_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Incorrect value provided for output_format `{output_format}`")
+    if output_format == "arrow" and compression is not None \
+            and compression not in _ARROW_IPC_COMPRESSIONS:
+        raise ValueError(f"Compression `{compression}` is not supported "
+                         f"for output_format `{output_format}`")
+    try:
+        importlib.import_module("pyarrow")
+    except ImportError:
+        raise ValueError(f"output_format `{output_format}` requires `pyarrow` package")
+
+
+def arrow_type(type_name: str, type_modifier: int = -1):
+    """
+    Arrow type of a postgres type
+    :param type_name: postgres type name, as in pg_type.typname
+    :type type_name: str
+    :param type_modifier: type modifier, as in pg_attribute.atttypmod
+    :type type_modifier: int
+    :return: arrow type, string for the types without an arrow equivalent
+    """
+    import pyarrow
+    if type_name in _ARROW_TYPES:
+        return getattr(pyarrow, _ARROW_TYPES[type_name])()
+    if type_name == "timestamp":
+        return pyarrow.timestamp("us")
+    if type_name == "timestamptz":
+        # COPY stream is read with UTC time zone
+        return pyarrow.timestamp("us", tz="UTC")
+    if type_name == "numeric" and type_modifier >= 4:
+        precision = ((type_modifier - 4) >> 16) & 0xffff
+        scale = (type_modifier - 4) & 0xffff
+        if precision <= 38:
+            return pyarrow.decimal128(precision, scale)
+    return pyarrow.string()
+
+
+def arrow_schema(columns: List[Tuple[str, str, int]]):
+    """
+    Arrow schema of the columns
+    :param columns: name, type name and type modifier of the columns
+    :type columns: List[Tuple[str, str, int]]
+    :return: arrow schema
+    """
+    import pyarrow
+    return pyarrow.schema([pyarrow.field(column_name, arrow_type(type_name, type_modifier))
+                           for column_name, type_name, type_modifier in columns])
+
+
+def arrow_array(values: List[Optional[str]], column_type, column_name: str = None):
+    """
+    Arrow array of the text values of a column
+    :param values: text values, as in the text COPY format, None for NULL
+    :type values: List[Optional[str]]
+    :param column_type: arrow type of the column
+    :param column_name: column name, for the error of a value out of range
+    :type column_name: str
+    :return: arrow array
+    """
+    import pyarrow
+    if column_type == pyarrow.bool_():
+        return pyarrow.array([None if value is None else value == "t" for value in values],
+                             column_type)
+    if column_type == pyarrow.binary():
+        # bytea is read in hex output format, `\x...`
+        return pyarrow.array([None if value is None else bytes.fromhex(value[2:])
+                              for value in values], column_type)
+    strings = pyarrow.array(values, pyarrow.string())
+    if column_type == pyarrow.string():
+        return strings
+    try:
+        return strings.cast(column_type)
+    except pyarrow.ArrowInvalid:
+        return _cast_out_of_range_values(values, column_type, column_name)
+
+
+def _cast_out_of_range_values(values: List[Optional[str]], column_type, column_name: str):
+    """
+    Arrow array of the text values of a column having values out of
+    the range of its arrow type. Infinite dates and timestamps are
+    replaced by the latest/earliest date or timestamp, other values
+    which can not be converted (NaN numerics, BC dates) raise an error
+    :param values: text values, as in the text COPY format, None for NULL
+    :type values: List[Optional[str]]
+    :param column_type: arrow type of the column
+    :param column_name: column name, for the error of a value out of range
+    :type column_name: str
+    :return: arrow array
+    """
+    import pyarrow
+    replacements = {}
+    if pyarrow.types.is_date(column_type):
+        replacements = _INFINITE_VALUES["date"]
+    elif pyarrow.types.is_timestamp(column_type):
+        replacements = _INFINITE_VALUES["timestamp" if column_type.tz is None else "timestamptz"]
+    values = [replacements.get(value, value) for value in values]
+    try:
+        return pyarrow.array(values, pyarrow.string()).cast(column_type)
+    except pyarrow.ArrowInvalid:
+        pass
+    # the value to report, the column is not written with a NULL in its place
+    for value in values:
+        try:
+            pyarrow.array([value], pyarrow.string()).cast(column_type)
+        except pyarrow.ArrowInvalid:
+            raise ValueError(f"Value `{value}` of column `{column_name}` "
+                             f"can not be converted to {column_type}")
+    raise ValueError(f"Values of column `{column_name}` can not be converted to {column_type}")
+
+
+def arrow_ipc_compression(compression: str) -> Optional[str]:
+    """
+    Compression of the arrow IPC format
+    :param compression: compression name, `zstd|lz4` or None
+    :type compression: str
+    :return: arrow IPC compression, None for no compression
+    """
+    return _ARROW_IPC_COMPRESSIONS[compression] if compression else None
@@ -0,0 +1,118 @@
+"""Streaming compression of the output files"""
+import gzip
+import importlib
+import io
+
+# compression -> (file extension, default level, optional module required)
+COMPRESSIONS = {
+    "gzip": (".gz", 6, None),
+    "zstd": (".zst", 3, "zstandard"),
+    "lz4": (".lz4", 0, "lz4.frame"),
+}
+
+
+def validate_compression(compression: str) -> None:
+    """
+    Validate the compression and the availability of its library
+    :param compression: compression name, `gzip|zstd|lz4`
+        or None for no compression
+    :type compression: str
+    """
+    if compression is None:
+        return
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Incorrect value provided for compression `{compression}`")
+    module_name = COMPRESSIONS[compression][2]
+    if module_name is not None:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            raise ValueError(f"Compression `{compression}` requires "
+                             f"`{module_name.split('.')[0]}` package")
+
+
+def file_extension(compression: str) -> str:
+    """
+    File extension of the compression
+    :param compression: compression name, None for no compression
+    :type compression: str
+    :return: extension, empty for no compression
+    """
+    return COMPRESSIONS[compression][0] if compression else ""
+
+
+def compression_of_file(file_name: str) -> str:
+    """
+    Compression of a file, from its extension
+    :param file_name: file name
+    :type file_name: str
+    :return: compression name, None for no compression
+    """
+    return next((compression for compression, (extension, _, _) in COMPRESSIONS.items()
+                 if file_name.endswith(extension)), None)
+
+
+def open_file(file_name: str,
+              mode: str = "rb",
+              compression: str = None,
+              compression_level: int = None):
+    """
+    Open a (compressed) file as binary file object.
+    Data is compressed/decompressed while it is written/read.
+    :param file_name: file to open
+    :type file_name: str
+    :param mode: `rb` or `wb`
+    :type mode: str
+    :param compression: compression name, None for no compression
+    :type compression: str
+    :param compression_level: compression level,
+        default level of the compression if None
+    :type compression_level: int
+    :return: file object
+    """
+    if compression is None:
+        return open(file_name, mode)
+    validate_compression(compression)
+    if compression_level is None:
+        compression_level = COMPRESSIONS[compression][1]
+    if compression == "gzip":
+        return gzip.open(file_name, mode, compresslevel=compression_level)
+    if compression == "zstd":
+        import zstandard
+        if mode == "rb":
+            return io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(open(file_name, "rb"),
+                                                           closefd=True))
+        return zstandard.ZstdCompressor(level=compression_level)\
+            .stream_writer(open(file_name, "wb"), closefd=True)
+    import lz4.frame
+    return lz4.frame.open(file_name, mode, compression_level=compression_level)
+
+
+def compressed_writer(file_object,
+                      compression: str = None,
+                      compression_level: int = None):
+    """
+    Wrap a binary file object, data is compressed while it is written.
+    Closing the writer does not close `file_object`
+    :param file_object: binary file object receiving the compressed data
+    :param compression: compression name, None for no compression
+    :type compression: str
+    :param compression_level: compression level,
+        default level of the compression if None
+    :type compression_level: int
+    :return: file object
+    """
+    if compression is None:
+        return file_object
+    validate_compression(compression)
+    if compression_level is None:
+        compression_level = COMPRESSIONS[compression][1]
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=file_object, mode="wb", compresslevel=compression_level)
+    if compression == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=compression_level)\
+            .stream_writer(file_object, closefd=False)
+    import lz4.frame
+    return lz4.frame.LZ4FrameFile(file_object, "wb", compression_level=compression_level)
@@ -6,11 +6,14 @@ class LoadType(Enum):
     """
     Enum to select the nature of the job.
     Weather full load is required or/and CDC is required
-    or both are required
+    or both are required.
+    Incremental exports only the rows newer than the last
+    watermark of the table
     """
     Full_Load = 1
     CDC = 2
     Full_Load_And_CDC = 3
+    Incremental = 4
 
 
 @unique
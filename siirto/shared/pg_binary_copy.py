@@ -0,0 +1,124 @@
+"""
+Postgres binary COPY format (`COPY ... TO STDOUT (FORMAT binary)`).
+Used to split the binary COPY stream on tuple boundaries and
+to read the binary part files written by the full load.
+"""
+import struct
+from typing import Iterator, List, Optional, Tuple
+
+from siirto.shared.compression import compression_of_file, open_file
+
+BINARY_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+BINARY_COPY_TRAILER = struct.pack("!h", -1)
+# returned by `tuple_end` when the trailer is found
+TRAILER = -1
+
+# decoders of the common types, type name -> decoder of the binary value
+BINARY_DECODERS = {
+    "bool": lambda value: value == b"\x01",
+    "int2": lambda value: struct.unpack("!h", value)[0],
+    "int4": lambda value: struct.unpack("!i", value)[0],
+    "int8": lambda value: struct.unpack("!q", value)[0],
+    "float4": lambda value: struct.unpack("!f", value)[0],
+    "float8": lambda value: struct.unpack("!d", value)[0],
+    "text": lambda value: value.decode(),
+    "varchar": lambda value: value.decode(),
+    "bpchar": lambda value: value.decode(),
+    "bytea": lambda value: value,
+}
+
+
+def header_end(data: bytes, position: int = 0) -> Optional[int]:
+    """
+    Find the end of the binary COPY header
+    :param data: data received from the COPY stream
+    :type data: bytes
+    :param position: position of the header in data
+    :type position: int
+    :return: position after the header, None if header is incomplete
+    """
+    if len(data) < position + 19:
+        return None
+    if data[position:position + 11] != BINARY_COPY_SIGNATURE:
+        raise ValueError("Binary COPY signature not found")
+    extension_length = struct.unpack_from("!i", data, position + 15)[0]
+    end = position + 19 + extension_length
+    return end if end <= len(data) else None
+
+
+def tuple_end(data: bytes, position: int) -> Optional[int]:
+    """
+    Find the end of the tuple starting at `position`
+    :param data: data received from the COPY stream
+    :type data: bytes
+    :param position: position of the tuple in data
+    :type position: int
+    :return: position after the tuple, `TRAILER` if trailer starts at
+        `position`, None if tuple is incomplete
+    """
+    if len(data) < position + 2:
+        return None
+    field_count = struct.unpack_from("!h", data, position)[0]
+    if field_count == -1:
+        return TRAILER
+    position += 2
+    for _ in range(field_count):
+        if len(data) < position + 4:
+            return None
+        field_length = struct.unpack_from("!i", data, position)[0]
+        position += 4
+        if field_length > 0:
+            position += field_length
+    return position if position <= len(data) else None
+
+
+def read_binary_copy(binary_file,
+                     column_types: List[str] = None) -> Iterator[Tuple]:
+    """
+    Read the tuples of a binary COPY file
+    :param binary_file: binary file object
+    :param column_types: type names of the columns, values of the types
+        available in `BINARY_DECODERS` are decoded. Values are returned
+        as bytes if None
+    :type column_types: List[str]
+    :return: iterator of tuples, None for NULL values
+    """
+    header = binary_file.read(19)
+    if len(header) < 19 or header[:11] != BINARY_COPY_SIGNATURE:
+        raise ValueError("Binary COPY signature not found")
+    # skip the header extension
+    binary_file.read(struct.unpack_from("!i", header, 15)[0])
+    decoders = [BINARY_DECODERS.get(column_type) for column_type in column_types] \
+        if column_types else None
+    while True:
+        field_count_bytes = binary_file.read(2)
+        if len(field_count_bytes) < 2:
+            raise ValueError("Binary COPY trailer not found")
+        field_count = struct.unpack("!h", field_count_bytes)[0]
+        if field_count == -1:
+            return
+        values = []
+        for index in range(field_count):
+            field_length = struct.unpack("!i", binary_file.read(4))[0]
+            if field_length == -1:
+                values.append(None)
+                continue
+            value = binary_file.read(field_length)
+            if decoders and decoders[index] is not None:
+                value = decoders[index](value)
+            values.append(value)
+        yield tuple(values)
+
+
+def read_binary_copy_file(file_name: str,
+                          column_types: List[str] = None) -> Iterator[Tuple]:
+    """
+    Read the tuples of a binary COPY part file, compressed or not
+    :param file_name: part file
+    :type file_name: str
+    :param column_types: type names of the columns, see `read_binary_copy`
+    :type column_types: List[str]
+    :return: iterator of tuples
+    """
+    with open_file(file_name, "rb", compression_of_file(file_name)) as binary_file:
+        yield from read_binary_copy(binary_file, column_types)
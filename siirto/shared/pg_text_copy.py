@@ -0,0 +1,54 @@
+"""
+Postgres text COPY format (`COPY ... TO STDOUT`).
+Used to read back the values of the text part files written by
+the full load, e.g. to compare them with the rows of the source.
+"""
+import re
+from typing import List, Optional
+
+# escapes written by COPY TO in the text format
+_COPY_TEXT_ESCAPES = {
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+}
+_COPY_TEXT_ESCAPE_PATTERN = re.compile(r"\\(.)", re.DOTALL)
+# characters which make record_out quote a field
+_RECORD_QUOTED_CHARACTERS = set('"\\(),') | set(" \t\n\r\f\v")
+
+
+def decode_copy_text_line(line: str) -> List[Optional[str]]:
+    """
+    Decode a line of the text COPY format into the column values
+    :param line: line, with or without the line end
+    :type line: str
+    :return: text value of the columns, None for NULL values
+    """
+    if line.endswith("\n"):
+        line = line[:-1]
+    return [None if field == "\\N"
+            else _COPY_TEXT_ESCAPE_PATTERN.sub(
+                lambda match: _COPY_TEXT_ESCAPES.get(match.group(1), match.group(1)), field)
+            for field in line.split("\t")]
+
+
+def record_text(values: List[Optional[str]]) -> str:
+    """
+    Text of a row value, as returned by `ROW(...)::text` in postgres
+    :param values: text value of the columns, None for NULL values
+    :type values: List[Optional[str]]
+    :return: record text, e.g. `(1,"User 1",)`
+    """
+    fields = []
+    for value in values:
+        if value is None:
+            fields.append("")
+        elif value == "" or any(character in _RECORD_QUOTED_CHARACTERS
+                                for character in value):
+            fields.append('"' + value.replace("\\", "\\\\").replace('"', '""') + '"')
+        else:
+            fields.append(value)
+    return "(" + ",".join(fields) + ")"
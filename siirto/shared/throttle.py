@@ -0,0 +1,116 @@
+"""
+Throughput throttle of the full load.
+State is kept in shared memory, so a throttle created before the
+full load processes are started is shared by all of them (and by
+the worker threads of every process).
+"""
+import multiprocessing
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket, shared by the processes started after it is created.
+    Tokens are added at `rate` per second, up to `burst` tokens.
+    A consumer can take more tokens than available, it then waits
+    till the bucket is out of debt, so large writes are throttled too.
+
+    :param rate: tokens per second
+    :type rate: float
+    :param burst: maximum tokens in the bucket. Default is `rate`,
+        one second of tokens
+    :type burst: float
+    """
+
+    def __init__(self,
+                 rate: float,
+                 burst: float = None) -> None:
+        if rate is None or rate <= 0:
+            raise ValueError(f"Incorrect value provided for rate `{rate}`")
+        self.max_rate = rate
+        self.burst = burst or rate
+        self._lock = multiprocessing.Lock()
+        self._rate = multiprocessing.Value("d", rate, lock=False)
+        self._tokens = multiprocessing.Value("d", self.burst, lock=False)
+        self._updated_at = multiprocessing.Value("d", time.monotonic(), lock=False)
+
+    @property
+    def rate(self) -> float:
+        """ current rate, tokens per second """
+        return self._rate.value
+
+    @rate.setter
+    def rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill()
+            self._rate.value = rate
+
+    def consume(self, amount: float) -> None:
+        """
+        Take `amount` tokens, waits if the bucket is in debt after it
+        :param amount: tokens to take
+        :type amount: float
+        """
+        if amount <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens.value -= amount
+            wait = -self._tokens.value / self._rate.value
+        if wait > 0:
+            time.sleep(wait)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens.value = min(self.burst,
+                                 self._tokens.value
+                                 + (now - self._updated_at.value) * self._rate.value)
+        self._updated_at.value = now
+
+
+class Throttle:
+    """
+    Byte and row rate limit of the full load, shared by all the
+    full load workers of an operator run.
+    The rates can be lowered (and raised back) at runtime with
+    `rate_factor`, e.g. when the source is under load.
+
+    :param bytes_per_second: maximum bytes per second, None for no limit
+    :type bytes_per_second: float
+    :param rows_per_second: maximum rows per second, None for no limit
+    :type rows_per_second: float
+    """
+
+    def __init__(self,
+                 bytes_per_second: float = None,
+                 rows_per_second: float = None) -> None:
+        self.byte_bucket = TokenBucket(bytes_per_second) \
+            if bytes_per_second is not None else None
+        self.row_bucket = TokenBucket(rows_per_second) \
+            if rows_per_second is not None else None
+        self._rate_factor = multiprocessing.Value("d", 1.0)
+
+    @property
+    def rate_factor(self) -> float:
+        """ fraction of the maximum rates currently allowed """
+        return self._rate_factor.value
+
+    @rate_factor.setter
+    def rate_factor(self, rate_factor: float) -> None:
+        self._rate_factor.value = rate_factor
+        for bucket in [self.byte_bucket, self.row_bucket]:
+            if bucket is not None:
+                bucket.rate = bucket.max_rate * rate_factor
+
+    def consume(self, byte_count: int, row_count: int) -> None:
+        """
+        Account the bytes and rows written, waits to keep the rates
+        :param byte_count: bytes written
+        :type byte_count: int
+        :param row_count: rows written
+        :type row_count: int
+        """
+        if self.byte_bucket is not None:
+            self.byte_bucket.consume(byte_count)
+        if self.row_bucket is not None:
+            self.row_bucket.consume(row_count)
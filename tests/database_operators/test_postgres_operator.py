@@ -10,6 +10,7 @@ from siirto.configuration import configuration
 from siirto.shared.enums import LoadType, DatabaseOperatorType
 from tests.test_base.base_test import BaseTest
 from siirto.database_operators.postgres_operator import PostgresOperator
+from siirto.plugins.full_load.full_load_base import FULL_LOAD_APPLICATION_NAME
 
 
 class TestPostgresOperator(BaseTest):
@@ -317,3 +318,216 @@ class TestPostgresOperator(BaseTest):
         if os.path.exists(cdc_output_path):
             self.assertFalse("CDC output created for Full Load only job")
         configuration.set("plugin_parameter", "split_file_size_limit", split_file_original_value)
+
+    def test_postgres_operator_plan_full_loads(self):
+        database_operator_params = {
+            "connection_string": self.postgres_connection_string,
+            "load_type": LoadType.Full_Load,
+            "table_names": ['public.t1', 'public.t2', 'public.t3', 'public.t4'],
+            "full_load_plugin_name": "PgDefaultFullLoadPlugin",
+            "cdc_plugin_name": None,
+            "output_location": self.output_folder,
+            "max_parallel_full_loads": 2,
+            "full_load_pack_size_bytes": 100,
+        }
+        b = PostgresOperator(**database_operator_params)
+        table_sizes = {'public.t1': 40, 'public.t2': 1000, 'public.t3': 70, 'public.t4': 20}
+        self.assertEqual(b._plan_full_loads(table_sizes),
+                         [['public.t2'], ['public.t3'], ['public.t1', 'public.t4']])
+
+    def test_postgres_operator_get_table_sizes_partitioned(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS employee_sized;')
+                cursor.execute('CREATE TABLE employee_sized (id INT, name VARCHAR(50)) '
+                               'PARTITION BY RANGE (id);')
+                cursor.execute('CREATE TABLE employee_sized_1 PARTITION OF '
+                               'employee_sized FOR VALUES FROM (1) TO (1001);')
+                cursor.execute('CREATE TABLE employee_sized_2 PARTITION OF '
+                               'employee_sized FOR VALUES FROM (1001) TO (2001);')
+                cursor.execute("INSERT INTO employee_sized SELECT i, 'User' || i "
+                               "FROM generate_series(1, 2000) i")
+                cursor.execute("SELECT pg_total_relation_size('employee_sized_1') "
+                               "+ pg_total_relation_size('employee_sized_2')")
+                partitions_size = cursor.fetchone()[0]
+        database_operator_params = {
+            "connection_string": self.postgres_connection_string,
+            "load_type": LoadType.Full_Load,
+            "table_names": ['public.employee_sized'],
+            "full_load_plugin_name": "PgDefaultFullLoadPlugin",
+            "cdc_plugin_name": None,
+            "output_location": self.output_folder,
+        }
+        b = PostgresOperator(**database_operator_params)
+        self.assertEqual(b._get_table_sizes(), {'public.employee_sized': partitions_size})
+        # size of a table which can not be looked up is 0, the other sizes are kept
+        b.table_names = ['public.employee_missing', 'public.employee_sized']
+        self.assertEqual(b._get_table_sizes(), {'public.employee_missing': 0,
+                                                'public.employee_sized': partitions_size})
+
+    def test_postgres_operator_plan_cdc_slots(self):
+        table_names = ['public.t1', 'public.t2', 'public.t3', 'public.t4', 'public.t5']
+        database_operator_params = {
+            "connection_string": self.postgres_connection_string,
+            "load_type": LoadType.CDC,
+            "table_names": table_names,
+            "full_load_plugin_name": None,
+            "cdc_plugin_name": "PgDefaultCDCPlugin",
+            "output_location": self.output_folder,
+        }
+        b = PostgresOperator(**database_operator_params)
+        self.assertEqual(b._plan_cdc_slots(), {"siirto_slot": table_names})
+
+        database_operator_params["cdc_slot_name"] = "orders"
+        database_operator_params["cdc_slot_count"] = 3
+        b = PostgresOperator(**database_operator_params)
+        slot_table_names = b._plan_cdc_slots()
+        self.assertTrue(set(slot_table_names.keys()) <= {"orders_0", "orders_1", "orders_2"})
+        self.assertEqual(sorted(table_name for slot_names in slot_table_names.values()
+                                for table_name in slot_names), table_names)
+        # tables stay on their slot, when tables are added
+        b.table_names = table_names + ['public.t6']
+        for slot_name, slot_names in slot_table_names.items():
+            self.assertEqual(b._plan_cdc_slots()[slot_name][:len(slot_names)], slot_names)
+
+    def test_postgres_operator_cdc_slot_parameters(self):
+        database_operator_params = {
+            "connection_string": self.postgres_connection_string,
+            "load_type": LoadType.CDC,
+            "table_names": ['public.employee'],
+            "full_load_plugin_name": None,
+            "cdc_plugin_name": "PgDefaultCDCPlugin",
+            "output_location": self.output_folder,
+            "cdc_slot_count": 0,
+        }
+        with self.assertRaises(ValueError) as cm:
+            PostgresOperator(**database_operator_params)
+        self.assertEqual(str(cm.exception), "Incorrect value provided for cdc_slot_count `0`")
+        database_operator_params["cdc_slot_count"] = 2
+        database_operator_params["cdc_slot_name"] = "Siirto-Slot"
+        with self.assertRaises(ValueError) as cm:
+            PostgresOperator(**database_operator_params)
+        self.assertEqual(str(cm.exception), "Incorrect value provided for cdc_slot_name `Siirto-Slot`")
+
+    def test_postgres_operator_operator_run_test_full_load_packed_tables(self):
+        self.insert_ref_data()
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("CREATE TABLE IF NOT EXISTS department "
+                               "(id INT PRIMARY KEY, name VARCHAR(50));")
+                cursor.execute('DELETE FROM department;')
+                cursor.execute("INSERT INTO department VALUES (1, 'Department1')")
+        database_operator_params = {
+            "connection_string": self.postgres_connection_string,
+            "load_type": LoadType.Full_Load,
+            "table_names": ['public.employee', 'public.department'],
+            "full_load_plugin_name": "PgDefaultFullLoadPlugin",
+            "cdc_plugin_name": None,
+            "output_location": self.output_folder,
+            "max_parallel_full_loads": 1,
+            "full_load_pack_size_bytes": 1024 * 1024 * 1024,
+        }
+        b = PostgresOperator(**database_operator_params)
+        self.assertEqual(len(b._plan_full_loads(b._get_table_sizes())), 1)
+        b.execute()
+        for table_folder, content in [("public_employee", "1\tUser1\n2\tUser2\n"),
+                                      ("public_department", "1\tDepartment1\n")]:
+            full_load_output_path = os.path.join(self.output_folder,
+                                                 "full_load",
+                                                 table_folder,
+                                                 f"x00_{table_folder.replace('_', '.')}.csv")
+            with open(full_load_output_path, 'r') as full_load_file:
+                self.assertEqual(full_load_file.read(), content)
+            self.assertTrue(os.path.exists(os.path.join(self.output_folder,
+                                                        "full_load",
+                                                        table_folder,
+                                                        "_success")))
+
+    def test_postgres_operator_full_load_packed_tables_with_failed_table(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("CREATE TABLE IF NOT EXISTS department "
+                               "(id INT PRIMARY KEY, name VARCHAR(50));")
+                cursor.execute('DELETE FROM department;')
+                cursor.execute("INSERT INTO department VALUES (1, 'Department1')")
+        database_operator_params = {
+            "connection_string": self.postgres_connection_string,
+            "load_type": LoadType.Full_Load,
+            "table_names": ['public.department_missing', 'public.department'],
+            "full_load_plugin_name": "PgDefaultFullLoadPlugin",
+            "cdc_plugin_name": None,
+            "output_location": self.output_folder,
+            "full_load_pack_size_bytes": 1024 * 1024 * 1024,
+        }
+        b = PostgresOperator(**database_operator_params)
+        notifications = []
+        full_load_init_params_list = [b._get_full_load_init_params(table_name)
+                                      for table_name in b.table_names]
+        for full_load_init_params in full_load_init_params_list:
+            full_load_init_params["notify_on_completion"] = \
+                lambda **kwargs: notifications.append((kwargs["status"], kwargs["table_name"]))
+        with self.assertRaises(RuntimeError) as cm:
+            PostgresOperator._run_full_load_process_for_tables("PgDefaultFullLoadPlugin",
+                                                               full_load_init_params_list)
+        self.assertEqual(str(cm.exception), "Full load failed for public.department_missing")
+        # next table of the pack is still loaded
+        self.assertEqual(notifications, [("failed", "public.department_missing"),
+                                         ("success", "public.department")])
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "full_load",
+                                                    "public_department", "_success")))
+
+    def test_postgres_operator_adapt_full_load_throttle(self):
+        database_operator_params = {
+            "connection_string": self.postgres_connection_string,
+            "load_type": LoadType.Full_Load,
+            "table_names": ['public.employee'],
+            "full_load_plugin_name": "PgDefaultFullLoadPlugin",
+            "cdc_plugin_name": None,
+            "output_location": self.output_folder,
+            "full_load_max_bytes_per_second": 1000,
+            "full_load_throttle_max_active_backends": 100,
+            "full_load_throttle_max_replication_lag_bytes": 1024,
+        }
+        b = PostgresOperator(**database_operator_params)
+        b.full_load_throttle.rate_factor = 0.5
+        # source is idle, rate is raised back
+        b._adapt_full_load_throttle()
+        self.assertAlmostEqual(b.full_load_throttle.rate_factor, 0.6)
+        throttle_connection = b._throttle_connection
+        # backends of the full loads, COPY or not, are not counted as load
+        full_load_connection = psycopg2.connect(self.postgres_connection_string,
+                                                application_name=FULL_LOAD_APPLICATION_NAME)
+        full_load_query = threading.Thread(
+            target=lambda: full_load_connection.cursor().execute("SELECT pg_sleep(2)"))
+        full_load_query.start()
+        try:
+            with throttle_connection.cursor() as cursor:
+                while True:
+                    cursor.execute("SELECT count(*) FROM pg_stat_activity "
+                                   "WHERE state = 'active' AND application_name = %s",
+                                   (FULL_LOAD_APPLICATION_NAME,))
+                    if cursor.fetchone()[0] == 1:
+                        break
+                    time.sleep(0.05)
+            b.full_load_throttle_max_active_backends = 0
+            b._adapt_full_load_throttle()
+            self.assertAlmostEqual(b.full_load_throttle.rate_factor, 0.7)
+        finally:
+            full_load_query.join()
+            full_load_connection.close()
+        # connection is kept between the checks
+        self.assertIs(b._throttle_connection, throttle_connection)
+        b.full_load_throttle_max_active_backends = -1
+        b._adapt_full_load_throttle()
+        self.assertAlmostEqual(b.full_load_throttle.rate_factor, 0.35)
+        # connection is reopened after an error
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_terminate_backend(%s)",
+                               (throttle_connection.get_backend_pid(),))
+        b._adapt_full_load_throttle()
+        self.assertIsNone(b._throttle_connection)
+        b._adapt_full_load_throttle()
+        self.assertIsNotNone(b._throttle_connection)
+        self.assertIsNot(b._throttle_connection, throttle_connection)
+        b._close_throttle_connection()
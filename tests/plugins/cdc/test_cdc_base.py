@@ -64,6 +64,20 @@ class TestCDCBase(BaseTest):
             CDCBase(**cdc_init_params)
         self.assertEqual(str(cm.exception), "Table name is None or Empty")
 
+    def test_cdc_base_plugin_slot_name(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": []
+        }
+        self.assertEqual(CDCBase(**cdc_init_params).slot_name, "siirto_slot")
+        cdc_init_params["slot_name"] = "siirto_slot_1"
+        self.assertEqual(CDCBase(**cdc_init_params).slot_name, "siirto_slot_1")
+        cdc_init_params["slot_name"] = "siirto'slot"
+        with self.assertRaises(ValueError) as cm:
+            CDCBase(**cdc_init_params)
+        self.assertEqual(str(cm.exception), "Incorrect value provided for slot_name `siirto'slot`")
+
     def test_cdc_base_plugin_execute(self):
         cdc_init_params = {
             "output_folder_location": self.output_folder,
@@ -0,0 +1,222 @@
+import os
+import time
+
+from siirto.plugins.cdc.cdc_file_writer import CDCFileWriter, create_cdc_file_writer, \
+    create_cdc_file_writers, sync_cdc_file_writers
+from tests.test_base.base_test import BaseTest
+
+
+class TestCDCFileWriter(BaseTest):
+
+    def read_cdc_file(self, file_index):
+        with open(os.path.join(self.output_folder,
+                               f"public.employee_cdc_{file_index}.csv"), "r") as cdc_file:
+            return cdc_file.read()
+
+    def test_cdc_file_writer_file_per_batch(self):
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee", 3)
+        cdc_file_writer.write(['{"id": 1}', '{"id": 2}'])
+        cdc_file_writer.write(['{"id": 3}'])
+        self.assertEqual(cdc_file_writer.file_index, 5)
+        self.assertEqual(self.read_cdc_file(3), '{"id": 1}\n{"id": 2}')
+        self.assertEqual(self.read_cdc_file(4), '{"id": 3}')
+
+    def test_cdc_file_writer_file_size_bytes(self):
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee", 1, 20)
+        cdc_file_writer.write(['{"id": 1}'])
+        cdc_file_writer.write(['{"id": 2}', '{"id": 3}', '{"id": 4}'])
+        self.assertEqual(cdc_file_writer.file_index, 2)
+        self.assertEqual(self.read_cdc_file(1), '{"id": 1}\n{"id": 2}\n{"id": 3}')
+        self.assertEqual(self.read_cdc_file(2), '{"id": 4}')
+
+    def test_create_cdc_file_writer(self):
+        cdc_file_writer = create_cdc_file_writer(self.output_folder, "public.employee")
+        self.assertEqual(cdc_file_writer.file_index, 1)
+        cdc_file_writer.write(['{"id": 1}'])
+        cdc_file_writer.write(['{"id": 2}'])
+        cdc_file_writer = create_cdc_file_writer(self.output_folder, "public.employee", 20)
+        self.assertEqual(cdc_file_writer.file_index, 3)
+        self.assertEqual(cdc_file_writer.cdc_folder_for_table,
+                         os.path.join(self.output_folder, "public_employee"))
+        self.assertEqual(cdc_file_writer.file_size_bytes, 20)
+
+    def test_cdc_file_writer_file_max_records(self):
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee",
+                                        file_max_records=2)
+        cdc_file_writer.write(['{"id": 1}'])
+        cdc_file_writer.write(['{"id": 2}', '{"id": 3}'])
+        self.assertEqual(cdc_file_writer.file_index, 2)
+        self.assertEqual(self.read_cdc_file(1), '{"id": 1}\n{"id": 2}')
+        self.assertEqual(self.read_cdc_file(2), '{"id": 3}')
+        cdc_file_writer.close()
+        self.assertEqual(cdc_file_writer.file_index, 3)
+        cdc_file_writer.close()
+        self.assertEqual(cdc_file_writer.file_index, 3)
+
+    def test_cdc_file_writer_file_max_age_seconds(self):
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee",
+                                        file_max_age_seconds=0.05)
+        cdc_file_writer.write(['{"id": 1}'])
+        cdc_file_writer.rotate_if_due()
+        cdc_file_writer.write(['{"id": 2}'])
+        self.assertEqual(cdc_file_writer.file_index, 1)
+        time.sleep(0.06)
+        cdc_file_writer.rotate_if_due()
+        self.assertEqual(cdc_file_writer.file_index, 2)
+        cdc_file_writer.write(['{"id": 3}'])
+        time.sleep(0.06)
+        # rotated before the next changes
+        cdc_file_writer.write(['{"id": 4}'])
+        self.assertEqual(self.read_cdc_file(1), '{"id": 1}\n{"id": 2}')
+        self.assertEqual(self.read_cdc_file(2), '{"id": 3}')
+        self.assertEqual(self.read_cdc_file(3), '{"id": 4}')
+
+    def test_cdc_file_writer_incorrect_values(self):
+        with self.assertRaises(ValueError) as cm:
+            CDCFileWriter(self.output_folder, "public.employee", file_max_records=0)
+        self.assertEqual(str(cm.exception), "Incorrect value provided for file_max_records `0`")
+
+    def test_create_cdc_file_writers(self):
+        cdc_file_writers = create_cdc_file_writers(
+            self.output_folder,
+            ["public.employee", "public.user_detail"],
+            {"public.employee": {"cdc_file_max_age_seconds": 10, "columns": ["id"]}},
+            file_max_records=100)
+        self.assertEqual(cdc_file_writers["public.employee"].file_max_age_seconds, 10)
+        self.assertEqual(cdc_file_writers["public.employee"].file_max_records, 100)
+        self.assertIsNone(cdc_file_writers["public.user_detail"].file_max_age_seconds)
+        self.assertEqual(cdc_file_writers["public.user_detail"].file_max_records, 100)
+        self.assertEqual(cdc_file_writers["public.user_detail"].cdc_folder_for_table,
+                         os.path.join(self.output_folder, "public_user_detail"))
+
+    def test_cdc_file_writer_resume(self):
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee",
+                                        file_max_records=3)
+        cdc_file_writer.write(['{"id": 1}', '{"id": 2}'])
+        state = cdc_file_writer.state
+        self.assertEqual(state["file_index"], 1)
+        self.assertEqual(state["file_byte_count"], 19)
+        self.assertEqual(state["file_record_count"], 2)
+        # written after the state was saved, sent again by the slot
+        cdc_file_writer.write(['{"id": 3}'])
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee",
+                                        state["file_index"], file_max_records=3,
+                                        file_byte_count=state["file_byte_count"],
+                                        file_record_count=state["file_record_count"],
+                                        file_opened_at=state["file_opened_at"])
+        self.assertEqual(cdc_file_writer.state, state)
+        cdc_file_writer.write(['{"id": 3}', '{"id": 4}'])
+        self.assertEqual(self.read_cdc_file(1), '{"id": 1}\n{"id": 2}\n{"id": 3}')
+        self.assertEqual(self.read_cdc_file(2), '{"id": 4}')
+
+    def test_cdc_file_writer_resume_shorter_file(self):
+        with open(os.path.join(self.output_folder, "public.employee_cdc_1.csv"), "w") as f:
+            f.write('{"id": 1}')
+        # the state counts bytes lost by a crash, the file was not synced
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee", 1,
+                                        file_max_records=3, file_byte_count=19,
+                                        file_record_count=2, file_opened_at=time.time())
+        cdc_file_writer.write(['{"id": 2}'])
+        self.assertEqual(self.read_cdc_file(1), '{"id": 1}')
+        self.assertEqual(self.read_cdc_file(2), '{"id": 2}')
+        self.assertEqual(cdc_file_writer.state["file_record_count"], 1)
+
+    def test_create_cdc_file_writer_from_state(self):
+        cdc_file_writer = create_cdc_file_writer(self.output_folder, "public.employee",
+                                                 table_state={"file_index": 7,
+                                                              "file_byte_count": 0,
+                                                              "file_record_count": 0,
+                                                              "file_opened_at": None,
+                                                              "last_lsn": "0/1"})
+        self.assertEqual(cdc_file_writer.file_index, 7)
+        self.assertTrue(os.path.isdir(os.path.join(self.output_folder, "public_employee")))
+
+    def test_create_cdc_file_writer_from_state_checks_next_file_only(self):
+        table_state = {"file_index": 2, "file_byte_count": 0, "file_record_count": 0,
+                       "file_opened_at": None, "last_lsn": "0/1"}
+        cdc_folder_for_table = os.path.join(self.output_folder, "public_employee")
+        os.mkdir(cdc_folder_for_table)
+        # not the file after the state, the folder is not listed
+        open(os.path.join(cdc_folder_for_table, "public.employee_cdc_9.csv"), "w").close()
+        cdc_file_writer = create_cdc_file_writer(self.output_folder, "public.employee",
+                                                 table_state=table_state)
+        self.assertEqual(cdc_file_writer.file_index, 2)
+        open(os.path.join(cdc_folder_for_table, "public.employee_cdc_3.csv"), "w").close()
+        cdc_file_writer = create_cdc_file_writer(self.output_folder, "public.employee",
+                                                 table_state=table_state)
+        self.assertEqual(cdc_file_writer.file_index, 10)
+
+    def test_create_cdc_file_writer_escaped_table_name(self):
+        cdc_folder_for_table = os.path.join(self.output_folder, "public_employee")
+        os.mkdir(cdc_folder_for_table)
+        for file_name in ["public.employee_cdc_2.csv", "publicXemployee_cdc_9.csv",
+                          "public.employee_cdc_5.csv.tmp"]:
+            open(os.path.join(cdc_folder_for_table, file_name), "w").close()
+        cdc_file_writer = create_cdc_file_writer(self.output_folder, "public.employee")
+        self.assertEqual(cdc_file_writer.file_index, 3)
+
+    def test_cdc_file_writer_sync(self):
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee", 1, 100)
+        cdc_file_writer.write(['{"id": 1}'])
+        state, has_new_files = cdc_file_writer.sync()
+        self.assertEqual(state["file_index"], 1)
+        self.assertEqual(state["file_byte_count"], 9)
+        self.assertTrue(has_new_files)
+        cdc_file_writer.write(['{"id": 2}'])
+        state, has_new_files = cdc_file_writer.sync(fsync=False)
+        self.assertEqual(state["file_byte_count"], 19)
+        self.assertFalse(has_new_files)
+
+    def test_sync_cdc_file_writers(self):
+        table_cdc_file_writers = create_cdc_file_writers(self.output_folder,
+                                                         ["public.employee", "public.department"])
+        table_cdc_file_writers["public.employee"].write(['{"id": 1}'])
+        table_cdc_file_writers["public.employee"].write(['{"id": 2}'])
+        table_states = sync_cdc_file_writers(table_cdc_file_writers)
+        self.assertEqual(table_states["public.employee"]["file_index"], 3)
+        self.assertEqual(table_states["public.department"]["file_index"], 1)
+        self.assertEqual(sync_cdc_file_writers(table_cdc_file_writers), table_states)
+
+    def test_cdc_file_writer_never_writes_existing_files(self):
+        cdc_file_writer = CDCFileWriter(self.output_folder, "public.employee", 2)
+        # written by the writer of another slot, after the state at file 2
+        with open(os.path.join(self.output_folder, "public.employee_cdc_2.csv"), "w") as f:
+            f.write("c\nd")
+        cdc_file_writer.write(["e"])
+        self.assertEqual(self.read_cdc_file(2), "c\nd")
+        self.assertEqual(self.read_cdc_file(3), "e")
+        self.assertEqual(cdc_file_writer.file_index, 4)
+
+    def test_create_cdc_file_writers_slot_moved_and_back(self):
+        def read_cdc_files():
+            cdc_folder_for_table = os.path.join(self.output_folder, "public_employee")
+            cdc_files = {}
+            for file_name in os.listdir(cdc_folder_for_table):
+                with open(os.path.join(cdc_folder_for_table, file_name), "r") as cdc_file:
+                    cdc_files[file_name] = cdc_file.read()
+            return cdc_files
+
+        # table on the first slot, file 1 is written and in progress
+        first_slot_writers = create_cdc_file_writers(self.output_folder, ["public.employee"],
+                                                     file_max_records=10)
+        first_slot_writers["public.employee"].write(["a", "b"])
+        first_slot_state = first_slot_writers["public.employee"].state
+        first_slot_writers["public.employee"].close()
+
+        # slot count changed, table on the second slot, without a state
+        second_slot_writers = create_cdc_file_writers(self.output_folder, ["public.employee"],
+                                                      file_max_records=10)
+        second_slot_writers["public.employee"].write(["c", "d"])
+        second_slot_writers["public.employee"].close()
+
+        # slot count changed back, state of the first slot is behind the files
+        first_slot_writers = create_cdc_file_writers(self.output_folder, ["public.employee"],
+                                                     file_max_records=10,
+                                                     table_states={"public.employee":
+                                                                   first_slot_state})
+        self.assertEqual(first_slot_writers["public.employee"].file_index, 3)
+        first_slot_writers["public.employee"].write(["e"])
+        first_slot_writers["public.employee"].close()
+        self.assertEqual(read_cdc_files(), {"public.employee_cdc_1.csv": "a\nb",
+                                            "public.employee_cdc_2.csv": "c\nd",
+                                            "public.employee_cdc_3.csv": "e"})
@@ -0,0 +1,97 @@
+import json
+import threading
+
+from siirto.plugins.cdc.cdc_pipeline import CDCPipeline
+from tests.test_base.base_test import BaseTest
+
+
+def transaction(*changes):
+    return json.dumps({"change": [{"kind": "insert", "schema": "public", "table": table,
+                                   "columnvalues": [value]} for table, value in changes]})
+
+
+class TestCDCPipeline(BaseTest):
+
+    def run_pipeline(self, decode_processes):
+        written = {}
+        write_lock = threading.Lock()
+
+        def write_changes(table_name, changes):
+            with write_lock:
+                written.setdefault(table_name, []).extend(
+                    [json.loads(change)["columnvalues"][0] for change in changes])
+
+        pipeline = CDCPipeline(write_changes, 1, decode_processes, 2)
+        pipeline.start()
+        for index in range(10):
+            pipeline.submit([transaction(("employee", index), ("user_detail", index)),
+                             transaction(("employee", index + 100))], f"0/{index}")
+        self.assertEqual(pipeline.wait_acknowledged(), "0/9")
+        pipeline.submit(['{"change": []}'], "0/10")
+        self.assertEqual(pipeline.wait_acknowledged(), "0/10")
+        pipeline.stop()
+        self.assertEqual(written["public.employee"],
+                         [value for index in range(10) for value in [index, index + 100]])
+        self.assertEqual(written["public.user_detail"], list(range(10)))
+
+    def test_cdc_pipeline_decode_in_thread(self):
+        self.run_pipeline(0)
+
+    def test_cdc_pipeline_decode_in_processes(self):
+        self.run_pipeline(2)
+
+    def test_cdc_pipeline_acknowledges_after_all_writers(self):
+        employee_written = threading.Event()
+        release_employee = threading.Event()
+
+        def write_changes(table_name, changes):
+            if table_name == "public.employee":
+                employee_written.set()
+                release_employee.wait(5)
+
+        pipeline = CDCPipeline(write_changes)
+        pipeline.start()
+        pipeline.submit([transaction(("employee", 1), ("user_detail", 1))], "0/1")
+        pipeline.submit([transaction(("user_detail", 2))], "0/2")
+        employee_written.wait(5)
+        self.assertIsNone(pipeline.acknowledged_lsn)
+        release_employee.set()
+        self.assertEqual(pipeline.wait_acknowledged(), "0/2")
+        pipeline.stop()
+
+    def test_cdc_pipeline_batch_inside_transaction(self):
+        change = '{"action":"I","schema":"public","table":"employee","columns":[]}'
+        written = []
+        pipeline = CDCPipeline(lambda table_name, changes: written.extend(changes), 2)
+        pipeline.start()
+        pipeline.submit(['{"action":"B"}', change], None)
+        self.assertIsNone(pipeline.wait_acknowledged())
+        pipeline.submit([change, '{"action":"C"}'], "0/3")
+        self.assertEqual(pipeline.wait_acknowledged(), "0/3")
+        pipeline.stop()
+        self.assertEqual(written, [change, change])
+
+    def test_cdc_pipeline_writer_error(self):
+        def write_changes(table_name, changes):
+            raise OSError("disk full")
+
+        pipeline = CDCPipeline(write_changes)
+        pipeline.start()
+        pipeline.submit([transaction(("employee", 1))], "0/1")
+        with self.assertRaises(RuntimeError) as cm:
+            pipeline.wait_acknowledged()
+        self.assertEqual(str(cm.exception.__cause__), "disk full")
+        self.assertIsNone(pipeline.acknowledged_lsn)
+        with self.assertRaises(RuntimeError):
+            pipeline.submit([transaction(("employee", 2))], "0/2")
+        pipeline.stop()
+
+    def test_cdc_pipeline_incorrect_values(self):
+        with self.assertRaises(ValueError) as cm:
+            CDCPipeline(print, 1, -1)
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for cdc_decode_processes `-1`")
+        with self.assertRaises(ValueError) as cm:
+            CDCPipeline(print, 1, 0, 0)
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for cdc_pipeline_queue_size `0`")
@@ -0,0 +1,35 @@
+import os
+
+from siirto.plugins.cdc.cdc_state_store import CDCStateStore, cdc_state_file_name
+from tests.test_base.base_test import BaseTest
+
+
+class TestCDCStateStore(BaseTest):
+
+    def test_cdc_state_store_save_and_get(self):
+        database_path = os.path.join(self.output_folder, "_cdc_state.db")
+        state_store = CDCStateStore(database_path)
+        self.assertEqual(state_store.get_table_states(), {})
+        employee_state = {"file_index": 3, "file_byte_count": 20,
+                          "file_record_count": 2, "file_opened_at": 1600000000.5}
+        user_detail_state = {"file_index": 1, "file_byte_count": 0,
+                             "file_record_count": 0, "file_opened_at": None}
+        state_store.save_table_states({"public.employee": employee_state,
+                                       "public.user_detail": user_detail_state},
+                                      "0/16B3748", ["public.employee"])
+        state_store.close()
+
+        # state is durable, the last lsn of a table is kept till it has changes again
+        state_store = CDCStateStore(database_path)
+        employee_state["file_index"] = 4
+        state_store.save_table_states({"public.employee": employee_state})
+        state_store.save_table_states({"public.user_detail": user_detail_state},
+                                      "0/16B3800", ["public.user_detail"])
+        self.assertEqual(state_store.get_table_states(),
+                         {"public.employee": dict(employee_state, last_lsn="0/16B3748"),
+                          "public.user_detail": dict(user_detail_state, last_lsn="0/16B3800")})
+        state_store.close()
+
+    def test_cdc_state_file_name(self):
+        self.assertEqual(cdc_state_file_name("siirto_slot"), "_cdc_state_siirto_slot.db")
+        self.assertEqual(cdc_state_file_name("siirto_slot_1"), "_cdc_state_siirto_slot_1.db")
@@ -1,3 +1,4 @@
+import json
 import os
 import time
 import psycopg2
@@ -9,6 +10,34 @@ from siirto.shared.enums import PlugInType
 from tests.test_base.base_test import BaseTest
 
 
+class StandInBatchCursor:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.rows_read = 0
+        self.query = None
+
+    def execute(self, query):
+        self.query = query
+
+    def __iter__(self):
+        for row in self.rows:
+            self.rows_read += 1
+            yield row
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+
+    def __init__(self, rows):
+        self.batch_cursor = StandInBatchCursor(rows)
+
+    def cursor(self, name=None):
+        return self.batch_cursor
+
+
 class TestPgDefaultCDCPlugin(BaseTest):
 
     def test_postgres_default_cdc_plugin_type_and_name(self):
@@ -25,6 +54,116 @@ class TestPgDefaultCDCPlugin(BaseTest):
         }
         PgDefaultCDCPlugin(**cdc_init_params)
 
+    def test_postgres_default_cdc_plugin_batch_parameters(self):
+        for parameter_name in ["cdc_batch_max_changes", "cdc_batch_max_bytes"]:
+            cdc_init_params = {
+                "output_folder_location": self.output_folder,
+                "connection_string": self.postgres_connection_string,
+                "table_names": ['public.employee'],
+                parameter_name: 0
+            }
+            with self.assertRaises(ValueError) as cm:
+                PgDefaultCDCPlugin(**cdc_init_params)
+            self.assertEqual(str(cm.exception),
+                             f"Incorrect value provided for {parameter_name} `0`")
+
+    def test_postgres_default_cdc_plugin_read_batch(self):
+        def transaction(employee_id):
+            return json.dumps({"change": [{"kind": "insert", "schema": "public",
+                                           "table": "employee", "columnnames": ["id"],
+                                           "columntypes": ["integer"],
+                                           "columnvalues": [employee_id]}]})
+        rows = [(f"0/{index}", transaction(index)) for index in range(1, 6)]
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "cdc_batch_max_changes": 5,
+            "cdc_batch_max_bytes": len(rows[0][1]) * 2
+        }
+        cdc_plugin_object = PgDefaultCDCPlugin(**cdc_init_params)
+
+        # batch ends once it has cdc_batch_max_bytes bytes
+        connection = StandInConnection(rows)
+        rows_collected, max_lsn, batch_full = \
+            cdc_plugin_object._read_batch(connection, "siirto_slot")
+        self.assertIn("pg_logical_slot_peek_changes('siirto_slot', NULL, 5, "
+                      "'add-tables', 'public.employee');",
+                      connection.batch_cursor.query)
+        self.assertEqual(connection.batch_cursor.rows_read, 2)
+        self.assertEqual(len(rows_collected["public.employee"]), 2)
+        self.assertEqual(max_lsn, "0/2")
+        self.assertTrue(batch_full)
+
+        # batch ends once it has cdc_batch_max_changes rows
+        cdc_plugin_object.cdc_batch_max_bytes = 1048576
+        rows_collected, max_lsn, batch_full = \
+            cdc_plugin_object._read_batch(StandInConnection(rows), "siirto_slot")
+        self.assertEqual(len(rows_collected["public.employee"]), 5)
+        self.assertEqual(max_lsn, "0/5")
+        self.assertTrue(batch_full)
+
+        # caught up
+        rows_collected, max_lsn, batch_full = \
+            cdc_plugin_object._read_batch(StandInConnection(rows[:3]), "siirto_slot")
+        self.assertEqual(max_lsn, "0/3")
+        self.assertFalse(batch_full)
+
+    def test_postgres_default_cdc_plugin_read_batch_format_version_2(self):
+        def change(employee_id):
+            return '{"action":"I","schema":"public","table":"employee",' \
+                   '"columns":[{"name":"id","type":"integer","value":%d}]}' % employee_id
+        rows = [("0/1", '{"action":"B"}'), ("0/2", change(1)), ("0/3", change(2)),
+                ("0/4", '{"action":"C"}'), ("0/5", '{"action":"B"}'), ("0/6", change(3)),
+                ("0/7", '{"action":"C"}')]
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "cdc_batch_max_bytes": len(change(1)),
+            "wal2json_format_version": 2
+        }
+        cdc_plugin_object = PgDefaultCDCPlugin(**cdc_init_params)
+        connection = StandInConnection(rows)
+        rows_collected, max_lsn, batch_full = \
+            cdc_plugin_object._read_batch(connection, "siirto_slot")
+        self.assertIn("pg_logical_slot_peek_changes('siirto_slot', NULL, 10000, "
+                      "'add-tables', 'public.employee', 'format-version', '2');",
+                      connection.batch_cursor.query)
+        # batch ends on the end of the transaction
+        self.assertEqual(rows_collected, {"public.employee": [change(1), change(2)]})
+        self.assertEqual(max_lsn, "0/4")
+        self.assertTrue(batch_full)
+
+        cdc_init_params["wal2json_format_version"] = 3
+        with self.assertRaises(ValueError) as cm:
+            PgDefaultCDCPlugin(**cdc_init_params)
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for wal2json_format_version `3`")
+
+    def test_postgres_default_cdc_plugin_poll_interval_metric(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "poll_frequency": 0.01,
+            "poll_max_interval": 0.04
+        }
+        cdc_plugin_object = PgDefaultCDCPlugin(**cdc_init_params)
+        self.assertEqual(cdc_plugin_object.metrics, {"poll_interval": 0.01})
+        started_at = time.monotonic()
+        cdc_plugin_object._wait_for_next_poll(False, False)
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.02)
+        self.assertEqual(cdc_plugin_object.metrics, {"poll_interval": 0.02})
+        cdc_plugin_object._wait_for_next_poll(True, True)
+        self.assertEqual(cdc_plugin_object.metrics, {"poll_interval": 0})
+        # no wait once stopped
+        cdc_plugin_object.poll_scheduler.interval = 0.04
+        cdc_plugin_object.is_running = False
+        started_at = time.monotonic()
+        cdc_plugin_object._wait_for_next_poll(False, False)
+        self.assertLess(time.monotonic() - started_at, 0.04)
+
     def insert_ref_data(self):
         with psycopg2.connect(self.postgres_connection_string) as conn:
             with conn.cursor() as cursor:
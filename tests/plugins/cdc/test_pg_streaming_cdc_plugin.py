@@ -0,0 +1,314 @@
+import json
+import os
+import time
+import threading
+
+import psycopg2
+
+from siirto.plugins.cdc.cdc_base import CDCBase
+from siirto.plugins.cdc.cdc_file_writer import create_cdc_file_writer
+from siirto.plugins.cdc.cdc_state_store import CDCStateStore
+from siirto.plugins.cdc.pg_streaming_cdc_plugin import PgStreamingCDCPlugin
+from siirto.shared.enums import PlugInType
+from tests.test_base.base_test import BaseTest
+
+
+class StandInReplicationMessage:
+
+    def __init__(self, payload, data_start):
+        self.payload = payload
+        self.data_start = data_start
+
+
+class StandInReplicationCursor:
+
+    def __init__(self, cdc_file_path):
+        self.cdc_file_path = cdc_file_path
+        self.feedbacks = []
+
+    def send_feedback(self, flush_lsn=0):
+        # the changes must be written before the position is reported
+        self.feedbacks.append((flush_lsn, os.path.exists(self.cdc_file_path)))
+
+
+class StandInSlotCursor:
+
+    def __init__(self, active_checks):
+        self.active_checks = active_checks
+        self.dropped = False
+        self.row = None
+
+    def execute(self, query, params=None):
+        if "pg_drop_replication_slot" in query:
+            self.dropped = True
+        elif self.dropped:
+            self.row = None
+        else:
+            self.row = (self.active_checks > 0,)
+            self.active_checks -= 1
+
+    def fetchone(self):
+        return self.row
+
+
+class TestPgStreamingCDCPlugin(BaseTest):
+
+    def test_postgres_streaming_cdc_plugin_type_and_name(self):
+        self.assertEqual(PgStreamingCDCPlugin.plugin_type,
+                         PlugInType.CDC)
+        self.assertEqual(PgStreamingCDCPlugin.plugin_name,
+                         "PgStreamingCDCPlugin")
+        self.assertEqual(CDCBase.get_object("PgStreamingCDCPlugin"),
+                         PgStreamingCDCPlugin)
+
+    def test_postgres_streaming_cdc_plugin_init(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "stream_flush_interval": 0
+        }
+        with self.assertRaises(ValueError) as cm:
+            PgStreamingCDCPlugin(**cdc_init_params)
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for stream_flush_interval `0`")
+
+    def test_postgres_streaming_cdc_plugin_feedback_after_write(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+        }
+        cdc_plugin_object = PgStreamingCDCPlugin(**cdc_init_params)
+        cdc_plugin_object.table_cdc_file_writers["public.employee"] = \
+            create_cdc_file_writer(self.output_folder, "public.employee")
+        cdc_file_path = os.path.join(self.output_folder, "public_employee",
+                                     "public.employee_cdc_1.csv")
+        replication_cursor = StandInReplicationCursor(cdc_file_path)
+
+        change = {"kind": "insert", "schema": "public", "table": "employee",
+                  "columnnames": ["id"], "columntypes": ["integer"], "columnvalues": [1]}
+        cdc_plugin_object._receive(StandInReplicationMessage(
+            json.dumps({"change": [change]}), "0/16B3748"))
+        cdc_plugin_object._receive(StandInReplicationMessage(
+            json.dumps({"change": []}), "0/16B3800"))
+        cdc_plugin_object._persist(replication_cursor)
+        # nothing pending, no feedback
+        cdc_plugin_object._persist(replication_cursor)
+
+        self.assertEqual(replication_cursor.feedbacks, [("0/16B3800", True)])
+        with open(cdc_file_path, "r") as cdc_file:
+            self.assertEqual(cdc_file.read(), json.dumps(change))
+
+    def test_postgres_streaming_cdc_plugin_pending_byte_count(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "cdc_batch_max_bytes": 0
+        }
+        with self.assertRaises(ValueError) as cm:
+            PgStreamingCDCPlugin(**cdc_init_params)
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for cdc_batch_max_bytes `0`")
+        cdc_init_params["cdc_batch_max_bytes"] = 1024
+        cdc_plugin_object = PgStreamingCDCPlugin(**cdc_init_params)
+        cdc_plugin_object.table_cdc_file_writers["public.employee"] = \
+            create_cdc_file_writer(self.output_folder, "public.employee")
+        cdc_plugin_object._receive(StandInReplicationMessage('{"change": []}', "0/1"))
+        self.assertEqual(cdc_plugin_object.pending_byte_count, 14)
+        cdc_plugin_object._persist(StandInReplicationCursor(self.output_folder))
+        self.assertEqual(cdc_plugin_object.pending_byte_count, 0)
+
+    def test_postgres_streaming_cdc_plugin_format_version_2(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "wal2json_format_version": 2
+        }
+        cdc_plugin_object = PgStreamingCDCPlugin(**cdc_init_params)
+        self.assertEqual(cdc_plugin_object.wal2json_options,
+                         {"add-tables": "public.employee", "format-version": "2"})
+        cdc_plugin_object.table_cdc_file_writers["public.employee"] = \
+            create_cdc_file_writer(self.output_folder, "public.employee")
+        cdc_file_path = os.path.join(self.output_folder, "public_employee",
+                                     "public.employee_cdc_1.csv")
+        replication_cursor = StandInReplicationCursor(cdc_file_path)
+        change = '{"action":"I","schema":"public","table":"employee",' \
+                 '"columns":[{"name":"id","type":"integer","value":1}]}'
+
+        cdc_plugin_object._receive(StandInReplicationMessage('{"action":"B"}', "0/1"))
+        cdc_plugin_object._receive(StandInReplicationMessage(change, "0/2"))
+        # changes of an open transaction are written, not acknowledged
+        cdc_plugin_object._persist(replication_cursor)
+        self.assertEqual(replication_cursor.feedbacks, [])
+        cdc_plugin_object._receive(StandInReplicationMessage('{"action":"C"}', "0/3"))
+        cdc_plugin_object._persist(replication_cursor)
+        self.assertEqual(replication_cursor.feedbacks, [("0/3", True)])
+        with open(cdc_file_path, "r") as cdc_file:
+            self.assertEqual(cdc_file.read(), change)
+
+    def test_postgres_streaming_cdc_plugin_pipeline(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "cdc_pipeline": True
+        }
+        cdc_plugin_object = PgStreamingCDCPlugin(**cdc_init_params)
+        cdc_plugin_object.table_cdc_file_writers["public.employee"] = \
+            create_cdc_file_writer(self.output_folder, "public.employee", 1048576)
+        cdc_file_path = os.path.join(self.output_folder, "public_employee",
+                                     "public.employee_cdc_1.csv")
+        replication_cursor = StandInReplicationCursor(cdc_file_path)
+        changes = [{"kind": "insert", "schema": "public", "table": "employee",
+                    "columnnames": ["id"], "columntypes": ["integer"], "columnvalues": [index]}
+                   for index in range(3)]
+
+        cdc_plugin_object.pipeline.start()
+        cdc_plugin_object._receive(StandInReplicationMessage(
+            json.dumps({"change": changes[:2]}), "0/1"))
+        cdc_plugin_object._submit()
+        cdc_plugin_object._receive(StandInReplicationMessage(
+            json.dumps({"change": changes[2:]}), "0/2"))
+        cdc_plugin_object._submit()
+        cdc_plugin_object.pipeline.stop()
+        cdc_plugin_object._report_acknowledged(replication_cursor)
+        cdc_plugin_object._report_acknowledged(replication_cursor)
+
+        self.assertEqual(replication_cursor.feedbacks, [("0/2", True)])
+        with open(cdc_file_path, "r") as cdc_file:
+            self.assertEqual(cdc_file.read(),
+                             "\n".join(json.dumps(change) for change in changes))
+
+    def test_postgres_streaming_cdc_plugin_state_saved_before_feedback(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+        }
+        cdc_plugin_object = PgStreamingCDCPlugin(**cdc_init_params)
+        database_path = os.path.join(self.output_folder, "_cdc_state.db")
+        cdc_plugin_object.state_store = CDCStateStore(database_path)
+        cdc_plugin_object.table_cdc_file_writers["public.employee"] = \
+            create_cdc_file_writer(self.output_folder, "public.employee")
+
+        saved_lsns = []
+
+        # the lsn is in the state store once the server is told it is flushed
+        def send_feedback(flush_lsn=0):
+            state_store = CDCStateStore(database_path)
+            saved_lsns.append(state_store.get_table_states()["public.employee"]["last_lsn"])
+            state_store.close()
+
+        replication_cursor = StandInReplicationCursor(self.output_folder)
+        replication_cursor.send_feedback = send_feedback
+        cdc_plugin_object._receive(StandInReplicationMessage(
+            json.dumps({"change": [{"kind": "insert", "schema": "public", "table": "employee",
+                                    "columnvalues": [1]}]}), "0/5"))
+        cdc_plugin_object._persist(replication_cursor)
+        self.assertEqual(saved_lsns, ["0/5"])
+        cdc_plugin_object._close_files()
+        state_store = CDCStateStore(database_path)
+        self.assertEqual(state_store.get_table_states()["public.employee"]["file_index"], 2)
+        state_store.close()
+
+    def test_postgres_streaming_cdc_plugin_commit_interval(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "cdc_commit_interval": -1
+        }
+        with self.assertRaises(ValueError) as cm:
+            PgStreamingCDCPlugin(**cdc_init_params)
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for cdc_commit_interval `-1`")
+
+        cdc_init_params["cdc_commit_interval"] = 60
+        cdc_plugin_object = PgStreamingCDCPlugin(**cdc_init_params)
+        database_path = os.path.join(self.output_folder, "_cdc_state.db")
+        cdc_plugin_object.state_store = CDCStateStore(database_path)
+        cdc_plugin_object.table_cdc_file_writers["public.employee"] = \
+            create_cdc_file_writer(self.output_folder, "public.employee")
+        cdc_file_path = os.path.join(self.output_folder, "public_employee",
+                                     "public.employee_cdc_1.csv")
+        replication_cursor = StandInReplicationCursor(cdc_file_path)
+
+        for employee_id, lsn in [(1, "0/1"), (2, "0/2")]:
+            cdc_plugin_object._receive(StandInReplicationMessage(
+                json.dumps({"change": [{"kind": "insert", "schema": "public",
+                                        "table": "employee",
+                                        "columnvalues": [employee_id]}]}), lsn))
+            cdc_plugin_object._persist(replication_cursor)
+        # the second write is committed once the commit interval is over
+        self.assertEqual(replication_cursor.feedbacks, [("0/1", True)])
+        self.assertEqual(cdc_plugin_object.written_lsn, "0/2")
+        cdc_plugin_object._persist(replication_cursor, force=True)
+        self.assertEqual(replication_cursor.feedbacks, [("0/1", True), ("0/2", True)])
+        self.assertEqual(cdc_plugin_object.metrics["committed_lsn"], "0/2")
+        state_store = CDCStateStore(database_path)
+        self.assertEqual(state_store.get_table_states()["public.employee"]["last_lsn"], "0/2")
+        state_store.close()
+        cdc_plugin_object._close_files()
+
+    def insert_ref_data(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM employee;')
+                cursor.execute("INSERT INTO employee VALUES (1, 'User1')")
+
+    def test_postgres_streaming_cdc_plugin_run_test(self):
+        self.insert_ref_data()
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+            "cdc_file_size_bytes": 1048576
+        }
+        cdc_plugin_object = PgStreamingCDCPlugin(**cdc_init_params)
+
+        def thread_to_terminate_processes(cdc_plugin_object_: PgStreamingCDCPlugin):
+            time.sleep(4)
+            cdc_plugin_object_.is_running = False
+
+        def insert_ref_cdc_data(connection_string: str):
+            time.sleep(1)
+            with psycopg2.connect(connection_string) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("INSERT INTO employee VALUES (3, 'User3')")
+            with psycopg2.connect(connection_string) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("INSERT INTO employee VALUES (4, 'User4')")
+
+        threading.Thread(target=thread_to_terminate_processes,
+                         args=(cdc_plugin_object, )).start()
+        threading.Thread(target=insert_ref_cdc_data,
+                         args=(self.postgres_connection_string, )).start()
+        cdc_plugin_object.execute()
+
+        cdc_output_path = os.path.join(self.output_folder,
+                                       "public_employee",
+                                       "public.employee_cdc_1.csv")
+        with open(cdc_output_path, 'r') as cdc_file:
+            changes = [json.loads(change) for change in cdc_file.read().split("\n")]
+        self.assertEqual([change["columnvalues"] for change in changes],
+                         [[3, "User3"], [4, "User4"]])
+
+    def test_postgres_streaming_cdc_plugin_drop_slot_once_released(self):
+        cdc_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_names": ['public.employee'],
+        }
+        plugin = PgStreamingCDCPlugin(**cdc_init_params)
+        # the walsender still holds the slot for the first two checks
+        cursor = StandInSlotCursor(active_checks=2)
+        plugin._drop_slot(cursor, "siirto_slot")
+        self.assertTrue(cursor.dropped)
+        self.assertEqual(cursor.active_checks, -1)
+        # an already dropped slot is skipped
+        cursor = StandInSlotCursor(active_checks=0)
+        cursor.dropped = True
+        plugin._drop_slot(cursor, "siirto_slot")
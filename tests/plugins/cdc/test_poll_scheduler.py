@@ -0,0 +1,39 @@
+from siirto.plugins.cdc.poll_scheduler import AdaptivePollScheduler
+from tests.test_base.base_test import BaseTest
+
+
+class TestAdaptivePollScheduler(BaseTest):
+
+    def test_adaptive_poll_scheduler_intervals(self):
+        poll_scheduler = AdaptivePollScheduler(1, 5)
+        self.assertEqual(poll_scheduler.interval, 1)
+        # back off while idle, up to the maximum interval
+        self.assertEqual([poll_scheduler.next_interval(False, False) for _ in range(4)],
+                         [2, 4, 5, 5])
+        # immediate poll while the batches are full
+        self.assertEqual(poll_scheduler.next_interval(True, True), 0)
+        self.assertEqual(poll_scheduler.next_interval(True, True), 0)
+        # caught up
+        self.assertEqual(poll_scheduler.next_interval(True, False), 1)
+        self.assertEqual(poll_scheduler.next_interval(False, False), 2)
+        self.assertEqual(poll_scheduler.next_interval(True, False), 1)
+        self.assertEqual(poll_scheduler.interval, 1)
+
+    def test_adaptive_poll_scheduler_without_back_off(self):
+        poll_scheduler = AdaptivePollScheduler(0.5)
+        self.assertEqual([poll_scheduler.next_interval(False, False) for _ in range(3)],
+                         [0.5, 0.5, 0.5])
+        self.assertEqual(poll_scheduler.next_interval(True, True), 0)
+        self.assertEqual(poll_scheduler.next_interval(False, False), 0.5)
+
+    def test_adaptive_poll_scheduler_incorrect_values(self):
+        with self.assertRaises(ValueError) as cm:
+            AdaptivePollScheduler(-1)
+        self.assertEqual(str(cm.exception), "Incorrect value provided for poll_frequency `-1`")
+        with self.assertRaises(ValueError) as cm:
+            AdaptivePollScheduler(2, 1)
+        self.assertEqual(str(cm.exception), "Incorrect value provided for poll_max_interval `1`")
+        with self.assertRaises(ValueError) as cm:
+            AdaptivePollScheduler(1, 2, 0.5)
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for poll_backoff_factor `0.5`")
@@ -0,0 +1,83 @@
+import json
+
+from siirto.plugins.cdc import wal2json_decoder
+from siirto.plugins.cdc.wal2json_decoder import collect_table_change, \
+    collect_table_changes, decode_change_routing, wal2json_options
+from tests.test_base.base_test import BaseTest
+
+
+class TestWal2JsonDecoder(BaseTest):
+
+    def test_collect_table_changes(self):
+        insert = {"kind": "insert", "schema": "public", "table": "employee",
+                  "columnnames": ["id"], "columntypes": ["integer"], "columnvalues": [1]}
+        delete = {"kind": "delete", "schema": "public", "table": "employee_detail",
+                  "oldkeys": {"keynames": ["id"], "keytypes": ["integer"], "keyvalues": [1]}}
+        message = {"kind": "message", "transactional": False, "prefix": "siirto"}
+        rows_collected = {"public.employee": ['{"id": 0}']}
+
+        change_count = collect_table_changes(
+            json.dumps({"change": [insert, delete, message]}), rows_collected)
+        self.assertEqual(change_count, 2)
+        self.assertEqual(rows_collected,
+                         {"public.employee": ['{"id": 0}', json.dumps(insert)],
+                          "public.employee_detail": [json.dumps(delete)]})
+        self.assertEqual(collect_table_changes('{"change": []}', rows_collected), 0)
+
+    def test_collect_table_changes_large_integer(self):
+        rows_collected = {}
+        collect_table_changes('{"change": [{"kind": "insert", "schema": "public", '
+                              '"table": "employee", "columnvalues": [123456789012345678901234]}]}',
+                              rows_collected)
+        self.assertEqual(rows_collected["public.employee"][0],
+                         '{"kind": "insert", "schema": "public", '
+                         '"table": "employee", "columnvalues": [123456789012345678901234]}')
+
+    def test_decode_change_routing(self):
+        self.assertEqual(decode_change_routing('{"action":"B"}'), ("B", None))
+        self.assertEqual(decode_change_routing('{"action":"C"}'), ("C", None))
+        self.assertEqual(decode_change_routing(
+            '{"action":"M","transactional":false,"prefix":"siirto","content":"x"}'), ("M", None))
+        self.assertEqual(decode_change_routing(
+            '{"action":"U","schema":"public","table":"employee","columns":[]}'),
+            ("U", "public.employee"))
+        self.assertEqual(decode_change_routing(
+            '{"action":"D","schema":"public","table":"em\\"ployee","identity":[]}'),
+            ("D", 'public.em"ployee'))
+        # not in the format sent by wal2json, parsed
+        self.assertEqual(decode_change_routing(
+            '{"table": "employee", "schema": "public", "action": "I"}'),
+            ("I", "public.employee"))
+
+    def test_decode_change_routing_without_orjson(self):
+        orjson = wal2json_decoder.orjson
+        wal2json_decoder.orjson = None
+        try:
+            self.assertEqual(decode_change_routing(
+                '{"action":"I","schema":"public","table":"em\\u00e9ployee","columns":[]}'),
+                ("I", "public.em\u00e9ployee"))
+            self.assertEqual(decode_change_routing(
+                '{"table": "employee", "schema": "public", "action": "I"}'),
+                ("I", "public.employee"))
+        finally:
+            wal2json_decoder.orjson = orjson
+
+    def test_collect_table_change(self):
+        change = '{"action":"I","schema":"public","table":"employee",' \
+                 '"columns":[{"name":"id","type":"integer","value":1}]}'
+        rows_collected = {}
+        self.assertEqual(collect_table_change('{"action":"B"}', rows_collected), "B")
+        self.assertEqual(collect_table_change(change, rows_collected), "I")
+        self.assertEqual(collect_table_change(change, rows_collected), "I")
+        self.assertEqual(collect_table_change('{"action":"C"}', rows_collected), "C")
+        self.assertEqual(rows_collected, {"public.employee": [change, change]})
+
+    def test_wal2json_options(self):
+        self.assertEqual(wal2json_options(1, ["public.employee", "public.user_detail"]),
+                         {"add-tables": "public.employee,public.user_detail"})
+        self.assertEqual(wal2json_options(2, ["public.employee"]),
+                         {"add-tables": "public.employee", "format-version": "2"})
+        with self.assertRaises(ValueError) as cm:
+            wal2json_options(0, ["public.employee"])
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for wal2json_format_version `0`")
@@ -1,9 +1,16 @@
+import hashlib
+import gzip
+import json
+import math
 import os
+import shutil
+from types import SimpleNamespace
 
 import psycopg2
 
 from siirto.plugins.full_load.pg_default_full_load_plugin import PgDefaultFullLoadPlugin
 from siirto.shared.enums import PlugInType
+from siirto.shared.pg_binary_copy import read_binary_copy_file
 from tests.test_base.base_test import BaseTest
 
 
@@ -120,3 +127,573 @@ class TestPgDefaultFullLoadPlugin(BaseTest):
         self.assertEqual(full_load_output_content_1, "2\tUser2\n")
         self.assertEqual(len(notification_result_queue), 1)
         self.assertEqual(notification_result_queue[0], "success:public.employee:None")
+
+    def read_part_files(self):
+        lines = []
+        for file_name in sorted(os.listdir(self.output_folder)):
+            if file_name.endswith(".csv"):
+                with open(os.path.join(self.output_folder, file_name), 'r') as full_load_file:
+                    lines.extend(full_load_file.readlines())
+        return lines
+
+    def test_postgres_default_full_load_plugin_run_test_parallel(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM employee;')
+                cursor.execute("INSERT INTO employee SELECT i, 'User' || i "
+                               "FROM generate_series(1, 10) i")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "parallel_workers": 3
+        }
+        full_load_plugin_object = PgDefaultFullLoadPlugin(**full_load_init_params)
+        full_load_plugin_object.execute()
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder,
+                                                    "x0000_00_public.employee.csv")))
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder,
+                                                    "x0002_00_public.employee.csv")))
+        self.assertEqual(self.read_part_files(),
+                         [f"{i}\tUser{i}\n" for i in range(1, 11)])
+
+    def test_postgres_default_full_load_plugin_run_test_parallel_ctid(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS employee_no_key;')
+                cursor.execute('CREATE TABLE employee_no_key (id INT, name VARCHAR(50));')
+                cursor.execute("INSERT INTO employee_no_key SELECT i, 'User' || i "
+                               "FROM generate_series(1, 1000) i")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee_no_key",
+            "notify_on_completion": None,
+            "parallel_workers": 2
+        }
+        full_load_plugin_object = PgDefaultFullLoadPlugin(**full_load_init_params)
+        full_load_plugin_object.execute()
+        self.assertEqual(sorted(self.read_part_files()),
+                         sorted([f"{i}\tUser{i}\n" for i in range(1, 1001)]))
+        with open(full_load_plugin_object.manifest_file, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            server_version = conn.server_version
+        # ctid ranges need TID range scans, postgres 14+
+        if server_version >= 140000:
+            self.assertGreater(len(manifest["chunks"]), 1)
+        else:
+            self.assertEqual(len(manifest["chunks"]), 1)
+
+    def test_postgres_default_full_load_plugin_run_test_partitioned(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS employee_partitioned;')
+                cursor.execute('CREATE TABLE employee_partitioned (id INT, name VARCHAR(50)) '
+                               'PARTITION BY RANGE (id);')
+                cursor.execute('CREATE TABLE employee_partitioned_1 PARTITION OF '
+                               'employee_partitioned FOR VALUES FROM (1) TO (3);')
+                cursor.execute('CREATE TABLE employee_partitioned_2 PARTITION OF '
+                               'employee_partitioned FOR VALUES FROM (3) TO (5);')
+                cursor.execute("INSERT INTO employee_partitioned SELECT i, 'User' || i "
+                               "FROM generate_series(1, 4) i")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee_partitioned",
+            "notify_on_completion": None,
+            "parallel_workers": 2
+        }
+        full_load_plugin_object = PgDefaultFullLoadPlugin(**full_load_init_params)
+        full_load_plugin_object.execute()
+        full_load_output_path_1 = os.path.join(self.output_folder,
+                                               "public_employee_partitioned_1",
+                                               "x00_public.employee_partitioned_1.csv")
+        full_load_output_path_2 = os.path.join(self.output_folder,
+                                               "public_employee_partitioned_2",
+                                               "x00_public.employee_partitioned_2.csv")
+        with open(full_load_output_path_1, 'r') as full_load_file:
+            self.assertEqual(full_load_file.read(), "1\tUser1\n2\tUser2\n")
+        with open(full_load_output_path_2, 'r') as full_load_file:
+            self.assertEqual(full_load_file.read(), "3\tUser3\n4\tUser4\n")
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "_success")))
+
+    def test_postgres_default_full_load_plugin_run_test_partitioned_without_partitions(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS employee_partitioned_empty;')
+                cursor.execute('CREATE TABLE employee_partitioned_empty (id INT, name VARCHAR(50)) '
+                               'PARTITION BY RANGE (id);')
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee_partitioned_empty",
+            "notify_on_completion": None
+        }
+        full_load_plugin_object = PgDefaultFullLoadPlugin(**full_load_init_params)
+        full_load_plugin_object.execute()
+        with open(full_load_plugin_object.manifest_file, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual(manifest["chunks"], [])
+        self.assertEqual(manifest["row_count"], 0)
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "_success")))
+
+    def test_postgres_default_full_load_plugin_plan_chunks_of_partitions(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS employee_partitioned_mixed;')
+                cursor.execute('DROP SERVER IF EXISTS siirto_test_server;')
+                cursor.execute('DROP FOREIGN DATA WRAPPER IF EXISTS siirto_test_fdw;')
+                cursor.execute('CREATE TABLE employee_partitioned_mixed (id INT, name VARCHAR(50)) '
+                               'PARTITION BY RANGE (id);')
+                cursor.execute('CREATE TABLE "Employee_Partition_1" PARTITION OF '
+                               'employee_partitioned_mixed FOR VALUES FROM (1) TO (3);')
+                cursor.execute('CREATE FOREIGN DATA WRAPPER siirto_test_fdw;')
+                cursor.execute('CREATE SERVER siirto_test_server '
+                               'FOREIGN DATA WRAPPER siirto_test_fdw;')
+                cursor.execute('CREATE FOREIGN TABLE employee_partition_2 PARTITION OF '
+                               'employee_partitioned_mixed FOR VALUES FROM (3) TO (5) '
+                               'SERVER siirto_test_server;')
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee_partitioned_mixed",
+            "notify_on_completion": None
+        }
+        full_load_plugin_object = PgDefaultFullLoadPlugin(**full_load_init_params)
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                chunks = full_load_plugin_object._plan_chunks(cursor)
+                cursor.execute('DROP TABLE employee_partitioned_mixed;')
+                cursor.execute('DROP SERVER siirto_test_server;')
+                cursor.execute('DROP FOREIGN DATA WRAPPER siirto_test_fdw;')
+        self.assertEqual([(chunk["relation"], chunk["foreign"]) for chunk in chunks],
+                         [('public."Employee_Partition_1"', False),
+                          ("public.employee_partition_2", True)])
+
+    def test_postgres_default_full_load_plugin_run_test_resume(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM employee;')
+                cursor.execute("INSERT INTO employee SELECT i, 'User' || i "
+                               "FROM generate_series(1, 4) i")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "chunk_count": 2
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        manifest_path = os.path.join(self.output_folder, "_manifest.json")
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual(manifest["completed_chunks"]["0"]["row_count"], 2)
+        self.assertEqual(manifest["completed_chunks"]["1"]["part_files"],
+                         ["x0001_00_public.employee.csv"])
+
+        # crash after the first chunk, second chunk is partially written
+        os.remove(os.path.join(self.output_folder, "_success"))
+        del manifest["completed_chunks"]["1"]
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        with open(os.path.join(self.output_folder, "x0000_00_public.employee.csv"), 'w') as f:
+            f.write("completed before\n")
+        with open(os.path.join(self.output_folder, "x0001_01_public.employee.csv"), 'w') as f:
+            f.write("partial\n")
+
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        self.assertEqual(self.read_part_files(),
+                         ["completed before\n", "3\tUser3\n", "4\tUser4\n"])
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "_success")))
+
+    def test_postgres_default_full_load_plugin_resume_with_other_parameters(self):
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "table_settings": {"public.employee": {"where": "id > 1"}}
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        os.remove(os.path.join(self.output_folder, "_success"))
+        full_load_init_params["table_settings"] = {"public.employee": {"where": "id > 2"}}
+        with self.assertRaises(ValueError) as cm:
+            PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        self.assertEqual(str(cm.exception),
+                         f"Incorrect value provided for where `id > 2`, the full load was "
+                         f"started with `id > 1`. Clear the output folder "
+                         f"{self.output_folder} to start the full load again")
+
+    def test_postgres_default_full_load_plugin_run_test_gzip(self):
+        self.insert_ref_data()
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "split_file_size_limit": 1,
+            "compression": "gzip"
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        full_load_output_path_1 = os.path.join(self.output_folder,
+                                               "x01_public.employee.csv.gz")
+        with gzip.open(full_load_output_path_1, 'rt') as full_load_file:
+            self.assertEqual(full_load_file.read(), "2\tUser2\n")
+
+    def test_postgres_default_full_load_plugin_run_test_binary(self):
+        self.insert_ref_data()
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "split_file_size_limit": 1,
+            "copy_format": "binary"
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        full_load_output_path_0 = os.path.join(self.output_folder,
+                                               "x00_public.employee.bin")
+        full_load_output_path_1 = os.path.join(self.output_folder,
+                                               "x01_public.employee.bin")
+        self.assertEqual(list(read_binary_copy_file(full_load_output_path_0, ["int4", "varchar"])),
+                         [(1, "User1")])
+        self.assertEqual(list(read_binary_copy_file(full_load_output_path_1, ["int4", "varchar"])),
+                         [(2, "User2")])
+
+    def test_postgres_default_full_load_plugin_run_test_columns_and_where(self):
+        self.insert_ref_data()
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "table_settings": {
+                "public.employee": {
+                    "columns": ["name"],
+                    "where": "id > 1"
+                }
+            }
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        self.assertEqual(self.read_part_files(), ["User2\n"])
+
+    def test_postgres_default_full_load_plugin_run_test_incremental(self):
+        self.insert_ref_data()
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "incremental": True,
+            "table_settings": {
+                "public.employee": {
+                    "watermark_column": "id"
+                }
+            }
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("INSERT INTO employee VALUES (3, 'User3')")
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        run_contents = []
+        for run_folder in ["run_000001", "run_000002", "run_000003"]:
+            self.assertTrue(os.path.exists(os.path.join(self.output_folder, run_folder, "_success")))
+            with open(os.path.join(self.output_folder, run_folder,
+                                   "x00_public.employee.csv"), 'r') as full_load_file:
+                run_contents.append(full_load_file.read())
+        self.assertEqual(run_contents, ["1\tUser1\n2\tUser2\n", "3\tUser3\n", ""])
+        with open(os.path.join(self.output_folder, "_watermark.json"), 'r') as watermark_file:
+            self.assertEqual(json.load(watermark_file), {"watermark": "3", "run": 3})
+
+    def test_postgres_default_full_load_plugin_incremental_without_watermark_column(self):
+        with self.assertRaises(ValueError) as cm:
+            PgDefaultFullLoadPlugin(output_folder_location=self.output_folder,
+                                    connection_string=self.postgres_connection_string,
+                                    table_name="public.employee",
+                                    incremental=True)
+        self.assertEqual(str(cm.exception),
+                         "watermark_column is not provided for table `public.employee`")
+
+    def test_postgres_default_full_load_plugin_run_test_reconcile(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM employee;')
+                cursor.execute("INSERT INTO employee SELECT i, 'User' || i "
+                               "FROM generate_series(1, 6) i")
+                cursor.execute("INSERT INTO employee VALUES (7, 'User \"7\", (x)'), "
+                               "(8, ''), (9, NULL), (10, E'back\\\\slash\\ttab')")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "parallel_workers": 3
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        part_files = [os.path.join(self.output_folder, f"x{index:04d}_00_public.employee.csv")
+                      for index in range(3)]
+        modification_times = [os.stat(part_file).st_mtime_ns for part_file in part_files]
+        full_load_init_params["reconcile"] = True
+        # part files match the source, nothing is exported again
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        self.assertEqual([os.stat(part_file).st_mtime_ns for part_file in part_files],
+                         modification_times)
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE employee SET name = 'User1 updated' WHERE id = 1")
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        self.assertEqual([os.stat(part_file).st_mtime_ns for part_file in part_files[1:]],
+                         modification_times[1:])
+        with open(part_files[0], 'r') as full_load_file:
+            self.assertIn("1\tUser1 updated\n", full_load_file.readlines())
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "_success")))
+
+    def test_postgres_default_full_load_plugin_run_test_parts_manifest(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM employee;')
+                cursor.execute("INSERT INTO employee SELECT i, 'User' || i "
+                               "FROM generate_series(1, 5) i")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "split_file_size_limit": 2,
+            "compression": "gzip"
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        with open(os.path.join(self.output_folder, "_manifest.json"), 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual(manifest["row_count"], 5)
+        self.assertEqual([(part["part_file"], part["row_count"]) for part in manifest["parts"]],
+                         [("x00_public.employee.csv.gz", 2),
+                          ("x01_public.employee.csv.gz", 2),
+                          ("x02_public.employee.csv.gz", 1)])
+        for part in manifest["parts"]:
+            part_file = os.path.join(self.output_folder, part["part_file"])
+            with open(part_file, 'rb') as stored_file:
+                stored_data = stored_file.read()
+            self.assertEqual(part["sha256"], hashlib.sha256(stored_data).hexdigest())
+            self.assertEqual(part["file_size"], len(stored_data))
+            self.assertEqual(part["byte_size"], len(gzip.decompress(stored_data)))
+
+    def test_postgres_default_full_load_plugin_run_test_server_side_copy(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM employee;')
+                cursor.execute("INSERT INTO employee SELECT i, 'User' || i "
+                               "FROM generate_series(1, 5) i")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "split_file_size_limit": 2,
+            "compression": "gzip",
+            "chunk_count": 2,
+            "server_side_copy": True,
+            # server and siirto see the output folder at the same path
+            "server_path_mapping": {self.output_folder: self.output_folder}
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        part_files = sorted(file_name for file_name in os.listdir(self.output_folder)
+                            if file_name.endswith(".csv.gz"))
+        self.assertEqual(part_files, ["x0000_00_public.employee.csv.gz",
+                                      "x0001_00_public.employee.csv.gz",
+                                      "x0001_01_public.employee.csv.gz"])
+        lines = []
+        for part_file in part_files:
+            with gzip.open(os.path.join(self.output_folder, part_file), 'rt') as full_load_file:
+                lines.extend(full_load_file.readlines())
+        self.assertEqual(lines, [f"{i}\tUser{i}\n" for i in range(1, 6)])
+        with open(os.path.join(self.output_folder, "_manifest.json"), 'r') as manifest_file:
+            self.assertEqual(json.load(manifest_file)["row_count"], 5)
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "_success")))
+
+    def test_postgres_default_full_load_plugin_server_side_copy_mode_before_11(self):
+        full_load_plugin_object = PgDefaultFullLoadPlugin(
+            output_folder_location=self.output_folder,
+            connection_string=self.postgres_connection_string,
+            table_name="public.employee",
+            server_side_copy=True)
+        queries = []
+
+        class StandInCursor:
+            connection = SimpleNamespace(server_version=100000)
+
+            def execute(self, query, parameters=None):
+                queries.append(query)
+
+            def fetchone(self):
+                return True, True
+
+        # roles of the server side COPY do not exist before postgres 11
+        self.assertEqual(full_load_plugin_object._get_server_side_copy_mode(StandInCursor()),
+                         "program")
+        self.assertNotIn("pg_has_role", queries[0])
+        self.assertIn("rolsuper", queries[0])
+
+    def test_postgres_default_full_load_plugin_server_path(self):
+        full_load_plugin_object = PgDefaultFullLoadPlugin(
+            output_folder_location=self.output_folder,
+            connection_string=self.postgres_connection_string,
+            table_name="public.employee",
+            server_side_copy=True,
+            server_path_mapping={"/mnt/share": "/shared", "/mnt/share/siirto": "/siirto"})
+        self.assertEqual(full_load_plugin_object._server_path("/mnt/share/a/b"), "/shared/a/b")
+        self.assertEqual(full_load_plugin_object._server_path("/mnt/share/siirto/a"), "/siirto/a")
+        with self.assertRaises(ValueError):
+            full_load_plugin_object._server_path("/mnt/other/a")
+
+    def test_postgres_default_full_load_plugin_run_test_parquet(self):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS typed_table;")
+                cursor.execute("CREATE TABLE typed_table (id INT PRIMARY KEY, name TEXT, "
+                               "price NUMERIC(10, 2), active BOOL, created TIMESTAMPTZ, "
+                               "day DATE, data BYTEA, score FLOAT8);")
+                cursor.execute("INSERT INTO typed_table SELECT i, 'User\t' || i, i * 1.5, "
+                               "i % 2 = 0, '2020-01-01 10:00:00+02'::timestamptz + i * interval '1 day', "
+                               "'2020-01-01'::date + i, '\\x0102'::bytea, i / 4.0 "
+                               "FROM generate_series(1, 5) i")
+                cursor.execute("INSERT INTO typed_table VALUES (6, NULL, NULL, NULL, NULL, "
+                               "NULL, NULL, NULL)")
+                # values out of the range of the arrow types
+                cursor.execute("INSERT INTO typed_table VALUES (7, 'User7', NULL, true, "
+                               "'infinity', '-infinity', NULL, 'NaN')")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.typed_table",
+            "notify_on_completion": None,
+            "split_file_size_limit": 4,
+            "output_format": "parquet",
+            "row_group_size": 3,
+            "compression": "zstd"
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        part_files = [os.path.join(self.output_folder, file_name)
+                      for file_name in ["x00_public.typed_table.parquet",
+                                        "x01_public.typed_table.parquet"]]
+        self.assertEqual([pyarrow.parquet.ParquetFile(part_file).num_row_groups
+                          for part_file in part_files], [2, 1])
+        table = pyarrow.concat_tables([pyarrow.parquet.read_table(part_file)
+                                       for part_file in part_files])
+        self.assertEqual(str(table.schema.field("price").type), "decimal128(10, 2)")
+        self.assertEqual(str(table.schema.field("created").type), "timestamp[us, tz=UTC]")
+        rows = table.to_pylist()
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]["name"], "User\t1")
+        self.assertEqual(str(rows[0]["price"]), "1.50")
+        self.assertEqual(rows[0]["active"], False)
+        self.assertEqual(rows[0]["created"].isoformat(), "2020-01-02T08:00:00+00:00")
+        self.assertEqual(rows[0]["day"].isoformat(), "2020-01-02")
+        self.assertEqual(rows[0]["data"], b"\x01\x02")
+        self.assertEqual(rows[0]["score"], 0.25)
+        self.assertEqual(rows[5], {"id": 6, "name": None, "price": None, "active": None,
+                                   "created": None, "day": None, "data": None, "score": None})
+        self.assertIsNone(rows[6]["price"])
+        self.assertEqual(rows[6]["created"].isoformat(), "9999-12-31T23:59:59.999999+00:00")
+        self.assertEqual(rows[6]["day"].isoformat(), "0001-01-01")
+        self.assertTrue(math.isnan(rows[6]["score"]))
+
+    def test_postgres_default_full_load_plugin_run_test_parquet_value_out_of_range(self):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS typed_table_nan;")
+                cursor.execute("CREATE TABLE typed_table_nan (id INT PRIMARY KEY, "
+                               "price NUMERIC(10, 2));")
+                cursor.execute("INSERT INTO typed_table_nan VALUES (1, 1.5), (2, 'NaN')")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.typed_table_nan",
+            "notify_on_completion": None,
+            "output_format": "parquet"
+        }
+        # NaN has no decimal value, it is not written as NULL
+        with self.assertRaises(ValueError) as cm:
+            PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        self.assertEqual(str(cm.exception), "Value `NaN` of column `price` "
+                                            "can not be converted to decimal128(10, 2)")
+
+    def test_postgres_default_full_load_plugin_run_test_parquet_generated_column(self):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS employee_generated;")
+                cursor.execute("CREATE TABLE employee_generated (id INT PRIMARY KEY, "
+                               "name TEXT, name_length INT GENERATED ALWAYS AS "
+                               "(length(name)) STORED);")
+                cursor.execute("INSERT INTO employee_generated (id, name) "
+                               "VALUES (1, 'User1'), (2, 'User22')")
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee_generated",
+            "notify_on_completion": None,
+            "output_format": "parquet"
+        }
+        # generated columns are left out by COPY, as by the SELECT of a where
+        for table_settings in [None, {"public.employee_generated": {"where": "id > 1"}}]:
+            shutil.rmtree(self.output_folder, ignore_errors=True)
+            os.mkdir(self.output_folder)
+            PgDefaultFullLoadPlugin(table_settings=table_settings,
+                                    **full_load_init_params).execute()
+            table = pyarrow.parquet.read_table(
+                os.path.join(self.output_folder, "x00_public.employee_generated.parquet"))
+            self.assertEqual(table.column_names, ["id", "name"])
+        self.assertEqual(table.to_pylist(), [{"id": 2, "name": "User22"}])
+        # configured columns are exported, generated columns too
+        shutil.rmtree(self.output_folder, ignore_errors=True)
+        os.mkdir(self.output_folder)
+        table_settings = {"public.employee_generated": {"columns": ["id", "name_length"]}}
+        PgDefaultFullLoadPlugin(table_settings=table_settings, **full_load_init_params).execute()
+        table = pyarrow.parquet.read_table(
+            os.path.join(self.output_folder, "x00_public.employee_generated.parquet"))
+        self.assertEqual(table.to_pylist(), [{"id": 1, "name_length": 5},
+                                             {"id": 2, "name_length": 6}])
+        shutil.rmtree(self.output_folder, ignore_errors=True)
+        os.mkdir(self.output_folder)
+        table_settings = {"public.employee_generated": {"columns": ["id", "salary"]}}
+        with self.assertRaises(ValueError) as cm:
+            PgDefaultFullLoadPlugin(table_settings=table_settings,
+                                    **full_load_init_params).execute()
+        self.assertEqual(str(cm.exception),
+                         "Incorrect value provided for columns `['id', 'salary']`, "
+                         "column `salary` not found in public.employee_generated")
+
+    def test_postgres_default_full_load_plugin_run_test_arrow(self):
+        try:
+            import pyarrow.ipc
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        self.insert_ref_data()
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "notify_on_completion": None,
+            "output_format": "arrow",
+            "table_settings": {"public.employee": {"columns": ["name"]}}
+        }
+        PgDefaultFullLoadPlugin(**full_load_init_params).execute()
+        with pyarrow.ipc.open_file(os.path.join(self.output_folder,
+                                                "x00_public.employee.arrow")) as reader:
+            self.assertEqual(reader.read_all().to_pylist(), [{"name": "User1"}, {"name": "User2"}])
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+
+import psycopg2
+
+from siirto.plugins.full_load.full_load_base import FullLoadBase
+from siirto.plugins.full_load.pg_event_hub_full_load_plugin import PgFullLoadPluginToEventHub
+from siirto.shared.enums import PlugInType
+from tests.test_base.base_test import BaseTest
+
+
+class StandInEventHubSender:
+    """ stand-in for the event hub sender, keeps the sent batches """
+
+    def __init__(self, sent_batches, fail_after_batches=None):
+        self.sent_batches = sent_batches
+        self.fail_after_batches = fail_after_batches
+        self.lock = threading.Lock()
+
+    def send(self, events):
+        with self.lock:
+            if self.fail_after_batches is not None \
+                    and len(self.sent_batches) >= self.fail_after_batches:
+                raise ConnectionError("event hub is not reachable")
+            self.sent_batches.append(events)
+
+    def close(self):
+        pass
+
+
+class TestPgFullLoadPluginToEventHub(BaseTest):
+
+    def test_pg_full_load_plugin_to_event_hub_plugin_type_and_name(self):
+        self.assertEqual(PgFullLoadPluginToEventHub.plugin_type, PlugInType.Full_Load)
+        self.assertEqual(FullLoadBase.get_object("PgFullLoadPluginToEventHub"),
+                         PgFullLoadPluginToEventHub)
+
+    def test_pg_full_load_plugin_to_event_hub_configuration(self):
+        with self.assertRaises(ValueError) as cm:
+            PgFullLoadPluginToEventHub(output_folder_location=self.output_folder,
+                                       connection_string=self.postgres_connection_string,
+                                       table_name="public.employee")
+        self.assertEqual(str(cm.exception), "Check event hub configuration")
+        with self.assertRaises(ValueError) as cm:
+            PgFullLoadPluginToEventHub(output_folder_location=self.output_folder,
+                                       connection_string=self.postgres_connection_string,
+                                       table_name="public.employee",
+                                       event_hub_partition=" ",
+                                       event_hub_sender_factory=lambda: None)
+        self.assertEqual(str(cm.exception), "Incorrect value provided for event_hub_partition ` `")
+
+    def insert_ref_data(self, row_count):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM employee;')
+                cursor.execute("INSERT INTO employee SELECT i, 'User' || i "
+                               "FROM generate_series(1, %s) i", (row_count,))
+
+    def test_pg_full_load_plugin_to_event_hub_run_test(self):
+        self.insert_ref_data(100)
+        sent_batches = []
+        full_load_plugin_object = PgFullLoadPluginToEventHub(
+            output_folder_location=self.output_folder,
+            connection_string=self.postgres_connection_string,
+            table_name="public.employee",
+            event_hub_batch_size_bytes=1000,
+            event_hub_concurrency=3,
+            event_hub_sender_factory=lambda: StandInEventHubSender(sent_batches))
+        full_load_plugin_object.execute()
+        self.assertGreater(len(sent_batches), 1)
+        for batch in sent_batches:
+            self.assertLessEqual(sum(len(event) + 1 for event in batch), 1000)
+        events = [json.loads(event) for batch in sent_batches for event in batch]
+        self.assertEqual(sorted(event["columnvalues"][0] for event in events),
+                         list(range(1, 101)))
+        self.assertEqual(events[0]["kind"], "insert")
+        self.assertEqual(events[0]["schema"], "public")
+        self.assertEqual(events[0]["table"], "employee")
+        self.assertEqual(events[0]["columnnames"], ["id", "name"])
+        self.assertEqual(events[0]["columntypes"], ["integer", "character varying(50)"])
+        with open(os.path.join(self.output_folder, "_checkpoint.json"), 'r') as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file), {"last_key": ["100"], "row_count": 100})
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "_success")))
+
+    def test_pg_full_load_plugin_to_event_hub_resume(self):
+        self.insert_ref_data(100)
+        sent_batches = []
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee",
+            "event_hub_batch_size_bytes": 1000,
+            "event_hub_concurrency": 1,
+            "event_hub_sender_factory":
+                lambda: StandInEventHubSender(sent_batches, fail_after_batches=3)
+        }
+        with self.assertRaises(ConnectionError):
+            PgFullLoadPluginToEventHub(**full_load_init_params).execute()
+        self.assertEqual(len(sent_batches), 3)
+        self.assertFalse(os.path.exists(os.path.join(self.output_folder, "_success")))
+        full_load_init_params["event_hub_sender_factory"] = \
+            lambda: StandInEventHubSender(sent_batches)
+        PgFullLoadPluginToEventHub(**full_load_init_params).execute()
+        events = [json.loads(event) for batch in sent_batches for event in batch]
+        # every row is sent once
+        self.assertEqual([event["columnvalues"][0] for event in events], list(range(1, 101)))
+        self.assertTrue(os.path.exists(os.path.join(self.output_folder, "_success")))
+
+    def test_pg_full_load_plugin_to_event_hub_resume_non_integer_key(self):
+        with psycopg2.connect(self.postgres_connection_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS employee_document;')
+                cursor.execute('CREATE TABLE employee_document (hash BYTEA, '
+                               'created TIMESTAMP, name VARCHAR(50), PRIMARY KEY (hash, created));')
+                cursor.execute("INSERT INTO employee_document "
+                               "SELECT decode(lpad(to_hex(i % 10), 2, '0'), 'hex'), "
+                               "timestamp '2020-01-01' + i * interval '1 day', 'Doc' || i "
+                               "FROM generate_series(1, 100) i")
+        sent_batches = []
+        full_load_init_params = {
+            "output_folder_location": self.output_folder,
+            "connection_string": self.postgres_connection_string,
+            "table_name": "public.employee_document",
+            "event_hub_batch_size_bytes": 1000,
+            "event_hub_concurrency": 1,
+            "event_hub_sender_factory":
+                lambda: StandInEventHubSender(sent_batches, fail_after_batches=3)
+        }
+        with self.assertRaises(ConnectionError):
+            PgFullLoadPluginToEventHub(**full_load_init_params).execute()
+        with open(os.path.join(self.output_folder, "_checkpoint.json"), 'r') as checkpoint_file:
+            last_key = json.load(checkpoint_file)["last_key"]
+        # key is checkpointed as the text of the key columns
+        self.assertEqual(last_key[0][:2], "\\x")
+        full_load_init_params["event_hub_sender_factory"] = \
+            lambda: StandInEventHubSender(sent_batches)
+        PgFullLoadPluginToEventHub(**full_load_init_params).execute()
+        events = [json.loads(event) for batch in sent_batches for event in batch]
+        self.assertEqual(events[0]["columntypes"],
+                         ["bytea", "timestamp without time zone", "character varying(50)"])
+        # every row is sent once
+        self.assertEqual(sorted(event["columnvalues"][2] for event in events),
+                         sorted(f"Doc{i}" for i in range(1, 101)))
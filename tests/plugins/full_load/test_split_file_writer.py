@@ -0,0 +1,71 @@
+import os
+import struct
+
+from siirto.plugins.full_load.split_file_writer import BinarySplitFileWriter, SplitFileWriter
+from siirto.shared.pg_binary_copy import BINARY_COPY_SIGNATURE, read_binary_copy_file
+from tests.test_base.base_test import BaseTest
+
+
+class TestSplitFileWriter(BaseTest):
+
+    def test_split_file_writer_part_suffix(self):
+        self.assertEqual(SplitFileWriter.part_suffix(0), "00")
+        self.assertEqual(SplitFileWriter.part_suffix(89), "89")
+        self.assertEqual(SplitFileWriter.part_suffix(90), "9000")
+        self.assertEqual(SplitFileWriter.part_suffix(989), "9899")
+        self.assertEqual(SplitFileWriter.part_suffix(990), "990000")
+
+    def test_split_file_writer_unaligned_writes(self):
+        with SplitFileWriter(self.output_folder, "public.employee", 2) as writer:
+            writer.write(b"1\tUser1\n2\tUs")
+            writer.write(b"er2\n3\tUser3\n4\tUser4\n5")
+            writer.write(b"\tUser5\n")
+        self.assertEqual(writer.row_count, 5)
+        self.assertEqual([os.path.basename(part_file) for part_file in writer.part_files],
+                         ["x00_public.employee.csv",
+                          "x01_public.employee.csv",
+                          "x02_public.employee.csv"])
+        contents = []
+        for part_file in writer.part_files:
+            with open(part_file, "r") as output_file:
+                contents.append(output_file.read())
+        self.assertEqual(contents, ["1\tUser1\n2\tUser2\n",
+                                    "3\tUser3\n4\tUser4\n",
+                                    "5\tUser5\n"])
+
+    def test_split_file_writer_empty_stream(self):
+        with SplitFileWriter(self.output_folder, "public.employee", 2) as writer:
+            pass
+        self.assertEqual(writer.row_count, 0)
+        self.assertEqual(len(writer.part_files), 1)
+        self.assertEqual(os.stat(writer.part_files[0]).st_size, 0)
+
+    def test_binary_split_file_writer_unaligned_writes(self):
+        header = BINARY_COPY_SIGNATURE + struct.pack("!ii", 0, 0)
+        tuples = [struct.pack("!hi", 2, 4) + struct.pack("!i", index)
+                  + struct.pack("!i", -1) for index in range(3)]
+        stream = header + b"".join(tuples) + struct.pack("!h", -1)
+        with BinarySplitFileWriter(self.output_folder, "public.employee", 2) as writer:
+            for position in range(0, len(stream), 5):
+                writer.write(stream[position:position + 5])
+        self.assertEqual(writer.row_count, 3)
+        self.assertEqual([os.path.basename(part_file) for part_file in writer.part_files],
+                         ["x00_public.employee.bin",
+                          "x01_public.employee.bin"])
+        self.assertEqual(list(read_binary_copy_file(writer.part_files[0], ["int4", "int4"])),
+                         [(0, None), (1, None)])
+        self.assertEqual(list(read_binary_copy_file(writer.part_files[1], ["int4", "int4"])),
+                         [(2, None)])
+
+    def test_split_file_writer_split_file_size_bytes(self):
+        with SplitFileWriter(self.output_folder, "public.employee", 100,
+                             split_file_size_bytes=10) as writer:
+            writer.write(b"1\tUser1\n2\tUser2\n3\tUser3\n")
+            writer.write(b"4\tUser4\n")
+        contents = []
+        for part_file in writer.part_files:
+            with open(part_file, "r") as output_file:
+                contents.append(output_file.read())
+        self.assertEqual(contents, ["1\tUser1\n2\tUser2\n",
+                                    "3\tUser3\n4\tUser4\n"])
+        self.assertEqual(writer.row_count, 4)
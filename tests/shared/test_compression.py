@@ -0,0 +1,24 @@
+import os
+
+from siirto.shared.compression import compression_of_file, open_file, validate_compression
+from tests.test_base.base_test import BaseTest
+
+
+class TestCompression(BaseTest):
+
+    def test_compression_gzip_round_trip(self):
+        file_name = os.path.join(self.output_folder, "x00_public.employee.csv.gz")
+        with open_file(file_name, "wb", "gzip", 1) as output_file:
+            output_file.write(b"1\tUser1\n")
+        self.assertEqual(compression_of_file(file_name), "gzip")
+        with open_file(file_name, "rb", compression_of_file(file_name)) as input_file:
+            self.assertEqual(input_file.read(), b"1\tUser1\n")
+
+    def test_compression_no_compression(self):
+        self.assertEqual(compression_of_file("x00_public.employee.csv"), None)
+        validate_compression(None)
+
+    def test_compression_incorrect_value(self):
+        with self.assertRaises(ValueError) as cm:
+            validate_compression("rar")
+        self.assertEqual(str(cm.exception), "Incorrect value provided for compression `rar`")
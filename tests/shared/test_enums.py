@@ -11,10 +11,12 @@ class TestEnums(BaseTest):
         self.assertEqual(cdc, LoadType.CDC)
         full_load_and_cdc = LoadType(3)
         self.assertEqual(full_load_and_cdc, LoadType.Full_Load_And_CDC)
-        # there are only 3 valid load types
+        incremental = LoadType(4)
+        self.assertEqual(incremental, LoadType.Incremental)
+        # there are only 4 valid load types
         value_in_load_type = list(map(lambda item: item.value, LoadType))
         # check for number of items
-        self.assertEqual(len(value_in_load_type), 3)
+        self.assertEqual(len(value_in_load_type), 4)
         # check for duplicates
         self.assertEqual(len(value_in_load_type), len(set(value_in_load_type)))
 
@@ -0,0 +1,16 @@
+from siirto.shared.pg_text_copy import decode_copy_text_line, record_text
+from tests.test_base.base_test import BaseTest
+
+
+class TestPgTextCopy(BaseTest):
+
+    def test_decode_copy_text_line(self):
+        self.assertEqual(decode_copy_text_line("1\tUser1\n"), ["1", "User1"])
+        self.assertEqual(decode_copy_text_line("1\t\\N\t\n"), ["1", None, ""])
+        self.assertEqual(decode_copy_text_line("a\\tb\\nc\\\\d\n"), ["a\tb\nc\\d"])
+
+    def test_record_text(self):
+        self.assertEqual(record_text(["1", "User1"]), "(1,User1)")
+        self.assertEqual(record_text(["1", None, ""]), '(1,,"")')
+        self.assertEqual(record_text(['User "1", (x)', "a\\b c"]),
+                         '("User ""1"", (x)","a\\\\b c")')
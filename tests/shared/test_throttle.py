@@ -0,0 +1,46 @@
+import multiprocessing
+import time
+
+from siirto.plugins.full_load.split_file_writer import SplitFileWriter
+from siirto.shared.throttle import Throttle, TokenBucket
+from tests.test_base.base_test import BaseTest
+
+
+def _consume_tokens(token_bucket: TokenBucket) -> None:
+    token_bucket.consume(100)
+
+
+class TestThrottle(BaseTest):
+
+    def test_token_bucket_consume(self):
+        token_bucket = TokenBucket(100)
+        started_at = time.monotonic()
+        # burst of one second is available
+        token_bucket.consume(100)
+        self.assertLess(time.monotonic() - started_at, 0.2)
+        token_bucket.consume(50)
+        self.assertGreater(time.monotonic() - started_at, 0.4)
+
+    def test_token_bucket_shared_by_processes(self):
+        token_bucket = TokenBucket(100)
+        process = multiprocessing.Process(target=_consume_tokens, args=(token_bucket,))
+        process.start()
+        process.join()
+        started_at = time.monotonic()
+        token_bucket.consume(30)
+        self.assertGreater(time.monotonic() - started_at, 0.2)
+
+    def test_throttle_rate_factor(self):
+        throttle = Throttle(bytes_per_second=1000, rows_per_second=10)
+        throttle.rate_factor = 0.5
+        self.assertEqual(throttle.byte_bucket.rate, 500)
+        self.assertEqual(throttle.row_bucket.rate, 5)
+        self.assertEqual(Throttle(rows_per_second=10).byte_bucket, None)
+
+    def test_split_file_writer_throttle(self):
+        started_at = time.monotonic()
+        with SplitFileWriter(self.output_folder, "public.employee", 100,
+                             throttle=Throttle(rows_per_second=10)) as writer:
+            writer.write(b"".join(f"{i}\tUser{i}\n".encode() for i in range(15)))
+        self.assertEqual(writer.row_count, 15)
+        self.assertGreater(time.monotonic() - started_at, 0.4)